@@ -1,9 +1,19 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from itertools import chain
+import tempfile
+from compression import init_compression
 from database import StockDatabase
-import pandas as pd
+from image_fetcher import get_image_fetcher
+from image_store import stats as image_store_stats
+from image_sync import init_image_sync
+from image_variants import image_srcset, thumbnail_url
+from import_jobs import ImportJobManager
+from pagination import parse_page_size
+from product_export import iter_csv, iter_export_rows, write_xlsx
+from static_cache import init_static_cache
 from io import BytesIO
 from dropbox_oauth_backup import DropboxOAuthBackup
 app = Flask(__name__)
@@ -17,6 +27,16 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# روابط النسخ المصغرة للصور في الـ templates (srcset)
+app.add_template_filter(image_srcset)
+app.add_template_filter(thumbnail_url)
+
+# صور المخزن وروابط static بـ ?v= تُرسل بـ Cache-Control immutable
+init_static_cache(app)
+
+# ضغط HTML/JSON حسب Accept-Encoding (gzip / brotli)
+init_compression(app)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -26,8 +46,8 @@ print("🔄 Initializing database...")
 db = StockDatabase()
 print("✅ Database initialized!")
 
-# إضافة البيانات الافتراضية فقط في البيئة المحلية
-if not os.getenv('DATABASE_URL'):
+# إضافة البيانات الافتراضية فقط في البيئة المحلية وعند إنشاء/تحديث الـ schema
+if not os.getenv('DATABASE_URL') and db.schema_changed:
     db.add_default_data()
     print("✅ Default data added!")
 
@@ -36,7 +56,23 @@ import threading
 import time
 
 # إنشاء نظام النسخ الاحتياطية
-backup_system = DropboxOAuthBackup()
+backup_system = DropboxOAuthBackup(db)
+
+# الصور غير الموجودة محلياً (instance جديد بعد restore) تُحمل من Dropbox عند أول طلب
+# (الـ Dropbox client يُنشأ عند أول حاجة له وليس مع بدء التطبيق)
+init_image_sync(app, lambda: backup_system.images)
+
+def backup_after_import(job_id, result):
+    """نسخة احتياطية فورية بعد انتهاء مهمة Bulk Upload"""
+    print(f"🔄 إنشاء نسخة احتياطية فورية بعد مهمة الاستيراد {job_id}...")
+    if backup_system.create_backup():
+        print("✅ تم إنشاء النسخة الاحتياطية بنجاح")
+    else:
+        print("⚠️ فشل في إنشاء النسخة الاحتياطية")
+
+# مهام استيراد Excel في الخلفية
+import_jobs = ImportJobManager(db, workers=int(os.getenv('IMPORT_JOB_WORKERS', '2')),
+                               on_complete=backup_after_import)
 
 # متغير للتأكد من تشغيل الكود مرة واحدة فقط
 startup_completed = False
@@ -69,6 +105,12 @@ def restore_on_startup():
             print(f"خطأ في عملية البدء: {e}")
             db.add_default_data()
         
+        # استكمال مهام الاستيراد التي توقفت مع الـ process السابق
+        try:
+            import_jobs.resume_pending()
+        except Exception as e:
+            print(f"⚠️ فشل استكمال مهام الاستيراد: {e}")
+
         startup_completed = True
         print("✅ تم الانتهاء من عملية البدء")
 
@@ -118,9 +160,13 @@ def backup_status():
     backups = backup_system.list_backups()
     status = {
         'service': 'Dropbox',
-        'connected': backup_system.dbx is not None,
+        'connected': backup_system.connected,
         'backup_count': len(backups),
-        'latest_backup': backups[0]['name'] if backups else 'لا توجد نسخ'
+        'latest_backup': backups[0]['name'] if backups else 'لا توجد نسخ',
+        'latest_deltas': backups[0]['deltas'] if backups else 0,
+        'pending_changes': backup_system.pending_change_count(),
+        'api': backup_system.api_stats(),
+        'images': backup_system.images.stats() if backup_system.images is not None else None
     }
     return jsonify(status)
 
@@ -138,25 +184,7 @@ def restore_backup(backup_name):
 @app.route('/')
 def dashboard():
     """الصفحة الرئيسية - Dashboard"""
-    brands = db.get_all_brands()
-    colors = db.get_all_colors()
-    product_types = db.get_all_product_types()
-    trader_categories = db.get_all_trader_categories()
-    tags = db.get_all_tags()
-    products = db.get_all_products_with_details()
-    
-    stats = {
-        'total_products': len(products),
-        'total_stock_value': sum([float(p[6] or 0) * int(p[10] or 0) for p in products]),
-        'low_stock_items': len([p for p in products if p[10] and int(p[10]) < 5]),
-        'suppliers': 1,
-        'brands_count': len(brands),
-        'colors_count': len(colors),
-        'types_count': len(product_types),
-        'categories_count': len(trader_categories),
-        'tags_count': len(tags)
-    }
-    
+    stats = db.get_dashboard_stats()
     return render_template('dashboard.html', stats=stats)
 
 # صفحات إدارة البراندات
@@ -401,29 +429,25 @@ def add_product_new():
                         file = request.files[file_key]
                         if file and file.filename != '' and allowed_file(file.filename):
                             
-                            # جلب اسم اللون
-                            color_name = db.get_color_name_by_id(color_id)
+                            # حفظ الصورة بالنظام المنظم الجديد
+                            image_path = db.save_manual_image(file)
                             
-                            if color_name:
-                                # حفظ الصورة بالنظام المنظم الجديد
-                                image_path = db.save_manual_image(file, product_code, color_name)
+                            if image_path:
+                                # جلب variant_id
+                                conn = db.get_connection()
+                                cursor = conn.cursor()
+                                cursor.execute('''
+                                    SELECT id FROM product_variants 
+                                    WHERE base_product_id = ? AND color_id = ?
+                                ''', (base_product_id, color_id))
+                                variant_result = cursor.fetchone()
+                                conn.close()
                                 
-                                if image_path:
-                                    # جلب variant_id
-                                    conn = db.get_connection()
-                                    cursor = conn.cursor()
-                                    cursor.execute('''
-                                        SELECT id FROM product_variants 
-                                        WHERE base_product_id = ? AND color_id = ?
-                                    ''', (base_product_id, color_id))
-                                    variant_result = cursor.fetchone()
-                                    conn.close()
-                                    
-                                    if variant_result:
-                                        variant_id = variant_result[0]
-                                        filename = os.path.basename(image_path)
-                                        if db.add_color_image(variant_id, image_path, filename):
-                                            uploaded_images += 1
+                                if variant_result:
+                                    variant_id = variant_result[0]
+                                    filename = os.path.basename(image_path)
+                                    if db.add_color_image(variant_id, image_path, filename):
+                                        uploaded_images += 1
                 
                 flash(f'Product "{product_code}" added successfully with {len(color_ids)} colors, {len(tag_ids)} tags and {uploaded_images} images!', 'success')
                 return redirect(url_for('products_new'))
@@ -534,14 +558,19 @@ def add_products_multi():
 def products_new():
     """صفحة عرض المنتجات المحسنة مع المقاس والـ Tags والصور"""
     search_term = request.args.get('search', '')
-    products = db.get_products_with_color_images(search_term)
-    return render_template('products_new.html', products=products, search_term=search_term)
+    page = db.get_products_page(search_term,
+                                cursor=request.args.get('cursor'),
+                                page_size=parse_page_size(request.args.get('limit')))
+    return render_template('products_new.html', products=page['items'], page=page, search_term=search_term)
 
 @app.route('/search_products')
 def search_products():
     """البحث في المنتجات - AJAX مع المقاس والـ Tags"""
     search_term = request.args.get('q', '')
-    products = db.get_products_with_color_images(search_term)
+    page = db.get_products_page(search_term,
+                                cursor=request.args.get('cursor'),
+                                page_size=parse_page_size(request.args.get('limit')))
+    products = page['items']
     
     results = []
     for product in products:
@@ -570,7 +599,11 @@ def search_products():
             'created': product[9][:10] if product[9] else 'N/A'
         })
     
-    return jsonify({'products': results})
+    return jsonify({
+        'products': results,
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor']
+    })
 
 @app.route('/product_details/<int:product_id>')
 def product_details(product_id):
@@ -603,13 +636,16 @@ def inventory_management():
     brand_filter = request.args.get('brand', '')
     category_filter = request.args.get('category', '')
     
-    inventory_data = db.get_all_products_for_inventory(search_term, brand_filter, category_filter)
+    page = db.get_inventory_page(search_term, brand_filter, category_filter,
+                                 cursor=request.args.get('cursor'),
+                                 page_size=parse_page_size(request.args.get('limit')))
     summary = db.get_inventory_summary()
     brands = db.get_brands_for_filter()
     categories = db.get_categories_for_filter()
     
     return render_template('inventory_management.html', 
-                         inventory_data=inventory_data,
+                         inventory_data=page['items'],
+                         page=page,
                          summary=summary,
                          brands=brands,
                          categories=categories,
@@ -658,7 +694,10 @@ def inventory_search():
     brand_filter = request.args.get('brand', '')
     category_filter = request.args.get('category', '')
     
-    inventory_data = db.get_all_products_for_inventory(search_term, brand_filter, category_filter)
+    page = db.get_inventory_page(search_term, brand_filter, category_filter,
+                                 cursor=request.args.get('cursor'),
+                                 page_size=parse_page_size(request.args.get('limit')))
+    inventory_data = page['items']
     
     results = []
     for item in inventory_data:
@@ -685,13 +724,21 @@ def inventory_search():
             ]
         })
     
-    return jsonify({'inventory_data': results})
+    return jsonify({
+        'inventory_data': results,
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor']
+    })
 
 # صفحات Excel Bulk Upload مع النظام المحدث
 @app.route('/bulk_upload_excel', methods=['GET', 'POST'])
 def bulk_upload_excel():
     """رفع منتجات من Excel مع تحسين الأداء ومعالجة Timeout"""
     if request.method == 'POST':
+        # pandas/openpyxl تُحمل مع أول رفع وليس مع بدء التطبيق
+        import pandas as pd
+        from excel_import import read_header
+        
         try:
             # التحقق من وجود الملف
             if 'excel_file' not in request.files:
@@ -704,79 +751,28 @@ def bulk_upload_excel():
                 return redirect(url_for('bulk_upload_excel'))
             
             # التحقق من نوع الملف
-            if not file.filename.lower().endswith(('.xlsx', '.xls')):
-                flash('يرجى رفع ملف Excel صحيح (.xlsx أو .xls)!', 'error')
+            if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
+                flash('يرجى رفع ملف Excel صحيح (.xlsx أو .xls أو .csv)!', 'error')
                 return redirect(url_for('bulk_upload_excel'))
 
             print(f"🔄 بدء معالجة الملف: {file.filename}")
             
-            # قراءة الملف مع تحديد نوع البيانات كـ string لتجنب مشاكل float
-            df = pd.read_excel(file, dtype=str)
-            print(f"📊 تم قراءة {len(df)} صف من الملف")
+            # قراءة صف العناوين فقط للتحقق - باقي الملف يُقرأ في مهمة الخلفية
+            header = read_header(file)
+            file.seek(0)
             
             # التحقق من وجود الأعمدة المطلوبة
             required_columns = ['Product Code', 'Brand Name', 'Product Type', 'Category',
                               'Wholesale Price', 'Retail Price', 'Color Name', 'Stock']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            missing_columns = [col for col in required_columns if col not in header]
             if missing_columns:
                 flash(f'أعمدة مفقودة في الملف: {", ".join(missing_columns)}', 'error')
                 return redirect(url_for('bulk_upload_excel'))
 
-            # تحديد حد أقصى للصفوف لتجنب timeout
-            MAX_ROWS = 2000
-            if len(df) > MAX_ROWS:
-                flash(f'الملف كبير جداً! الحد الأقصى {MAX_ROWS} صف. ملفك يحتوي على {len(df)} صف.', 'warning')
-                df = df.head(MAX_ROWS)
-                flash(f'سيتم معالجة أول {MAX_ROWS} صف فقط.', 'info')
-
-            # تحويل البيانات لقاموس
-            excel_data = df.to_dict('records')
-            print(f"📦 بدء معالجة {len(excel_data)} منتج...")
-
-            # معالجة البيانات
-            result = db.bulk_add_products_from_excel_enhanced(excel_data)
-
-            if result['success']:
-                # إنشاء نسخة احتياطية فورية بعد النجاح
-                print("🔄 إنشاء نسخة احتياطية فورية بعد Bulk Upload...")
-                import time
-                time.sleep(2)  # تأخير قصير لضمان اكتمال العمليات
-                backup_success = backup_system.create_backup()
-                
-                if backup_success:
-                    print("✅ تم إنشاء النسخة الاحتياطية بنجاح")
-                else:
-                    print("⚠️ فشل في إنشاء النسخة الاحتياطية")
-                
-                # رسائل النجاح
-                success_msg = f'تم معالجة {result["success_count"]} صف بنجاح من أصل {len(excel_data)}!'
-                flash(success_msg, 'success')
-                
-                # معلومات البيانات الجديدة
-                if result['created_brands']:
-                    flash(f'تم إنشاء براندات جديدة: {", ".join(result["created_brands"])}', 'info')
-                if result['created_colors']:
-                    flash(f'تم إنشاء ألوان جديدة: {", ".join(result["created_colors"])}', 'info')
-                if result['created_types']:
-                    flash(f'تم إنشاء أنواع منتجات جديدة: {", ".join(result["created_types"])}', 'info')
-
-                # تحذيرات في حالة فشل بعض الصفوف
-                if result['failed_count'] > 0:
-                    flash(f'{result["failed_count"]} صف فشل في المعالجة. راجع التفاصيل أدناه.', 'warning')
-                    
-                    # عرض أول 5 أخطاء فقط لتجنب ازدحام الرسائل
-                    for failed in result['failed_products'][:5]:
-                        flash(f'الصف {failed["row"]}: {failed["error"]}', 'error')
-                    
-                    if len(result['failed_products']) > 5:
-                        flash(f'و {len(result["failed_products"]) - 5} أخطاء أخرى...', 'warning')
-
-                return redirect(url_for('products_new'))
-            
-            else:
-                error_msg = result.get('error', 'خطأ غير معروف')
-                flash(f'فشل في معالجة الملف: {error_msg}', 'error')
-                print(f"❌ فشل في معالجة الملف: {error_msg}")
+            # الاستيراد في الخلفية - الصفحة تتابع التقدم من /jobs/<id>
+            job_id = import_jobs.create_job(file, file.filename)
+            flash('تم رفع الملف وبدأ الاستيراد في الخلفية.', 'success')
+            return redirect(url_for('bulk_upload_excel', job=job_id))
 
         except pd.errors.EmptyDataError:
             flash('الملف فارغ أو لا يحتوي على بيانات صالحة!', 'error')
@@ -790,105 +786,66 @@ def bulk_upload_excel():
             print(f"❌ خطأ عام في bulk upload: {error_msg}")
 
     # عرض الصفحة
-    return render_template('bulk_upload_excel.html')
+    return render_template('bulk_upload_excel.html', job_id=request.args.get('job'))
+
+@app.route('/jobs/<job_id>')
+def import_job_status(job_id):
+    """حالة مهمة استيراد: الصفوف المعالجة، الأخطاء، والوقت المتبقي"""
+    status = import_jobs.job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
 
 @app.route('/export_products', methods=['GET', 'POST'])
 def export_products():
     """صفحة تصدير المنتجات مع فلاتر متعددة"""
     if request.method == 'POST':
         try:
-            # جلب الفلاتر من الـ form
-            selected_brands = request.form.getlist('brands')
-            selected_categories = request.form.getlist('categories')
-            selected_types = request.form.getlist('product_types')
-            selected_colors = request.form.getlist('colors')
-            selected_products = request.form.getlist('product_codes')
-            stock_filter = request.form.get('stock_filter', 'all')
+            # جلب الفلاتر من الـ form - تتحول لاستعلام SQL واحد
+            filters = {
+                'brands': request.form.getlist('brands'),
+                'categories': request.form.getlist('categories'),
+                'product_types': request.form.getlist('product_types'),
+                'colors': request.form.getlist('colors'),
+                'product_codes': request.form.getlist('product_codes'),
+                'stock_filter': request.form.get('stock_filter', 'all')
+            }
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             
-            # جلب كل المنتجات
-            all_products = db.get_products_with_color_images('')
+            if request.form.get('export_format') == 'csv':
+                # CSV: response مقسم يُكتب أثناء القراءة من قاعدة البيانات
+                rows = iter_export_rows(db, filters)
+                first_row = next(rows, None)
+                if first_row is None:
+                    flash('No products match the selected filters!', 'warning')
+                    return redirect(url_for('export_products'))
+                return Response(
+                    stream_with_context(iter_csv(chain([first_row], rows))),
+                    mimetype='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename=products_export_{timestamp}.csv'}
+                )
             
-            # تطبيق الفلاتر
-            filtered_data = []
+            # Excel: write_only في ملف مؤقت بدون اسم - يُحذف تلقائياً عند إغلاقه بعد الإرسال
+            export_file = tempfile.TemporaryFile(suffix='.xlsx')
+            try:
+                exported_count = write_xlsx(iter_export_rows(db, filters), export_file)
+            except Exception:
+                export_file.close()
+                raise
             
-            for product in all_products:
-                product_id = product[0]
-                product_code = product[1]
-                brand_name = product[2]
-                product_type = product[3]
-                category = product[4]
-                size = product[5]
-                wholesale = product[6]
-                retail = product[7]
-                colors_data = product[10]  # قائمة الألوان مع التفاصيل
-                tags = product[12] if len(product) > 12 else []
-                
-                # تطبيق فلاتر Brand, Category, Type, Product Code
-                if selected_brands and brand_name not in selected_brands:
-                    continue
-                if selected_categories and category not in selected_categories:
-                    continue
-                if selected_types and product_type not in selected_types:
-                    continue
-                if selected_products and product_code not in selected_products:
-                    continue
-                
-                # معالجة كل لون كصف منفصل
-                for color_info in colors_data:
-                    color_name = color_info['name']
-                    color_stock = color_info['stock']
-                    image_url = color_info['image_url'] or ''
-                    
-                    # تطبيق فلتر اللون
-                    if selected_colors and color_name not in selected_colors:
-                        continue
-                    
-                    # تطبيق فلتر المخزون
-                    if stock_filter == 'in_stock' and color_stock <= 0:
-                        continue
-                    elif stock_filter == 'out_of_stock' and color_stock > 0:
-                        continue
-                    elif stock_filter == 'low_stock' and (color_stock > 5 or color_stock <= 0):
-                        continue
-                    
-                    # تجهيز Tags كنص (مفصول بفواصل)
-                    tags_text = ','.join([tag[1] for tag in tags]) if tags else ''
-                    
-                    # إضافة الصف
-                    filtered_data.append({
-                        'Product Code': product_code,
-                        'Brand Name': brand_name,
-                        'Product Type': product_type,
-                        'Category': category,
-                        'Size': size or '',
-                        'Wholesale Price': wholesale,
-                        'Retail Price': retail,
-                        'Color Name': color_name,
-                        'Stock': color_stock,
-                        'Image URL': image_url,
-                        'Tags': tags_text
-                    })
-            
-            if not filtered_data:
+            if not exported_count:
+                export_file.close()
                 flash('No products match the selected filters!', 'warning')
                 return redirect(url_for('export_products'))
             
-            # إنشاء Excel
-            df = pd.DataFrame(filtered_data)
-            output = BytesIO()
-            df.to_excel(output, index=False, engine='openpyxl')
-            output.seek(0)
-            
-            # تحديد اسم الملف حسب الفلاتر
-            filename = f'products_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            
-            flash(f'Exported {len(filtered_data)} product variants successfully!', 'success')
+            flash(f'Exported {exported_count} product variants successfully!', 'success')
+            export_file.seek(0)
             
             return send_file(
-                output,
+                export_file,
                 mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                 as_attachment=True,
-                download_name=filename
+                download_name=f'products_export_{timestamp}.xlsx'
             )
             
         except Exception as e:
@@ -902,8 +859,7 @@ def export_products():
     colors = [c[1] for c in db.get_all_colors()]
     
     # جلب كل أكواد المنتجات
-    all_products = db.get_products_with_color_images('')
-    product_codes = sorted(list(set([p[1] for p in all_products])))
+    product_codes = db.get_all_product_codes()
     
     return render_template('export_products.html',
                          brands=brands,
@@ -938,6 +894,8 @@ def download_excel_template():
             'Tags': ['Sale,Medium', 'Sale,Medium', 'Sale,Medium', 'New Arrival,Small', 'New Arrival,Small', 'Summer,Large']
         }
         
+        import pandas as pd
+        
         df = pd.DataFrame(template_data)
         
         output = BytesIO()
@@ -988,18 +946,14 @@ def edit_product(product_id):
                     flash('Product with same code, brand, and category already exists!', 'error')
                     return redirect(url_for('edit_product', product_id=product_id))
             
-            # تحديث المنتج
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
+            # تحديث المنتج (عبر الكاتب الواحد)
+            db.run_write(lambda conn: conn.cursor().execute('''
                 UPDATE base_products 
                 SET product_code = ?, brand_id = ?, product_type_id = ?, 
                     trader_category = ?, product_size = ?, wholesale_price = ?, retail_price = ?
                 WHERE id = ?
             ''', (product_code, brand_id, product_type_id, trader_category, 
-                  product_size, wholesale_price, retail_price, product_id))
-            conn.commit()
-            conn.close()
+                  product_size, wholesale_price, retail_price, product_id)))
             
             flash('Product updated successfully!', 'success')
             return redirect(url_for('product_details', product_id=product_id))
@@ -1031,13 +985,7 @@ def update_stock(variant_id):
     """تحديث مخزون لون معين"""
     try:
         new_stock = int(request.form['new_stock'])
-        
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE product_variants SET current_stock = ? WHERE id = ?', 
-                      (new_stock, variant_id))
-        conn.commit()
-        conn.close()
+        db.update_variant_stock(variant_id, new_stock)
         
         flash('Stock updated successfully!', 'success')
         
@@ -1076,10 +1024,8 @@ def upload_color_image(variant_id):
             conn.close()
             
             if result:
-                product_code, color_name = result
-                
-                # حفظ الصورة بالنظام المنظم
-                image_path = db.save_manual_image(file, product_code, color_name)
+                # حفظ الصورة في مخزن الصور
+                image_path = db.save_manual_image(file)
                 
                 if image_path:
                     # تحديث رابط الصورة في قاعدة البيانات
@@ -1111,8 +1057,22 @@ def internal_error(error):
 # إضافة health check endpoint
 @app.route('/health')
 def health_check():
+    # ثابت الزمن بدون قاعدة البيانات - الإحصائيات في /admin/diagnostics
     return {'status': 'healthy', 'timestamp': datetime.now().isoformat()}
 
+@app.route('/admin/diagnostics')
+def diagnostics():
+    """إحصائيات الـ pool والكاتب والـ caches والصور و Dropbox"""
+    return jsonify({
+        'timestamp': datetime.now().isoformat(),
+        'db_pool': db.get_pool_stats(),
+        'db_writer': db.get_writer_stats(),
+        'reference_cache': db.reference_cache.stats(),
+        'image_fetcher': get_image_fetcher().stats(),
+        'image_store': image_store_stats(db),
+        'dropbox': backup_system.api_stats()
+    })
+
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
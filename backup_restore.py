@@ -0,0 +1,319 @@
+"""استرجاع سريع للنسخ الاحتياطية (bulk restore)
+
+الاسترجاع القديم كان INSERT OR REPLACE لكل صف (الأعمدة وجملة SQL تُبنى من
+جديد لكل صف) و transaction لكل جدول أو دفعة، فاسترجاع نسخة كبيرة عند بدء
+التطبيق يعطل أول طلب لفترة طويلة. هنا:
+- النسخة الكاملة والـ deltas التابعة لها في transaction كتابة واحد
+- جملة INSERT ... ON CONFLICT (id) DO UPDATE واحدة لكل جدول و executemany
+  على دفعات كبيرة (BULK_BATCH_SIZE)
+- الـ indexes العادية (غير UNIQUE) على جداول النسخ تُحذف قبل التحميل وتُنشأ
+  مرة واحدة في النهاية، وفحص الـ foreign keys مؤجل لنهاية الـ transaction
+- triggers فهرس البحث متوقفة أثناء التحميل (defer_search_index) ويُعاد بناء
+  الفهرس مرة واحدة في النهاية
+- PostgreSQL: COPY لجدول مؤقت ثم INSERT ... ON CONFLICT (id) DO UPDATE، مع
+  ضبط الـ sequences بعد إدخال ids صريحة
+- طباعة عدد الصفوف في الثانية
+
+الأعمدة غير الموجودة في الجدول الحالي (نسخة من schema أقدم) يتم تجاهلها.
+"""
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from backup_snapshot import SNAPSHOT_SUFFIX, gunzip_file, iter_snapshot
+from backup_stream import iter_backup
+from change_log import BACKUP_TABLES
+from search_index import defer_search_index, rebuild_sqlite_search_index, resume_search_index
+
+BULK_BATCH_SIZE = 5000
+
+
+# ---------------------------------------------------------------------------
+# قراءة ملفات النسخ كأحداث ('rows', table, columns, rows) / ('deletes', table, ids)
+# ---------------------------------------------------------------------------
+
+def json_backup_events(backup_data):
+    """أحداث نسخة بالصيغة القديمة (JSON واحد - full أو delta)"""
+    is_delta = backup_data.get('app_info', {}).get('backup_type') == 'delta'
+    for table_name in BACKUP_TABLES:
+        table_data = backup_data.get('tables', {}).get(table_name)
+        if is_delta:
+            if not table_data:
+                continue
+            if table_data.get('deletes'):
+                yield 'deletes', table_name, table_data['deletes']
+            rows = table_data.get('upserts') or []
+        elif isinstance(table_data, dict):
+            rows = list(table_data.values())
+        elif isinstance(table_data, list):
+            rows = table_data
+        else:
+            continue
+
+        # الصفوف بنفس الأعمدة في دفعة واحدة
+        groups = {}
+        for row in rows:
+            if isinstance(row, dict):
+                groups.setdefault(tuple(row.keys()), []).append(row)
+        for columns, group in groups.items():
+            for start in range(0, len(group), BULK_BATCH_SIZE):
+                batch = group[start:start + BULK_BATCH_SIZE]
+                yield 'rows', table_name, list(columns), [[row[column] for column in columns] for row in batch]
+
+
+@contextmanager
+def _temp_path(suffix):
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
+def backup_file_events(local_path, name):
+    """أحداث ملف نسخة محمل محلياً - الصيغة من اسم الملف الأصلي"""
+    if name.endswith('.json'):
+        with open(local_path, 'rb') as f:
+            backup_data = json.loads(f.read().decode('utf-8'))
+        yield from json_backup_events(backup_data)
+    elif name.endswith(SNAPSHOT_SUFFIX):
+        with _temp_path('.db') as snapshot_path:
+            gunzip_file(local_path, snapshot_path)
+            yield from iter_snapshot(snapshot_path, BACKUP_TABLES, batch_size=BULK_BATCH_SIZE)
+    else:
+        with open(local_path, 'rb') as f:
+            yield from iter_backup(f, batch_size=BULK_BATCH_SIZE)
+
+
+# ---------------------------------------------------------------------------
+# التحميل
+# ---------------------------------------------------------------------------
+
+class BulkLoader:
+    """تطبيق الأحداث على cursor داخل transaction مفتوح (بدون commit)"""
+
+    db_type = None
+
+    def __init__(self, cursor, defer_indexes=True, search_index=False):
+        self.cursor = cursor
+        self.defer_indexes = defer_indexes
+        self.search_index = search_index
+        self.counts = {}
+        self._table_columns = {}
+        self._statements = {}
+        self._deferred_indexes = []
+
+    def run(self, events):
+        self.begin()
+        for event in events:
+            if event[0] == 'rows':
+                _, table_name, columns, rows = event
+                self.rows(table_name, columns, rows)
+            elif event[0] == 'deletes':
+                _, table_name, ids = event
+                self.delete(table_name, ids)
+                self.counts[table_name] = self.counts.get(table_name, 0) + len(ids)
+        self.finish()
+        return self.counts
+
+    def begin(self):
+        if self.search_index:
+            defer_search_index(self.cursor)
+        if self.defer_indexes:
+            self._deferred_indexes = self.secondary_indexes()
+            for index_name, _ in self._deferred_indexes:
+                self.cursor.execute(f'DROP INDEX {index_name}')
+
+    def finish(self):
+        for _, index_sql in self._deferred_indexes:
+            self.cursor.execute(index_sql)
+        if self.search_index:
+            self.refresh_search_index()
+
+    def refresh_search_index(self):
+        raise NotImplementedError
+
+    def rows(self, table_name, columns, rows):
+        key = (table_name, tuple(columns))
+        if key not in self._statements:
+            existing = self._columns(table_name)
+            keep = [index for index, column in enumerate(columns) if column in existing]
+            kept_columns = [columns[index] for index in keep]
+            # None = كل الأعمدة موجودة (بدون نسخ الصفوف)
+            self._statements[key] = (self.prepare(table_name, kept_columns),
+                                     None if len(keep) == len(columns) else keep)
+        statement, keep = self._statements[key]
+        if keep is not None:
+            rows = [[row[index] for index in keep] for row in rows]
+        self.load(statement, rows)
+        self.counts[table_name] = self.counts.get(table_name, 0) + len(rows)
+
+    def _columns(self, table_name):
+        if table_name not in self._table_columns:
+            self._table_columns[table_name] = set(self.table_columns(table_name))
+        return self._table_columns[table_name]
+
+    def secondary_indexes(self):
+        """[(name, create_sql)] للـ indexes غير الـ UNIQUE على جداول النسخ"""
+        raise NotImplementedError
+
+    def table_columns(self, table_name):
+        raise NotImplementedError
+
+    def prepare(self, table_name, columns):
+        raise NotImplementedError
+
+    def load(self, statement, rows):
+        raise NotImplementedError
+
+    def delete(self, table_name, ids):
+        raise NotImplementedError
+
+
+class SQLiteBulkLoader(BulkLoader):
+    db_type = 'sqlite'
+
+    def begin(self):
+        # foreign_keys لا يتغير داخل transaction - التأجيل لنهايته فقط
+        self.cursor.execute('PRAGMA defer_foreign_keys = ON')
+        super().begin()
+
+    def refresh_search_index(self):
+        rebuild_sqlite_search_index(self.cursor)
+        resume_search_index(self.db_type, self.cursor, [])
+
+    def secondary_indexes(self):
+        self.cursor.execute(f'''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL
+              AND tbl_name IN ({', '.join('?' for _ in BACKUP_TABLES)})
+        ''', BACKUP_TABLES)
+        return [(name, sql) for name, sql in self.cursor.fetchall()
+                if not sql.upper().startswith('CREATE UNIQUE')]
+
+    def table_columns(self, table_name):
+        self.cursor.execute(f'PRAGMA table_info({table_name})')
+        return [row[1] for row in self.cursor.fetchall()]
+
+    def prepare(self, table_name, columns):
+        # upsert وليس INSERT OR REPLACE: الـ REPLACE يحذف الصف القديم بدون
+        # تشغيل triggers الحذف فيزيد ref_count في image_blobs بلا نقصان
+        updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column != 'id')
+        return (f"INSERT INTO {table_name} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT (id) DO {'UPDATE SET ' + updates if updates else 'NOTHING'}")
+
+    def load(self, statement, rows):
+        self.cursor.executemany(statement, rows)
+
+    def delete(self, table_name, ids):
+        self.cursor.executemany(f'DELETE FROM {table_name} WHERE id = ?', [(row_id,) for row_id in ids])
+
+
+def _copy_value(value):
+    """قيمة بصيغة COPY النصية"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_rows(cursor, statement, rows):
+    """COPY ... FROM STDIN بـ psycopg3 (cursor.copy) أو psycopg2 (copy_expert)"""
+    if hasattr(cursor, 'copy'):
+        with cursor.copy(statement) as copy:
+            for row in rows:
+                copy.write_row(row)
+        return
+    data = io.StringIO(''.join('\t'.join(_copy_value(value) for value in row) + '\n' for row in rows))
+    cursor.copy_expert(statement, data)
+
+
+class PostgresBulkLoader(BulkLoader):
+    db_type = 'postgresql'
+
+    def __init__(self, cursor, defer_indexes=True, search_index=False):
+        super().__init__(cursor, defer_indexes, search_index)
+        self._staging = set()
+
+    def begin(self):
+        self.cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+        super().begin()
+
+    def finish(self):
+        super().finish()
+        # الـ ids صريحة في النسخة - الـ sequence يكمل بعد أكبر id
+        for table_name in self.counts:
+            self.cursor.execute(f'''
+                SELECT setval(pg_get_serial_sequence('{table_name}', 'id'),
+                              COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+                FROM {table_name}
+            ''')
+
+    def refresh_search_index(self):
+        self.cursor.execute('SELECT id FROM base_products')
+        product_ids = [row['id'] if isinstance(row, dict) else row[0] for row in self.cursor.fetchall()]
+        resume_search_index(self.db_type, self.cursor, product_ids)
+
+    def secondary_indexes(self):
+        self.cursor.execute('''
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = ANY(%s)
+        ''', (BACKUP_TABLES,))
+        indexes = []
+        for row in self.cursor.fetchall():
+            name, sql = (row['indexname'], row['indexdef']) if isinstance(row, dict) else row
+            if not sql.upper().startswith('CREATE UNIQUE'):
+                indexes.append((name, sql))
+        return indexes
+
+    def table_columns(self, table_name):
+        self.cursor.execute('''
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+        ''', (table_name,))
+        return [row['column_name'] if isinstance(row, dict) else row[0] for row in self.cursor.fetchall()]
+
+    def prepare(self, table_name, columns):
+        staging = f'restore_{table_name}'
+        if table_name not in self._staging:
+            self.cursor.execute(f'CREATE TEMP TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP')
+            self._staging.add(table_name)
+        column_list = ', '.join(columns)
+        updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in columns if column != 'id')
+        merge = (f'INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging} '
+                 f"ON CONFLICT (id) DO {'UPDATE SET ' + updates if updates else 'NOTHING'}")
+        return staging, f'COPY {staging} ({column_list}) FROM STDIN', merge
+
+    def load(self, statement, rows):
+        staging, copy_statement, merge = statement
+        copy_rows(self.cursor, copy_statement, rows)
+        self.cursor.execute(merge)
+        self.cursor.execute(f'TRUNCATE {staging}')
+
+    def delete(self, table_name, ids):
+        self.cursor.execute(f'DELETE FROM {table_name} WHERE id = ANY(%s)', (list(ids),))
+
+
+def bulk_restore(db, events, defer_indexes=True):
+    """تطبيق كل الأحداث في transaction كتابة واحد - يرجع عدد السجلات لكل جدول
+
+    أي خطأ يلغي الاسترجاع بالكامل (لا توجد نسخة مطبقة نصفها).
+    """
+    loader_class = PostgresBulkLoader if db.db_type == 'postgresql' else SQLiteBulkLoader
+    started = time.monotonic()
+    search_index = getattr(db, 'search_index_available', False)
+    counts = db.run_write(lambda conn: loader_class(conn.cursor(), defer_indexes, search_index).run(events))
+    elapsed = time.monotonic() - started
+
+    for table_name, count in counts.items():
+        print(f"✅ تم استرجاع {count} سجل من جدول {table_name}")
+    total = sum(counts.values())
+    print(f"📊 {total} سجل في {elapsed:.2f} ثانية ({total / max(elapsed, 1e-6):,.0f} سجل/ثانية)")
+    return counts
@@ -0,0 +1,125 @@
+"""نسخ احتياطية متسقة (consistent snapshots)
+
+التصدير القديم كان SELECT * جدول بعد جدول بدون transaction، فممكن يلتقط
+استيراد Excel نصف مطبق، ويمسك أقفال القراءة طوال مدة التحويل لـ JSON.
+
+- SQLite: sqlite3.Connection.backup ينسخ صورة متسقة من قاعدة البيانات لملف
+  مؤقت على خطوات (SNAPSHOT_PAGES صفحة لكل خطوة) فالكاتب لا يتوقف أثناء
+  النسخ، ثم يُضغط الملف ويُرفع كما هو (.sqlite.gz)
+- PostgreSQL: التصدير داخل transaction واحد REPEATABLE READ READ ONLY
+  فكل الجداول من نفس اللحظة بدون منع الكتابة
+- الـ deltas تُقرأ بنفس الطريقة (consistent_read)
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+from contextlib import contextmanager
+
+SNAPSHOT_SUFFIX = '.sqlite.gz'
+# 1024 صفحة = 4MB بحجم الصفحة الافتراضي لكل خطوة
+SNAPSHOT_PAGES = int(os.getenv('BACKUP_SNAPSHOT_PAGES', '1024'))
+SNAPSHOT_BATCH_SIZE = 2000
+COMPRESS_LEVEL = 6
+
+
+def progress_printer():
+    """progress callback يطبع التقدم كل 25%"""
+    next_report = [0.25]
+
+    def progress(status, remaining, total):
+        done = (total - remaining) / total if total else 1.0
+        if done >= next_report[0] or remaining == 0:
+            print(f"📦 snapshot: {total - remaining}/{total} صفحة ({done:.0%})")
+            next_report[0] = int(done * 4) / 4 + 0.25
+
+    return progress
+
+
+def sqlite_snapshot(source, target_path, pages=SNAPSHOT_PAGES, progress=None):
+    """نسخ صورة متسقة من source (مسار أو اتصال) لملف target_path بالـ backup API
+
+    الـ backup يتم على خطوات بـ pages صفحة، وprogress(status, remaining, total)
+    تُستدعى بعد كل خطوة.
+    """
+    progress = progress or progress_printer()
+    source_conn = sqlite3.connect(source, timeout=30.0) if isinstance(source, str) else source
+    target_conn = sqlite3.connect(target_path)
+    try:
+        source_conn.backup(target_conn, pages=pages, progress=progress)
+    finally:
+        target_conn.close()
+        if source_conn is not source:
+            source_conn.close()
+
+
+def snapshot_connection(db_path, pages=SNAPSHOT_PAGES):
+    """اتصال in-memory بنسخة متسقة من قاعدة البيانات (للتصدير القديم كـ JSON)"""
+    source = sqlite3.connect(db_path, timeout=30.0)
+    memory = sqlite3.connect(':memory:')
+    try:
+        source.backup(memory, pages=pages, progress=progress_printer())
+    finally:
+        source.close()
+    return memory
+
+
+def gzip_file(source_path, target_path):
+    with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=COMPRESS_LEVEL) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+
+def gunzip_file(source_path, target_path):
+    with gzip.open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+
+def snapshot_change_seq(snapshot_path):
+    """آخر seq في change_log داخل الـ snapshot - متسق تماماً مع الصفوف"""
+    conn = sqlite3.connect(snapshot_path)
+    try:
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_log').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def iter_snapshot(snapshot_path, tables, batch_size=SNAPSHOT_BATCH_SIZE):
+    """صفوف الجداول من ملف snapshot بنفس أحداث backup_stream.iter_backup"""
+    conn = sqlite3.connect(snapshot_path)
+    try:
+        cursor = conn.cursor()
+        for table_name in tables:
+            try:
+                cursor.execute(f'SELECT * FROM {table_name} ORDER BY id')
+            except sqlite3.OperationalError:
+                # جدول غير موجود في نسخة قديمة
+                continue
+            columns = [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield 'rows', table_name, columns, rows
+    finally:
+        conn.close()
+
+
+@contextmanager
+def consistent_read(conn, db_type):
+    """cursor كل استعلاماته ترى نفس اللحظة من قاعدة البيانات
+
+    PostgreSQL: REPEATABLE READ READ ONLY. SQLite (WAL): transaction قراءة
+    يثبت الـ snapshot حتى نهايته بدون منع الكاتب.
+    """
+    conn.rollback()
+    cursor = conn.cursor()
+    if db_type == 'postgresql':
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+    else:
+        cursor.execute('BEGIN')
+    try:
+        yield cursor
+    finally:
+        conn.rollback()
@@ -0,0 +1,126 @@
+"""صيغة النسخ الاحتياطية المضغوطة (gzip NDJSON) والرفع على أجزاء
+
+بدل dict لكل قاعدة البيانات ثم json.dumps(indent=2) ثم encode أكثر من مرة،
+الصفوف تُقرأ بـ fetchmany وتُكتب مباشرة في ملف .ndjson.gz مؤقت على القرص،
+ثم يُرفع الملف بـ Dropbox upload sessions على أجزاء ثابتة الحجم (بدون حد
+الـ 150MB للرفع في طلب واحد). الـ restore يقرأ الملف سطراً بسطر.
+
+الملف سطر JSON لكل عنصر:
+    {"backup": {"backup_date": ..., "backup_type": "full_database", ...}}
+    {"table": "brands", "columns": ["id", "brand_name", ...]}
+    [1, "Gucci", ...]
+    [2, "Guess", ...]
+    {"table": "colors", "columns": [...]}
+    ...
+    {"deletes": "product_variants", "ids": [3, 4]}     (في الـ delta فقط)
+"""
+import gzip
+import json
+import os
+
+EXPORT_BATCH_SIZE = 2000
+RESTORE_BATCH_SIZE = 1000
+UPLOAD_CHUNK_SIZE = int(os.getenv('BACKUP_UPLOAD_CHUNK_MB', '8')) * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+BACKUP_SUFFIX = '.ndjson.gz'
+
+
+def _row_values(row):
+    return list(row.values()) if isinstance(row, dict) else list(row)
+
+
+class BackupWriter:
+    """كتابة نسخة احتياطية في ملف (مفتوح binary) كـ gzip NDJSON"""
+
+    def __init__(self, fileobj, meta):
+        self._gzip = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=COMPRESS_LEVEL)
+        self.row_count = 0
+        self.table_counts = {}
+        self._line({'backup': meta})
+
+    def _line(self, value):
+        # default=str للتواريخ من PostgreSQL
+        self._gzip.write(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+        self._gzip.write(b'\n')
+
+    def table(self, table_name, columns):
+        self._current = table_name
+        self.table_counts.setdefault(table_name, 0)
+        self._line({'table': table_name, 'columns': list(columns)})
+
+    def rows(self, rows):
+        for row in rows:
+            self._line(_row_values(row))
+        self.row_count += len(rows)
+        self.table_counts[self._current] += len(rows)
+
+    def deletes(self, table_name, ids):
+        self._line({'deletes': table_name, 'ids': list(ids)})
+        self.row_count += len(ids)
+
+    def write_table(self, cursor, table_name, batch_size=EXPORT_BATCH_SIZE):
+        """كل صفوف الجدول من cursor بـ fetchmany - يرجع عدد الصفوف"""
+        cursor.execute(f'SELECT * FROM {table_name} ORDER BY id')
+        self.table(table_name, [column[0] for column in cursor.description])
+        before = self.row_count
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            self.rows(rows)
+        return self.row_count - before
+
+    def close(self):
+        self._gzip.close()
+
+
+def iter_backup(fileobj, batch_size=RESTORE_BATCH_SIZE):
+    """قراءة ملف نسخة احتياطية كأحداث بدون تحميله في الذاكرة:
+
+    ('meta', dict) ثم ('rows', table, columns, [rows...]) على دفعات
+    و ('deletes', table, ids)
+    """
+    table_name = None
+    columns = None
+    batch = []
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as stream:
+        for line in stream:
+            item = json.loads(line)
+            if isinstance(item, list):
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    yield 'rows', table_name, columns, batch
+                    batch = []
+                continue
+
+            if batch:
+                yield 'rows', table_name, columns, batch
+                batch = []
+            if 'backup' in item:
+                yield 'meta', item['backup']
+            elif 'table' in item:
+                table_name, columns = item['table'], item['columns']
+            elif 'deletes' in item:
+                yield 'deletes', item['deletes'], item['ids']
+    if batch:
+        yield 'rows', table_name, columns, batch
+
+
+def upload_file(dbx, local_path, dropbox_path, chunk_size=UPLOAD_CHUNK_SIZE):
+    """رفع ملف لـ Dropbox - الملفات الأكبر من chunk_size عبر upload session"""
+    import dropbox
+
+    mode = dropbox.files.WriteMode.overwrite
+    size = os.path.getsize(local_path)
+    with open(local_path, 'rb') as f:
+        if size <= chunk_size:
+            return dbx.files_upload(f.read(), dropbox_path, mode=mode)
+
+        session = dbx.files_upload_session_start(f.read(chunk_size))
+        cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=f.tell())
+        commit = dropbox.files.CommitInfo(path=dropbox_path, mode=mode)
+        while size - f.tell() > chunk_size:
+            dbx.files_upload_session_append_v2(f.read(chunk_size), cursor)
+            cursor.offset = f.tell()
+        return dbx.files_upload_session_finish(f.read(chunk_size), cursor, commit)
@@ -0,0 +1,106 @@
+"""قياس ذاكرة (peak RSS) قراءة واستيراد ملف Excel كبير
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_excel_import_memory.py [10000 100000]
+
+لكل حجم يتم إنشاء sheet صناعي ثم قياس كل طريقة في process مستقل:
+- dataframe: الطريقة القديمة pd.read_excel(dtype=str) ثم to_dict('records')
+- stream:    iter_row_batches (openpyxl read_only) بدون استيراد
+- import:    iter_row_batches + ExcelImporter في قاعدة SQLite مؤقتة (بدون صور)
+
+الـ stream يجب أن تبقى ذاكرته ثابتة تقريباً مهما زاد عدد الصفوف. الـ import
+يزيد عليها cache صفحات SQLite (محدود بـ cache_size) وmap الـ ids لكل منتج
+في الملف (بضع عشرات bytes لكل منتج).
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ['dataframe', 'stream', 'import']
+COLORS = ['Black', 'Red', 'Blue', 'Brown', 'White']
+
+
+def build_sheet(path, row_count):
+    """Sheet بـ write_only حتى لا يؤثر إنشاؤه على القياس"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['Product Code', 'Brand Name', 'Product Type', 'Category', 'Size',
+                  'Wholesale Price', 'Retail Price', 'Color Name', 'Stock', 'Image URL', 'Tags'])
+    for i in range(row_count):
+        # كل منتج بـ len(COLORS) صفوف (لون لكل صف) بنفس البراند والفئة
+        product = i // len(COLORS)
+        sheet.append([f'M{product:07d}', f'Brand {product % 40}', f'Type {product % 12}',
+                      'L' if product % 2 else 'F', '20x22x5', 1000 + product % 500, 1500 + product % 700,
+                      COLORS[i % len(COLORS)], i % 30, '', 'Sale,Leather'])
+    workbook.save(path)
+
+
+def peak_rss_mb():
+    # ru_maxrss بالـ KB على Linux وبالـ bytes على macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_mode(mode, path):
+    """ينفذ داخل الـ process الفرعي ويطبع: الصفوف، الزمن، الذاكرة قبل وبعد"""
+    import pandas as pd
+
+    from excel_import import ExcelImporter, iter_row_batches
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    rows = 0
+
+    if mode == 'dataframe':
+        records = pd.read_excel(path, dtype=str).to_dict('records')
+        rows = len(records)
+    elif mode == 'stream':
+        for _, batch in iter_row_batches(path):
+            rows += len(batch)
+    else:
+        from database import StockDatabase
+
+        os.chdir(tempfile.mkdtemp(prefix='bench_import_'))
+        db = StockDatabase()
+        importer = ExcelImporter(db, download_images=False)
+        for first_row, batch in iter_row_batches(path):
+            importer.process_chunk(batch, first_row=first_row)
+            rows += len(batch)
+
+    elapsed = time.perf_counter() - started
+    print(f'{rows} {elapsed:.2f} {baseline:.1f} {peak_rss_mb():.1f}')
+
+
+def measure(mode, path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--mode', mode, path],
+        capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    rows, elapsed, baseline, peak = output.split()
+    return int(rows), float(elapsed), float(baseline), float(peak)
+
+
+def main(sizes):
+    workdir = tempfile.mkdtemp(prefix='bench_excel_')
+    print(f"{'rows':>8} {'mode':>10} {'time s':>8} {'peak MB':>8} {'+ over baseline':>16}")
+    for row_count in sizes:
+        path = os.path.join(workdir, f'sheet_{row_count}.xlsx')
+        build_sheet(path, row_count)
+        for mode in MODES:
+            rows, elapsed, baseline, peak = measure(mode, path)
+            print(f'{rows:>8} {mode:>10} {elapsed:>8.2f} {peak:>8.1f} {peak - baseline:>16.1f}')
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--mode':
+        run_mode(sys.argv[2], sys.argv[3])
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
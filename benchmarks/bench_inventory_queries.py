@@ -0,0 +1,83 @@
+"""قياس عدد الاستعلامات وزمن صفحة الجرد مع كبر حجم الكتالوج
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_inventory_queries.py [100 1000 5000]
+
+عدد الاستعلامات يجب أن يبقى ثابتاً مهما زاد عدد المنتجات.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import StockDatabase
+
+
+class CountingStockDatabase(StockDatabase):
+    """StockDatabase تعد كل statement يتم تنفيذه على SQLite"""
+
+    statements = 0
+
+    def open_connection(self):
+        conn = super().open_connection()
+        conn.set_trace_callback(self._count_statement)
+        return conn
+
+    @classmethod
+    def _count_statement(cls, statement):
+        cls.statements += 1
+
+
+def build_catalog(db, product_count, colors_per_product=4):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM colors ORDER BY id')
+    color_ids = [row[0] for row in cursor.fetchall()][:colors_per_product]
+    cursor.execute('SELECT id FROM tags ORDER BY id LIMIT 2')
+    tag_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.executemany('''
+        INSERT INTO base_products (product_code, brand_id, product_type_id, trader_category,
+                                   product_size, wholesale_price, retail_price, supplier_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+    ''', [(f'B{i:06d}', 1 + i % 6, 1 + i % 6, 'L' if i % 2 else 'F', '20x20', 100, 150)
+          for i in range(product_count)])
+    cursor.execute('SELECT id FROM base_products')
+    product_ids = [row[0] for row in cursor.fetchall()]
+    cursor.executemany('''
+        INSERT INTO product_variants (base_product_id, color_id, current_stock) VALUES (?, ?, ?)
+    ''', [(pid, cid, pid % 9) for pid in product_ids for cid in color_ids])
+    cursor.executemany('INSERT INTO product_tags (product_id, tag_id) VALUES (?, ?)',
+                       [(pid, tid) for pid in product_ids for tid in tag_ids])
+    conn.commit()
+    conn.close()
+
+
+def measure(product_count):
+    workdir = tempfile.mkdtemp(prefix='bench_inventory_')
+    db = CountingStockDatabase(os.path.join(workdir, 'bench.db'))
+    db.add_default_data()
+    build_catalog(db, product_count)
+
+    results = {}
+    for label, args in [('full catalog', ('', '', '')), ('brand filter', ('', 'Gucci', ''))]:
+        CountingStockDatabase.statements = 0
+        started = time.perf_counter()
+        inventory = db.get_all_products_for_inventory(*args)
+        elapsed = (time.perf_counter() - started) * 1000
+        results[label] = (len(inventory), CountingStockDatabase.statements, elapsed)
+    return results
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000]
+    print(f"{'products':>10} {'query':>14} {'rows':>8} {'statements':>11} {'ms':>10}")
+    for size in sizes:
+        for label, (rows, statements, elapsed) in measure(size).items():
+            print(f'{size:>10} {label:>14} {rows:>8} {statements:>11} {elapsed:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""قياس زمن بدء التطبيق (import app) في process جديد
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_startup.py [عدد المرات]
+
+- cold: مجلد جديد بدون قاعدة بيانات (إنشاء الجداول والـ migrations)
+- warm: نفس المجلد مرة ثانية (الـ schema موجود فلا DDL)
+
+مع كل قياس أسماء المكتبات الثقيلة التي تم تحميلها أثناء الـ import، ثم أبطأ
+الـ modules حسب python -X importtime. DATABASE_URL يتم حذفه (SQLite دائماً).
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'openpyxl', 'dropbox', 'requests', 'PIL']
+TOP_MODULES = 10
+
+
+def run_child():
+    import time
+    started = time.perf_counter()
+    import app  # noqa: F401
+    elapsed = time.perf_counter() - started
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(f"{elapsed:.3f} {','.join(loaded) or '-'}")
+    # بدون انتظار الـ threads الخلفية (import jobs)
+    os._exit(0)
+
+
+def child_env():
+    env = dict(os.environ)
+    env.pop('DATABASE_URL', None)
+    env['PYTHONPATH'] = PROJECT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def measure(workdir, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += [os.path.abspath(__file__), '--child']
+    result = subprocess.run(command, cwd=workdir, env=child_env(),
+                            capture_output=True, text=True, check=True)
+    elapsed, loaded = result.stdout.strip().splitlines()[-1].split()
+    return float(elapsed), loaded, result.stderr
+
+
+def slowest_imports(stderr, count=TOP_MODULES):
+    """أبطأ الـ modules التي يستوردها app مباشرة (cumulative) من -X importtime"""
+    children, modules = [], []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            # الأبناء يُطبعون قبل الـ module نفسه
+            if name.strip() == 'app':
+                modules = children
+            children = []
+    return sorted(modules, reverse=True)[:count]
+
+
+def main(runs):
+    print(f"{'run':>4} {'db':>6} {'import s':>9}  heavy modules loaded")
+    for run in range(runs):
+        workdir = tempfile.mkdtemp(prefix='bench_startup_')
+        for label in ('cold', 'warm'):
+            elapsed, loaded, _ = measure(workdir)
+            print(f'{run + 1:>4} {label:>6} {elapsed:>9.3f}  {loaded}')
+
+    _, _, stderr = measure(workdir, importtime=True)
+    print('\nslowest imports by app (warm db):')
+    for cumulative, name in slowest_imports(stderr):
+        print(f'{cumulative / 1000:>10.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--child']:
+        run_child()
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
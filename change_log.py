@@ -0,0 +1,117 @@
+"""سجل التغييرات للنسخ الاحتياطية التزايدية (incremental)
+
+كل إضافة/تعديل/حذف على جداول النسخ الاحتياطي (BACKUP_TABLES) تسجل
+(table_name, row_id) في جدول change_log عبر triggers (migration 10)، حتى
+الكتابة من SQL مباشر أو من الاستيراد.
+
+النسخة الاحتياطية إما:
+- full: كل الصفوف + آخر seq في change_log وقت التصدير
+- delta: الصفوف التي تغيرت منذ آخر نسخة (الحالية منها upsert، والمحذوفة ids)
+تكلفة الـ delta تتناسب مع عدد الكتابات وليس حجم الكتالوج. الـ restore
+يطبق آخر full ثم الـ deltas التابعة لها بالترتيب.
+
+التسليم at-least-once: الـ seq يُقرأ قبل الصفوف، فأي كتابة أثناء التصدير
+تظهر مرة أخرى في الـ delta التالية (الـ upsert بنفس القيم آمن).
+"""
+import json
+from datetime import datetime
+
+# بترتيب الاسترجاع (الجداول المرجعية قبل التي تشير لها)
+BACKUP_TABLES = [
+    'brands', 'colors', 'product_types', 'trader_categories',
+    'suppliers', 'tags', 'base_products', 'product_variants',
+    'color_images', 'product_tags'
+]
+
+# عدد الـ ids في كل استعلام IN
+ID_BATCH_SIZE = 500
+
+
+def _value(row):
+    if isinstance(row, dict):
+        return next(iter(row.values()))
+    return row[0]
+
+
+def current_seq(cursor):
+    """آخر رقم في change_log (0 لو فارغ)"""
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM change_log')
+    return _value(cursor.fetchone()) or 0
+
+
+def pending_changes(cursor, since_seq):
+    cursor.execute('SELECT COUNT(*) FROM change_log WHERE id > ?', (since_seq,))
+    return _value(cursor.fetchone()) or 0
+
+
+def iter_changes(cursor, since_seq, to_seq):
+    """التغييرات في (since_seq, to_seq] على دفعات بنفس أحداث backup_stream.iter_backup:
+
+    ('rows', table, columns, rows) للصفوف الموجودة الآن (upsert)
+    ('deletes', table, ids) للصفوف التي لم تعد موجودة
+    """
+    cursor.execute('''
+        SELECT DISTINCT table_name, row_id FROM change_log WHERE id > ? AND id <= ?
+    ''', (since_seq, to_seq))
+    changed = {}
+    for row in cursor.fetchall():
+        table_name, row_id = (row['table_name'], row['row_id']) if isinstance(row, dict) else row
+        changed.setdefault(table_name, set()).add(row_id)
+
+    for table_name in BACKUP_TABLES:
+        ids = sorted(changed.get(table_name, ()))
+        deleted = []
+        for start in range(0, len(ids), ID_BATCH_SIZE):
+            batch = ids[start:start + ID_BATCH_SIZE]
+            cursor.execute(f"SELECT * FROM {table_name} WHERE id IN ({', '.join('?' for _ in batch)})", batch)
+            columns = [column[0] for column in cursor.description]
+            rows = [list(row.values()) if isinstance(row, dict) else list(row) for row in cursor.fetchall()]
+            # الصف غير الموجود الآن تم حذفه
+            existing = {row[columns.index('id')] for row in rows}
+            deleted.extend(row_id for row_id in batch if row_id not in existing)
+            if rows:
+                yield 'rows', table_name, columns, rows
+        if deleted:
+            yield 'deletes', table_name, deleted
+
+
+def prune(cursor, up_to_seq):
+    """حذف التغييرات التي أصبحت داخل نسخة مرفوعة"""
+    cursor.execute('DELETE FROM change_log WHERE id <= ?', (up_to_seq,))
+
+
+# ---------------------------------------------------------------------------
+# حالة النسخ الاحتياطي (آخر full وآخر seq مرفوع)
+# ---------------------------------------------------------------------------
+
+def get_state(db):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, value FROM backup_state')
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    state = {}
+    for row in rows:
+        name, value = (row['name'], row['value']) if isinstance(row, dict) else row
+        state[name] = json.loads(value)
+    return state
+
+
+def save_state(cursor, **values):
+    for name, value in values.items():
+        cursor.execute('DELETE FROM backup_state WHERE name = ?', (name,))
+        cursor.execute('INSERT INTO backup_state (name, value) VALUES (?, ?)', (name, json.dumps(value)))
+
+
+def reset_after_restore(db, base_name):
+    """بعد الـ restore: الصفوف المسترجعة ليست تغييرات جديدة، والنسخة التالية full"""
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM change_log')
+        cursor.execute('DELETE FROM backup_state')
+        save_state(cursor, restored_from=base_name,
+                   restored_at=datetime.now().isoformat(timespec='seconds'))
+
+    db.run_write(write)
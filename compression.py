@@ -0,0 +1,128 @@
+"""ضغط الـ responses (gzip، و brotli لو المكتبة مثبتة)
+
+صفحات المخزون ونتائج /search_products و /inventory_search نصوص كبيرة ومكررة
+(كل متغير يكرر البراند والنوع واللون، والـ templates فيها CSS كبير)، فالضغط
+يقللها لجزء صغير من حجمها على اتصالات الموبايل.
+
+- النوع يُختار من Accept-Encoding (مع q-values): br ثم gzip
+- الـ responses الأصغر من COMPRESS_MIN_SIZE لا تُضغط
+- الـ streaming والملفات (send_file) لا تُضغط أثناء الطلب
+- ملفات CSS/JS الثابتة يمكن ضغطها مسبقاً وقت الـ build:
+      python compression.py
+  تنشئ style.css.gz (و style.css.br) بجانب الأصل، وتُرسل بدلاً منه للمتصفح
+  الذي يقبلها. brotli اختيارية: pip install brotli
+"""
+import gzip
+import mimetypes
+import os
+import sys
+
+from flask import request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'image/svg+xml',
+}
+PRECOMPRESS_EXTENSIONS = {'.css', '.js', '.svg'}
+# المجلدات التي لا تُضغط مسبقاً (الصور المرفوعة)
+PRECOMPRESS_SKIP_DIRS = {'uploads'}
+
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def supported_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def accepted_encodings(accept_encodings):
+    """الأنواع المدعومة التي يقبلها المتصفح مرتبة حسب q (الأفضل أولاً)"""
+    ranked = [(accept_encodings.quality(encoding), -index, encoding)
+              for index, encoding in enumerate(supported_encodings())]
+    return [encoding for quality, _, encoding in sorted(ranked, reverse=True) if quality > 0]
+
+
+def compress(data, encoding, precompress=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if precompress else BROTLI_QUALITY)
+    # mtime=0 حتى يكون الناتج ثابتاً لنفس المحتوى
+    return gzip.compress(data, compresslevel=9 if precompress else GZIP_LEVEL, mtime=0)
+
+
+def init_compression(app, min_size=COMPRESS_MIN_SIZE):
+    """تسجيل ضغط الـ responses وإرسال الملفات الثابتة المضغوطة مسبقاً"""
+
+    @app.before_request
+    def send_precompressed_static():
+        if request.endpoint != 'static' or not request.view_args:
+            return None
+        filename = request.view_args.get('filename', '')
+        if os.path.splitext(filename)[1] not in PRECOMPRESS_EXTENSIONS:
+            return None
+        path = safe_join(app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+
+        for encoding in accepted_encodings(request.accept_encodings):
+            encoded_path = path + ENCODING_SUFFIXES[encoding]
+            # نسخة أقدم من الأصل (الملف اتعدل بعد الـ build) يتم تجاهلها
+            if os.path.isfile(encoded_path) and os.path.getmtime(encoded_path) >= os.path.getmtime(path):
+                response = send_file(encoded_path, mimetype=mimetypes.guess_type(path)[0],
+                                     conditional=True, max_age=app.get_send_file_max_age(filename))
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+        return None
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encodings = accepted_encodings(request.accept_encodings)
+        data = response.get_data()
+        if not encodings or len(data) < min_size:
+            return response
+
+        response.set_data(compress(data, encodings[0]))
+        response.headers['Content-Encoding'] = encodings[0]
+        return response
+
+    return app
+
+
+def precompress_static(static_folder='static'):
+    """إنشاء .gz (و .br) لملفات CSS/JS - يرجع عدد الملفات"""
+    count = 0
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [name for name in dirs if name not in PRECOMPRESS_SKIP_DIRS]
+        for name in files:
+            if os.path.splitext(name)[1] not in PRECOMPRESS_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for encoding in supported_encodings():
+                encoded = compress(data, encoding, precompress=True)
+                with open(path + ENCODING_SUFFIXES[encoding], 'wb') as f:
+                    f.write(encoded)
+                print(f"📦 {path}{ENCODING_SUFFIXES[encoding]}: {len(data)} -> {len(encoded)} bytes")
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    precompress_static(sys.argv[1] if len(sys.argv) > 1 else 'static')
@@ -0,0 +1,391 @@
+import os
+import threading
+import time
+import weakref
+
+
+class PoolTimeoutError(Exception):
+    """لا يوجد اتصال متاح في الـ pool خلال المهلة المحددة"""
+
+
+class PooledConnection:
+    """غلاف للاتصال - close() ترجعه للـ pool بدلاً من إغلاقه فعلياً"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def __getattr__(self, name):
+        if name in ('_pool', '_raw', '_released'):
+            raise AttributeError(name)
+        return getattr(self._raw, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # نفس سلوك sqlite3 و psycopg2: commit عند النجاح و rollback عند الخطأ (بدون إغلاق)
+        if exc_type is None:
+            self._raw.commit()
+        else:
+            self._raw.rollback()
+        return False
+
+    def __del__(self):
+        # اتصال لم يُغلق (مسار خطأ مثلاً) - نتخلص منه بدل تسريبه من الـ pool
+        if not getattr(self, '_released', True):
+            self._released = True
+            try:
+                self._pool.discard(self._raw)
+            except Exception:
+                pass
+
+
+class _IdleList(list):
+    """قائمة قابلة لـ weakref حتى تختفي من الإحصائيات عند انتهاء الـ thread"""
+
+    __hash__ = object.__hash__
+
+    def __init__(self):
+        super().__init__()
+        # اتصالات هذا الـ thread التي تم التخلص منها من thread آخر - تُغلق هنا
+        self.orphans = []
+
+
+class _PoolEntry:
+    __slots__ = ('conn', 'created_at', 'last_used', 'home')
+
+    def __init__(self, conn, home=None):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+        self.home = home
+
+
+class _BasePool:
+    """المنطق المشترك: فحص الصحة، إعادة التدوير بعد max_lifetime، والإحصائيات"""
+
+    def __init__(self, max_lifetime=1800, health_check_after=30):
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'discarded': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'total_wait_ms': 0.0,
+        }
+        # المفتاح: id(raw connection) -> _PoolEntry للاتصالات المستخدمة حالياً
+        self._checked_out = {}
+
+    def _incr(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _is_expired(self, entry):
+        return self.max_lifetime and time.monotonic() - entry.created_at > self.max_lifetime
+
+    def _is_healthy(self, entry):
+        """فحص الاتصال إذا ظل خاملاً لفترة"""
+        if time.monotonic() - entry.last_used < self.health_check_after:
+            return True
+        try:
+            cursor = entry.conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            self._incr('failed_health_checks')
+            return False
+
+    def _close_raw(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _validate(self, entry):
+        """إرجاع True إذا كان الاتصال صالحاً لإعادة الاستخدام، وإلا يتم إغلاقه"""
+        if self._is_expired(entry):
+            self._incr('recycled')
+            self._close_raw(entry.conn)
+            return False
+        if not self._is_healthy(entry):
+            self._close_raw(entry.conn)
+            return False
+        return True
+
+    def _new_entry(self):
+        entry = _PoolEntry(self._connect())
+        self._incr('created')
+        return entry
+
+    def _checkout(self, entry, reused):
+        self._incr('checkouts')
+        if reused:
+            self._incr('reused')
+        with self._stats_lock:
+            self._checked_out[id(entry.conn)] = entry
+        return PooledConnection(self, entry.conn)
+
+    def _pop_checked_out(self, conn):
+        with self._stats_lock:
+            return self._checked_out.pop(id(conn), None)
+
+    def _reset(self, conn):
+        """إلغاء أي transaction غير مكتمل - نفس سلوك close() بدون commit"""
+        conn.rollback()
+
+    def get_connection(self):
+        raise NotImplementedError
+
+    def release(self, conn):
+        raise NotImplementedError
+
+    def discard(self, conn):
+        self._pop_checked_out(conn)
+        self._incr('discarded')
+        self._close_raw(conn)
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+            data['in_use'] = len(self._checked_out)
+        checkouts = data['checkouts'] or 1
+        data['reuse_ratio'] = round(data['reused'] / checkouts, 3)
+        data['avg_wait_ms'] = round(data['total_wait_ms'] / data['waits'], 2) if data['waits'] else 0.0
+        data['total_wait_ms'] = round(data['total_wait_ms'], 2)
+        return data
+
+    def close_all(self):
+        raise NotImplementedError
+
+
+class SQLiteConnectionPool(_BasePool):
+    """اتصالات SQLite قابلة لإعادة الاستخدام لكل thread
+
+    كل thread له قائمة اتصالات خاملة خاصة به (sqlite3 لا يسمح باستخدام
+    الاتصال من thread آخر). الاستدعاءات المتداخلة تحصل على اتصالات مختلفة
+    حتى لا يؤثر rollback الداخلي على transaction الخارجي.
+    """
+
+    def __init__(self, connect, max_idle_per_thread=4, **kwargs):
+        super().__init__(**kwargs)
+        self._connect_fn = connect
+        self.max_idle_per_thread = max_idle_per_thread
+        self._local = threading.local()
+        self._all_idle = weakref.WeakSet()
+        self._idle_lock = threading.Lock()
+
+    def _idle(self):
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = _IdleList()
+            with self._idle_lock:
+                self._all_idle.add(idle)
+        return idle
+
+    def _connect(self):
+        return self._connect_fn()
+
+    def _close_orphans(self, idle):
+        while idle.orphans:
+            self._close_raw(idle.orphans.pop())
+
+    def get_connection(self):
+        idle = self._idle()
+        if idle.orphans:
+            self._close_orphans(idle)
+        while idle:
+            entry = idle.pop()
+            if self._validate(entry):
+                return self._checkout(entry, reused=True)
+        entry = self._new_entry()
+        entry.home = idle
+        return self._checkout(entry, reused=False)
+
+    def release(self, conn):
+        entry = self._pop_checked_out(conn)
+        if entry is None:
+            return
+        try:
+            self._reset(conn)
+        except Exception:
+            self._incr('discarded')
+            self._close_raw(conn)
+            return
+        idle = self._idle()
+        if len(idle) >= self.max_idle_per_thread or self._is_expired(entry):
+            self._close_raw(conn)
+            return
+        entry.last_used = time.monotonic()
+        idle.append(entry)
+
+    def discard(self, conn):
+        entry = self._pop_checked_out(conn)
+        self._incr('discarded')
+        if entry is None or entry.home is getattr(self._local, 'idle', None):
+            self._close_raw(conn)
+            return
+        # الاتصال من thread آخر - sqlite3 لا يسمح بإغلاقه من هنا، فيغلقه
+        # الـ thread صاحبه عند طلبه التالي (أو عند انتهائه مع قائمته)
+        entry.home.orphans.append(conn)
+
+    def stats(self):
+        data = super().stats()
+        with self._idle_lock:
+            data['idle'] = sum(len(idle) for idle in self._all_idle)
+        data['backend'] = 'sqlite'
+        return data
+
+    def close_all(self):
+        idle = self._idle()
+        self._close_orphans(idle)
+        while idle:
+            self._close_raw(idle.pop().conn)
+
+
+class PostgresConnectionPool(_BasePool):
+    """Pool محدود الحجم لاتصالات PostgreSQL (psycopg3 أو psycopg2)"""
+
+    def __init__(self, connect, max_size=10, timeout=30.0, **kwargs):
+        super().__init__(**kwargs)
+        self._connect_fn = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle_entries = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        return self._connect_fn()
+
+    def get_connection(self):
+        deadline = time.monotonic() + self.timeout
+        waited_from = None
+        with self._cond:
+            while True:
+                if self._idle_entries:
+                    entry = self._idle_entries.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                if waited_from is None:
+                    waited_from = time.monotonic()
+                    self._incr('waits')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._incr('total_wait_ms', (time.monotonic() - waited_from) * 1000)
+                    raise PoolTimeoutError(
+                        f'No database connection available within {self.timeout}s '
+                        f'(pool size {self.max_size})')
+                self._cond.wait(remaining)
+
+        if waited_from is not None:
+            self._incr('total_wait_ms', (time.monotonic() - waited_from) * 1000)
+
+        # فحص الاتصال خارج الـ lock لأنه قد يحتاج round trip
+        # (لو فشل الفحص، الاتصال الجديد يأخذ نفس المكان في الـ pool)
+        if entry is not None and self._validate(entry):
+            return self._checkout(entry, reused=True)
+        try:
+            return self._checkout(self._new_entry(), reused=False)
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _free_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_broken(self, conn):
+        closed = getattr(conn, 'closed', False)
+        return bool(closed) or getattr(conn, 'broken', False)
+
+    def release(self, conn):
+        entry = self._pop_checked_out(conn)
+        if entry is None:
+            return
+        if self._is_broken(conn) or self._is_expired(entry):
+            if not self._is_broken(conn):
+                self._incr('recycled')
+            self._close_raw(conn)
+            self._free_slot()
+            return
+        try:
+            self._reset(conn)
+        except Exception:
+            self._incr('discarded')
+            self._close_raw(conn)
+            self._free_slot()
+            return
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle_entries.append(entry)
+            self._cond.notify()
+
+    def discard(self, conn):
+        super().discard(conn)
+        self._free_slot()
+
+    def stats(self):
+        data = super().stats()
+        with self._cond:
+            data['idle'] = len(self._idle_entries)
+            data['size'] = self._size
+        data['max_size'] = self.max_size
+        data['backend'] = 'postgresql'
+        return data
+
+    def close_all(self):
+        with self._cond:
+            entries, self._idle_entries = self._idle_entries, []
+            self._size -= len(entries)
+            self._cond.notify_all()
+        for entry in entries:
+            self._close_raw(entry.conn)
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(key, factory):
+    """Pool واحد لكل قاعدة بيانات داخل الـ process (حتى لو تعددت نسخ StockDatabase)"""
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = _shared_pools[key] = factory()
+        return pool
+
+
+def pool_settings():
+    """إعدادات الـ pool من متغيرات البيئة"""
+    return {
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+        'health_check_after': float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '30')),
+    }
@@ -2,9 +2,18 @@ import sqlite3
 import os
 from urllib.parse import urlparse
 from datetime import datetime
-import requests
 from urllib.parse import urlparse
-import re
+from migrations import run_migrations, schema_is_current
+from pagination import DEFAULT_PAGE_SIZE, build_page, decode_cursor, keyset_condition, order_by
+from search_index import build_match_query, has_matches, search_index_exists, search_join
+from sqlite_writer import SQLiteWriteQueue, apply_sqlite_pragmas
+from reference_cache import ReferenceCache
+from image_fetcher import HostUnavailableError, get_image_fetcher
+from image_variants import find_variants, variants_json
+from image_store import link_color_images, new_temp_path, store_file
+from connection_pool import (
+    SQLiteConnectionPool, PostgresConnectionPool, get_shared_pool, pool_settings
+)
 try:
     import psycopg  # psycopg3
     from psycopg.rows import dict_row
@@ -28,17 +37,84 @@ class StockDatabase:
             self.db_type = 'sqlite'
             self.db_name = db_name
         
+        self.pool = self.create_pool()
+        self.writer = self.create_writer()
+        self.reference_cache = ReferenceCache(self.get_connection)
         self.init_database()
     
-    def get_connection(self):
-        """الحصول على اتصال قاعدة البيانات"""
+    def create_pool(self):
+        """إنشاء (أو مشاركة) الـ connection pool الخاص بقاعدة البيانات"""
+        settings = pool_settings()
+        if self.db_type == 'postgresql':
+            key = ('postgresql', self.pg_config['host'], self.pg_config['port'], self.pg_config['database'])
+            return get_shared_pool(key, lambda: PostgresConnectionPool(
+                self.open_connection,
+                max_size=settings['max_size'],
+                timeout=settings['timeout'],
+                max_lifetime=settings['max_lifetime'],
+                health_check_after=settings['health_check_after']
+            ))
+        
+        key = ('sqlite', os.path.abspath(self.db_name))
+        return get_shared_pool(key, lambda: SQLiteConnectionPool(
+            self.open_connection,
+            max_lifetime=settings['max_lifetime'],
+            health_check_after=settings['health_check_after']
+        ))
+    
+    def create_writer(self):
+        """الكاتب المشترك لقاعدة SQLite (PostgreSQL لا يحتاجه)"""
+        if self.db_type == 'postgresql':
+            return None
+        key = ('sqlite_writer', os.path.abspath(self.db_name))
+        return get_shared_pool(key, lambda: SQLiteWriteQueue(self.open_connection))
+    
+    def open_connection(self):
+        """فتح اتصال جديد مباشرة (بدون pool)"""
         if self.db_type == 'postgresql':
             if PSYCOPG_VERSION == 3:
                 return psycopg.connect(**self.pg_config, row_factory=dict_row)
             else:
                 return psycopg2.connect(**self.pg_config, cursor_factory=RealDictCursor)
         else:
-            return sqlite3.connect(self.db_name, timeout=30.0)
+            conn = sqlite3.connect(self.db_name, timeout=30.0)
+            apply_sqlite_pragmas(conn)
+            return conn
+    
+    def get_connection(self):
+        """الحصول على اتصال قاعدة البيانات من الـ pool - close() ترجعه للـ pool"""
+        return self.pool.get_connection()
+    
+    def get_pool_stats(self):
+        """إحصائيات الـ connection pool"""
+        return self.pool.stats()
+    
+    def run_write(self, write_fn):
+        """تنفيذ write_fn(conn) في transaction كتابة وإرجاع نتيجتها
+        
+        على SQLite تمر عبر طابور الكاتب الواحد، وعلى PostgreSQL تستخدم اتصال
+        من الـ pool. write_fn لا تعمل commit ولا close - أي exception يلغي
+        الـ transaction بالكامل.
+        """
+        if self.writer is not None:
+            return self.writer.run(write_fn)
+        
+        conn = self.get_connection()
+        try:
+            result = write_fn(conn)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def get_writer_stats(self):
+        """عمق طابور الكتابة وزمن الانتظار"""
+        if self.writer is None:
+            return {'backend': 'postgresql'}
+        return self.writer.stats()
    
    
     def setup_postgresql(self):
@@ -83,6 +159,15 @@ class StockDatabase:
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        # قاعدة بيانات موجودة بآخر schema: لا حاجة لكل الـ DDL مع كل تشغيل
+        if schema_is_current(self, conn):
+            self.schema_changed = False
+            self.search_index_available = search_index_exists(self.db_type, cursor)
+            conn.close()
+            print(f"✅ Database schema up to date ({self.db_type})")
+            return
+        self.schema_changed = True
+        
         # تحديد نوع البيانات حسب قاعدة البيانات
         if self.db_type == 'postgresql':
             id_type = 'SERIAL PRIMARY KEY'
@@ -197,6 +282,8 @@ class StockDatabase:
                 variant_id INTEGER UNIQUE NOT NULL,
                 image_url TEXT,
                 image_filename TEXT,
+                image_variants TEXT,
+                image_hash TEXT,
                 created_date {timestamp_type},
                 FOREIGN KEY (variant_id) REFERENCES product_variants(id) ON DELETE CASCADE
             )
@@ -215,70 +302,43 @@ class StockDatabase:
             )
         ''')
         
-        # إضافة عمود المقاس للمنتجات الموجودة (إذا لم يكن موجود)
-        try:
-            cursor.execute('ALTER TABLE base_products ADD COLUMN product_size TEXT')
-        except sqlite3.OperationalError:
-            pass  # العمود موجود بالفعل
-        
         conn.commit()
+        
+        # تعديلات الـ schema اللاحقة (أعمدة جديدة، indexes) عبر migrations مرقّمة
+        run_migrations(self, conn)
+        self.search_index_available = search_index_exists(self.db_type, cursor)
+        
         conn.close()
         print(f"✅ Database initialized using {self.db_type}")
     
     # وظائف نظام الصور المحدث
-    def create_product_folder(self, product_code):
-        """إنشاء مجلد المنتج"""
-        product_path = os.path.join('static', 'uploads', 'products', str(product_code))
-        os.makedirs(product_path, exist_ok=True)
-        return product_path
-    
-    def clean_color_name(self, color_name):
-        """تنظيف اسم اللون للاستخدام في أسماء الملفات"""
-        # تحويل لأحرف صغيرة وإزالة المسافات والأحرف الخاصة
-        clean_name = color_name.lower().strip()
-        clean_name = re.sub(r'[^a-zA-Z0-9_]', '_', clean_name)
-        clean_name = re.sub(r'_+', '_', clean_name)  # إزالة الـ underscores المتكررة
-        return clean_name.strip('_')
-    
-    def download_and_save_image(self, image_url, product_code, color_name):
-        """تحميل صورة من URL وحفظها محلياً مع تحسين استهلاك الذاكرة"""
+    def download_and_save_image(self, image_url):
+        """تحميل صورة من URL وحفظها في مخزن الصور (streaming عبر الـ ImageFetcher المشترك)
+        
+        يرجع رابط الـ blob - نفس الصورة لأكثر من كود/لون تُحفظ مرة واحدة.
+        """
+        import requests
+        
         try:
-            # إنشاء مجلد المنتج
-            product_folder = self.create_product_folder(product_code)
-            
-            # تحميل الصورة مع streaming لتوفير الذاكرة
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            # استخدام stream=True وtimeout أقصر لتجنب التعليق
-            response = requests.get(image_url, headers=headers, timeout=15, stream=True)
-            
-            if response.status_code == 200:
-                # تحديد امتداد الملف
-                parsed_url = urlparse(image_url)
-                file_extension = os.path.splitext(parsed_url.path)[1].lower()
-                if not file_extension or file_extension not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-                    file_extension = '.jpg'
-
-                # تنظيف اسم اللون وإنشاء اسم الملف
-                clean_color = self.clean_color_name(color_name)
-                filename = f"{product_code}_{clean_color}{file_extension}"
-                file_path = os.path.join(product_folder, filename)
-
-                # حفظ الصورة في chunks لتوفير الذاكرة
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:  # تصفية الـ chunks الفارغة
-                            f.write(chunk)
-
-                # إرجاع المسار النسبي
-                return f"/static/uploads/products/{product_code}/{filename}"
+            # تحديد امتداد الملف (لو تعذر تحديده من المحتوى)
+            parsed_url = urlparse(image_url)
+            file_extension = os.path.splitext(parsed_url.path)[1].lower()
+            if not file_extension or file_extension not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
+                file_extension = '.jpg'
             
-            else:
-                print(f"⚠️ فشل تحميل الصورة: HTTP {response.status_code} - {image_url}")
+            # session مشتركة + حد لكل host + circuit breaker
+            file_path = new_temp_path()
+            if not get_image_fetcher().download(image_url, file_path):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
                 return None
 
+            # نقل الملف للمخزن بالـ SHA-256 وإنشاء النسخ المصغرة
+            return store_file(file_path, file_extension)
+
+        except HostUnavailableError as e:
+            print(f"⚠️ تم تخطي الصورة: {e}")
+            return None
         except requests.exceptions.Timeout:
             print(f"⚠️ انتهت مهلة تحميل الصورة: {image_url}")
             return None
@@ -289,30 +349,18 @@ class StockDatabase:
             print(f"❌ خطأ في تحميل الصورة من {image_url}: {e}")
             return None
         
-    def save_manual_image(self, uploaded_file, product_code, color_name):
-        """حفظ صورة مرفوعة يدوياً"""
+    def save_manual_image(self, uploaded_file):
+        """حفظ صورة مرفوعة يدوياً في مخزن الصور - يرجع رابط الـ blob"""
         try:
-            from werkzeug.utils import secure_filename
-            
-            # إنشاء مجلد المنتج
-            product_folder = self.create_product_folder(product_code)
-            
-            # تحديد امتداد الملف
-            original_filename = secure_filename(uploaded_file.filename)
-            file_extension = os.path.splitext(original_filename)[1].lower()
+            # تحديد امتداد الملف (لو تعذر تحديده من المحتوى)
+            file_extension = os.path.splitext(uploaded_file.filename or '')[1].lower()
             if not file_extension:
                 file_extension = '.jpg'
             
-            # تنظيف اسم اللون وإنشاء اسم الملف
-            clean_color = self.clean_color_name(color_name)
-            filename = f"{product_code}_{clean_color}{file_extension}"
-            file_path = os.path.join(product_folder, filename)
-            
-            # حفظ الصورة
+            # حفظ الصورة ثم نقلها للمخزن بالـ SHA-256
+            file_path = new_temp_path()
             uploaded_file.save(file_path)
-            
-            # إرجاع المسار النسبي
-            return f"/static/uploads/products/{product_code}/{filename}"
+            return store_file(file_path, file_extension)
         
         except Exception as e:
             print(f"Error saving manual image: {e}")
@@ -320,402 +368,225 @@ class StockDatabase:
     
     def add_default_data(self):
         """إضافة بيانات افتراضية مع Tags"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # إضافة فئات التجار
-        categories = [('L', 'Category L', 'Trader Category L'), 
-                     ('F', 'Category F', 'Trader Category F')]
-        for cat in categories:
-            cursor.execute('INSERT OR IGNORE INTO trader_categories (category_code, category_name, description) VALUES (?, ?, ?)', cat)
-        
-        # إضافة براندات افتراضية
-        brands = ['Saint Laurent', 'Gucci', 'Louis Vuitton', 'Guess', 'Tommy Hilfiger', 'Karl Lagerfeld']
-        for brand in brands:
-            cursor.execute('INSERT OR IGNORE INTO brands (brand_name) VALUES (?)', (brand,))
-        
-        # إضافة ألوان افتراضية
-        colors = [('Black', '#000000'), ('Brown', '#8B4513'), ('Red', '#FF0000'), 
-                 ('White', '#FFFFFF'), ('Beige', '#F5F5DC'), ('Navy', '#000080'),
-                 ('Gold', '#FFD700'), ('Silver', '#C0C0C0'), ('Pink', '#FFC0CB'), ('Blue', '#0000FF')]
-        for color in colors:
-            cursor.execute('INSERT OR IGNORE INTO colors (color_name, color_code) VALUES (?, ?)', color)
-        
-        # إضافة أنواع منتجات افتراضية
-        types = ['Handbag', 'Wallet', 'Backpack', 'Clutch', 'Shoulder Bag', 'Tote Bag']
-        for ptype in types:
-            cursor.execute('INSERT OR IGNORE INTO product_types (type_name) VALUES (?)', (ptype,))
-        
-        # إضافة مورد افتراضي
-        cursor.execute('INSERT OR IGNORE INTO suppliers (supplier_name, contact_phone) VALUES (?, ?)', 
-                      ('Default Supplier', '01000000000'))
-        
-        # إضافة Tags افتراضية
-        default_tags = [
-            ('Small', 'size', '#28a745', 'Small size products'),
-            ('Medium', 'size', '#ffc107', 'Medium size products'),
-            ('Large', 'size', '#fd7e14', 'Large size products'),
-            ('XL', 'size', '#dc3545', 'Extra Large size products'),
-            ('Sale', 'status', '#dc3545', 'Products on sale'),
-            ('New Arrival', 'status', '#28a745', 'New products'),
-            ('Limited Edition', 'status', '#6f42c1', 'Limited edition products'),
-            ('Valentine\'s', 'occasion', '#e83e8c', 'Valentine\'s Day collection'),
-            ('Christmas', 'occasion', '#dc3545', 'Christmas collection'),
-            ('Summer', 'season', '#fd7e14', 'Summer collection'),
-            ('Winter', 'season', '#6c757d', 'Winter collection'),
-            ('Leather', 'material', '#8B4513', 'Leather products'),
-            ('Canvas', 'material', '#6c757d', 'Canvas products'),
-            ('Casual', 'style', '#17a2b8', 'Casual style'),
-            ('Formal', 'style', '#343a40', 'Formal style')
-        ]
-        
-        for tag in default_tags:
-            cursor.execute('INSERT OR IGNORE INTO tags (tag_name, tag_category, tag_color, description) VALUES (?, ?, ?, ?)', tag)
-        
-        conn.commit()
-        conn.close()
+        def write(conn):
+            cursor = conn.cursor()
+        
+            # إضافة فئات التجار
+            categories = [('L', 'Category L', 'Trader Category L'), 
+                         ('F', 'Category F', 'Trader Category F')]
+            for cat in categories:
+                cursor.execute('INSERT OR IGNORE INTO trader_categories (category_code, category_name, description) VALUES (?, ?, ?)', cat)
+        
+            # إضافة براندات افتراضية
+            brands = ['Saint Laurent', 'Gucci', 'Louis Vuitton', 'Guess', 'Tommy Hilfiger', 'Karl Lagerfeld']
+            for brand in brands:
+                cursor.execute('INSERT OR IGNORE INTO brands (brand_name) VALUES (?)', (brand,))
+        
+            # إضافة ألوان افتراضية
+            colors = [('Black', '#000000'), ('Brown', '#8B4513'), ('Red', '#FF0000'), 
+                     ('White', '#FFFFFF'), ('Beige', '#F5F5DC'), ('Navy', '#000080'),
+                     ('Gold', '#FFD700'), ('Silver', '#C0C0C0'), ('Pink', '#FFC0CB'), ('Blue', '#0000FF')]
+            for color in colors:
+                cursor.execute('INSERT OR IGNORE INTO colors (color_name, color_code) VALUES (?, ?)', color)
+        
+            # إضافة أنواع منتجات افتراضية
+            types = ['Handbag', 'Wallet', 'Backpack', 'Clutch', 'Shoulder Bag', 'Tote Bag']
+            for ptype in types:
+                cursor.execute('INSERT OR IGNORE INTO product_types (type_name) VALUES (?)', (ptype,))
+        
+            # إضافة مورد افتراضي
+            cursor.execute('INSERT OR IGNORE INTO suppliers (supplier_name, contact_phone) VALUES (?, ?)', 
+                          ('Default Supplier', '01000000000'))
+        
+            # إضافة Tags افتراضية
+            default_tags = [
+                ('Small', 'size', '#28a745', 'Small size products'),
+                ('Medium', 'size', '#ffc107', 'Medium size products'),
+                ('Large', 'size', '#fd7e14', 'Large size products'),
+                ('XL', 'size', '#dc3545', 'Extra Large size products'),
+                ('Sale', 'status', '#dc3545', 'Products on sale'),
+                ('New Arrival', 'status', '#28a745', 'New products'),
+                ('Limited Edition', 'status', '#6f42c1', 'Limited edition products'),
+                ('Valentine\'s', 'occasion', '#e83e8c', 'Valentine\'s Day collection'),
+                ('Christmas', 'occasion', '#dc3545', 'Christmas collection'),
+                ('Summer', 'season', '#fd7e14', 'Summer collection'),
+                ('Winter', 'season', '#6c757d', 'Winter collection'),
+                ('Leather', 'material', '#8B4513', 'Leather products'),
+                ('Canvas', 'material', '#6c757d', 'Canvas products'),
+                ('Casual', 'style', '#17a2b8', 'Casual style'),
+                ('Formal', 'style', '#343a40', 'Formal style')
+            ]
+        
+            for tag in default_tags:
+                cursor.execute('INSERT OR IGNORE INTO tags (tag_name, tag_category, tag_color, description) VALUES (?, ?, ?, ?)', tag)
+        
+        self.run_write(write)
+        self.reference_cache.invalidate()
         print("✅ Default data with enhanced tags added!")
     
+    # الكتابة على الجداول المرجعية (عبر الكاتب الواحد ثم تحديث الـ cache)
+    def _write_reference(self, table_name, sql, params):
+        """False عند الخطأ (مثلاً اسم مكرر)"""
+        try:
+            self.run_write(lambda conn: conn.cursor().execute(sql, params))
+        except Exception:
+            return False
+        self.reference_cache.invalidate(table_name)
+        return True
+    
+    def _delete_reference(self, table_name, row_id, usage_sql, in_use_message, deleted_message):
+        """حذف صف غير مستخدم - الفحص والحذف في نفس transaction الكتابة"""
+        def write(conn):
+            cursor = conn.cursor()
+            cursor.execute(usage_sql, (row_id,))
+            if cursor.fetchone()[0] > 0:
+                return False
+            cursor.execute(f'DELETE FROM {table_name} WHERE id = ?', (row_id,))
+            return True
+        
+        try:
+            deleted = self.run_write(write)
+        except Exception as e:
+            return False, str(e)
+        if not deleted:
+            return False, in_use_message
+        self.reference_cache.invalidate(table_name)
+        return True, deleted_message
+    
     # وظائف إدارة البراندات
     def get_all_brands(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM brands ORDER BY brand_name')
-        brands = cursor.fetchall()
-        conn.close()
-        return brands
+        return self.reference_cache.rows('brands')
     
     def add_brand(self, brand_name):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO brands (brand_name) VALUES (?)', (brand_name,))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('brands', 'INSERT INTO brands (brand_name) VALUES (?)',
+                                     (brand_name,))
     
     def update_brand(self, brand_id, new_name):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('UPDATE brands SET brand_name = ? WHERE id = ?', (new_name, brand_id))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('brands', 'UPDATE brands SET brand_name = ? WHERE id = ?',
+                                     (new_name, brand_id))
     
     def delete_brand(self, brand_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT COUNT(*) FROM base_products WHERE brand_id = ?', (brand_id,))
-            count = cursor.fetchone()[0]
-            
-            if count > 0:
-                conn.close()
-                return False, "Cannot delete brand - it's used by existing products"
-            
-            cursor.execute('DELETE FROM brands WHERE id = ?', (brand_id,))
-            conn.commit()
-            conn.close()
-            return True, "Brand deleted successfully"
-        except Exception as e:
-            conn.close()
-            return False, str(e)
+        return self._delete_reference('brands', brand_id,
+                                      'SELECT COUNT(*) FROM base_products WHERE brand_id = ?',
+                                      "Cannot delete brand - it's used by existing products",
+                                      "Brand deleted successfully")
     
     def get_brand_by_id(self, brand_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM brands WHERE id = ?', (brand_id,))
-        brand = cursor.fetchone()
-        conn.close()
-        return brand
+        return self.reference_cache.get('brands', brand_id)
     
     # وظائف إدارة الألوان
     def get_all_colors(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM colors ORDER BY color_name')
-        colors = cursor.fetchall()
-        conn.close()
-        return colors
+        return self.reference_cache.rows('colors')
     
     def add_color(self, color_name, color_code='#FFFFFF'):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO colors (color_name, color_code) VALUES (?, ?)', (color_name, color_code))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('colors', 'INSERT INTO colors (color_name, color_code) VALUES (?, ?)',
+                                     (color_name, color_code))
     
     def update_color(self, color_id, new_name, new_code):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('UPDATE colors SET color_name = ?, color_code = ? WHERE id = ?', 
-                          (new_name, new_code, color_id))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('colors', 'UPDATE colors SET color_name = ?, color_code = ? WHERE id = ?',
+                                     (new_name, new_code, color_id))
     
     def delete_color(self, color_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT COUNT(*) FROM product_variants WHERE color_id = ?', (color_id,))
-            count = cursor.fetchone()[0]
-            
-            if count > 0:
-                conn.close()
-                return False, "Cannot delete color - it's used by existing products"
-            
-            cursor.execute('DELETE FROM colors WHERE id = ?', (color_id,))
-            conn.commit()
-            conn.close()
-            return True, "Color deleted successfully"
-        except Exception as e:
-            conn.close()
-            return False, str(e)
+        return self._delete_reference('colors', color_id,
+                                      'SELECT COUNT(*) FROM product_variants WHERE color_id = ?',
+                                      "Cannot delete color - it's used by existing products",
+                                      "Color deleted successfully")
     
     def get_color_by_id(self, color_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM colors WHERE id = ?', (color_id,))
-        color = cursor.fetchone()
-        conn.close()
-        return color
+        return self.reference_cache.get('colors', color_id)
     
     def get_color_name_by_id(self, color_id):
         """جلب اسم اللون بالـ ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT color_name FROM colors WHERE id = ?', (color_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        color = self.reference_cache.get('colors', color_id)
+        return color[1] if color else None
     
     # وظائف إدارة أنواع المنتجات
     def get_all_product_types(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM product_types ORDER BY type_name')
-        types = cursor.fetchall()
-        conn.close()
-        return types
+        return self.reference_cache.rows('product_types')
     
     def add_product_type(self, type_name):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO product_types (type_name) VALUES (?)', (type_name,))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('product_types', 'INSERT INTO product_types (type_name) VALUES (?)',
+                                     (type_name,))
     
     def update_product_type(self, type_id, new_name):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('UPDATE product_types SET type_name = ? WHERE id = ?', (new_name, type_id))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('product_types', 'UPDATE product_types SET type_name = ? WHERE id = ?',
+                                     (new_name, type_id))
     
     def delete_product_type(self, type_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT COUNT(*) FROM base_products WHERE product_type_id = ?', (type_id,))
-            count = cursor.fetchone()[0]
-            
-            if count > 0:
-                conn.close()
-                return False, "Cannot delete product type - it's used by existing products"
-            
-            cursor.execute('DELETE FROM product_types WHERE id = ?', (type_id,))
-            conn.commit()
-            conn.close()
-            return True, "Product type deleted successfully"
-        except Exception as e:
-            conn.close()
-            return False, str(e)
+        return self._delete_reference('product_types', type_id,
+                                      'SELECT COUNT(*) FROM base_products WHERE product_type_id = ?',
+                                      "Cannot delete product type - it's used by existing products",
+                                      "Product type deleted successfully")
     
     def get_product_type_by_id(self, type_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM product_types WHERE id = ?', (type_id,))
-        ptype = cursor.fetchone()
-        conn.close()
-        return ptype
+        return self.reference_cache.get('product_types', type_id)
     
     # وظائف إدارة فئات التجار
     def get_all_trader_categories(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM trader_categories ORDER BY category_code')
-        categories = cursor.fetchall()
-        conn.close()
-        return categories
+        return self.reference_cache.rows('trader_categories')
 
     def add_trader_category(self, category_code, category_name, description=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO trader_categories (category_code, category_name, description) VALUES (?, ?, ?)',
-                           (category_code, category_name, description))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('trader_categories', 'INSERT INTO trader_categories (category_code, category_name, description) VALUES (?, ?, ?)',
+                                     (category_code, category_name, description))
 
     def update_trader_category(self, category_id, new_code, new_name, new_description):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('UPDATE trader_categories SET category_code = ?, category_name = ?, description = ? WHERE id = ?',
-                           (new_code, new_name, new_description, category_id))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('trader_categories', 'UPDATE trader_categories SET category_code = ?, category_name = ?, description = ? WHERE id = ?',
+                                     (new_code, new_name, new_description, category_id))
 
     def delete_trader_category(self, category_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT COUNT(*) FROM base_products WHERE trader_category = (SELECT category_code FROM trader_categories WHERE id = ?)', (category_id,))
-            count = cursor.fetchone()[0]
-            
-            if count > 0:
-                conn.close()
-                return False, "Cannot delete category - it's used by existing products"
-            
-            cursor.execute('DELETE FROM trader_categories WHERE id = ?', (category_id,))
-            conn.commit()
-            conn.close()
-            return True, "Category deleted successfully"
-        except Exception as e:
-            conn.close()
-            return False, str(e)
+        return self._delete_reference('trader_categories', category_id,
+                                      'SELECT COUNT(*) FROM base_products WHERE trader_category = (SELECT category_code FROM trader_categories WHERE id = ?)',
+                                      "Cannot delete category - it's used by existing products",
+                                      "Category deleted successfully")
 
     def get_trader_category_by_id(self, category_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM trader_categories WHERE id = ?', (category_id,))
-        category = cursor.fetchone()
-        conn.close()
-        return category
+        return self.reference_cache.get('trader_categories', category_id)
 
     # وظائف إدارة Tags
     def get_all_tags(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tags ORDER BY tag_category, tag_name')
-        tags = cursor.fetchall()
-        conn.close()
-        return tags
+        return self.reference_cache.rows('tags')
     
     def get_tags_by_category(self, category=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        # الـ Tags في الـ cache مرتبة بـ (tag_category, tag_name)
+        tags = self.reference_cache.rows('tags')
         if category:
-            cursor.execute('SELECT * FROM tags WHERE tag_category = ? ORDER BY tag_name', (category,))
-        else:
-            cursor.execute('SELECT DISTINCT tag_category FROM tags ORDER BY tag_category')
-        tags = cursor.fetchall()
-        conn.close()
-        return tags
+            return [tag for tag in tags if tag[2] == category]
+        categories = []
+        for tag in tags:
+            if not categories or categories[-1][0] != tag[2]:
+                categories.append((tag[2],))
+        return categories
     
     def add_tag(self, tag_name, tag_category='general', tag_color='#6c757d', description=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO tags (tag_name, tag_category, tag_color, description) VALUES (?, ?, ?, ?)',
-                           (tag_name, tag_category, tag_color, description))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('tags', 'INSERT INTO tags (tag_name, tag_category, tag_color, description) VALUES (?, ?, ?, ?)',
+                                     (tag_name, tag_category, tag_color, description))
     
     def update_tag(self, tag_id, new_name, new_category, new_color, new_description):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('UPDATE tags SET tag_name = ?, tag_category = ?, tag_color = ?, description = ? WHERE id = ?',
-                           (new_name, new_category, new_color, new_description, tag_id))
-            conn.commit()
-            conn.close()
-            return True
-        except:
-            conn.close()
-            return False
+        return self._write_reference('tags', 'UPDATE tags SET tag_name = ?, tag_category = ?, tag_color = ?, description = ? WHERE id = ?',
+                                     (new_name, new_category, new_color, new_description, tag_id))
     
     def delete_tag(self, tag_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT COUNT(*) FROM product_tags WHERE tag_id = ?', (tag_id,))
-            count = cursor.fetchone()[0]
-            
-            if count > 0:
-                conn.close()
-                return False, "Cannot delete tag - it's used by existing products"
-            
-            cursor.execute('DELETE FROM tags WHERE id = ?', (tag_id,))
-            conn.commit()
-            conn.close()
-            return True, "Tag deleted successfully"
-        except Exception as e:
-            conn.close()
-            return False, str(e)
+        return self._delete_reference('tags', tag_id,
+                                      'SELECT COUNT(*) FROM product_tags WHERE tag_id = ?',
+                                      "Cannot delete tag - it's used by existing products",
+                                      "Tag deleted successfully")
     
     def get_tag_by_id(self, tag_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tags WHERE id = ?', (tag_id,))
-        tag = cursor.fetchone()
-        conn.close()
-        return tag
+        return self.reference_cache.get('tags', tag_id)
     
     def add_product_tags(self, product_id, tag_ids):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
+        def write(conn):
+            cursor = conn.cursor()
             cursor.execute('DELETE FROM product_tags WHERE product_id = ?', (product_id,))
             
             for tag_id in tag_ids:
                 cursor.execute('INSERT INTO product_tags (product_id, tag_id) VALUES (?, ?)', 
                               (product_id, tag_id))
-            
-            conn.commit()
-            conn.close()
+        
+        try:
+            self.run_write(write)
             return True
         except Exception as e:
-            conn.close()
             return False
     
     def get_product_tags(self, product_id):
@@ -736,10 +607,8 @@ class StockDatabase:
                                      trader_category, product_size, wholesale_price, retail_price, 
                                      color_ids, tag_ids=None, initial_stock=0, supplier_id=1):
         """إضافة منتج أساسي مع متغيرات الألوان والمقاس والـ Tags"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        def write(conn):
+            cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO base_products (product_code, brand_id, product_type_id, 
                                          trader_category, product_size, wholesale_price, retail_price, supplier_id)
@@ -761,12 +630,11 @@ class StockDatabase:
                         INSERT INTO product_tags (product_id, tag_id)
                         VALUES (?, ?)
                     ''', (base_product_id, tag_id))
-            
-            conn.commit()
-            conn.close()
-            return True, base_product_id
+            return base_product_id
+        
+        try:
+            return True, self.run_write(write)
         except Exception as e:
-            conn.close()
             return False, str(e)
     
     def get_all_products_with_details(self):
@@ -804,6 +672,91 @@ class StockDatabase:
         conn.close()
         return products
     
+    def get_dashboard_stats(self):
+        """إحصائيات الصفحة الرئيسية من صف dashboard_stats
+        
+        يتم إعادة الحساب بـ aggregate queries فقط إذا تغيرت البيانات منذ آخر
+        حساب (الـ triggers تزيد version مع كل كتابة). القيم المحسوبة تُعرض
+        مباشرة وتُحفظ عبر الكاتب بدون انتظار - مسار القراءة لا يكتب ولا ينتظر
+        الـ lock.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT version, computed_version, total_products, total_stock_value, low_stock_items,
+                   brands_count, colors_count, types_count, categories_count, tags_count
+            FROM dashboard_stats WHERE id = 1
+        ''')
+        row = cursor.fetchone()
+        if row is None:
+            # الصف غير موجود (مثلاً حُذف مع استعادة قديمة) - يُحسب ويُعاد إنشاؤه
+            # بالقيم الافتراضية version = 1 و computed_version = 0
+            row = (1, 0)
+        
+        if row[0] != row[1]:
+            version = row[0]
+            # نفس منطق الحساب القديم: قيمة المخزون بسعر الجملة، والمخزون المنخفض
+            # هو إجمالي مخزون المنتج غير صفر وأقل من 5
+            cursor.execute('''
+                SELECT
+                    COUNT(bp.id),
+                    COALESCE(SUM(COALESCE(bp.wholesale_price, 0) * COALESCE(stock.total_stock, 0)), 0),
+                    COALESCE(SUM(CASE WHEN stock.total_stock <> 0 AND stock.total_stock < 5 THEN 1 ELSE 0 END), 0),
+                    (SELECT COUNT(*) FROM brands),
+                    (SELECT COUNT(*) FROM colors),
+                    (SELECT COUNT(*) FROM product_types),
+                    (SELECT COUNT(*) FROM trader_categories),
+                    (SELECT COUNT(*) FROM tags)
+                FROM base_products bp
+                LEFT JOIN (
+                    SELECT base_product_id, SUM(current_stock) AS total_stock
+                    FROM product_variants
+                    GROUP BY base_product_id
+                ) stock ON stock.base_product_id = bp.id
+            ''')
+            values = tuple(cursor.fetchone())
+            row = (version, version) + values
+            conn.close()
+            self._store_dashboard_stats(version, values)
+        else:
+            conn.close()
+        
+        return {
+            'total_products': row[2] or 0,
+            'total_stock_value': float(row[3] or 0),
+            'low_stock_items': row[4] or 0,
+            'suppliers': 1,
+            'brands_count': row[5] or 0,
+            'colors_count': row[6] or 0,
+            'types_count': row[7] or 0,
+            'categories_count': row[8] or 0,
+            'tags_count': row[9] or 0
+        }
+    
+    def _store_dashboard_stats(self, version, values):
+        """حفظ الإحصائيات المحسوبة - على SQLite في طابور الكاتب بدون انتظار"""
+        def store(conn):
+            # لو حصلت كتابة أثناء الحساب يبقى version أكبر والصف يظل غير محدث،
+            # ونتيجة حساب أقدم لا تغطي على أحدث منها
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO dashboard_stats (id) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM dashboard_stats)')
+            cursor.execute('''
+                UPDATE dashboard_stats SET
+                    computed_version = ?, total_products = ?, total_stock_value = ?, low_stock_items = ?,
+                    brands_count = ?, colors_count = ?, types_count = ?, categories_count = ?, tags_count = ?,
+                    updated_date = ?
+                WHERE id = 1 AND computed_version < ?
+            ''', (version,) + values + (datetime.now().isoformat(sep=' ', timespec='seconds'), version))
+        
+        try:
+            if self.writer is not None:
+                self.writer.submit(store)
+            else:
+                self.run_write(store)
+        except Exception as e:
+            print(f"⚠️ فشل حفظ إحصائيات الـ Dashboard: {e}")
+    
     def check_product_exists(self, product_code, brand_id, trader_category):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -817,77 +770,6 @@ class StockDatabase:
         conn.close()
         return result is not None
     
-    def search_products(self, search_term=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if search_term:
-            search_term = f'%{search_term}%'
-            cursor.execute('''
-                SELECT DISTINCT
-                    bp.id,
-                    bp.product_code,
-                    b.brand_name,
-                    pt.type_name,
-                    bp.trader_category,
-                    bp.product_size,
-                    bp.wholesale_price,
-                    bp.retail_price,
-                    s.supplier_name,
-                    GROUP_CONCAT(DISTINCT c.color_name) as colors,
-                    SUM(pv.current_stock) as total_stock,
-                    bp.created_date,
-                    GROUP_CONCAT(DISTINCT t.tag_name) as tags
-                FROM base_products bp
-                LEFT JOIN brands b ON bp.brand_id = b.id
-                LEFT JOIN product_types pt ON bp.product_type_id = pt.id
-                LEFT JOIN suppliers s ON bp.supplier_id = s.id
-                LEFT JOIN product_variants pv ON bp.id = pv.base_product_id
-                LEFT JOIN colors c ON pv.color_id = c.id
-                LEFT JOIN product_tags ptags ON bp.id = ptags.product_id
-                LEFT JOIN tags t ON ptags.tag_id = t.id
-                WHERE bp.product_code LIKE ? 
-                   OR b.brand_name LIKE ?
-                   OR c.color_name LIKE ?
-                   OR bp.trader_category LIKE ?
-                   OR pt.type_name LIKE ?
-                   OR bp.product_size LIKE ?
-                   OR t.tag_name LIKE ?
-                GROUP BY bp.id
-                ORDER BY bp.created_date DESC
-            ''', (search_term, search_term, search_term, search_term, search_term, search_term, search_term))
-        else:
-            cursor.execute('''
-                SELECT 
-                    bp.id,
-                    bp.product_code,
-                    b.brand_name,
-                    pt.type_name,
-                    bp.trader_category,
-                    bp.product_size,
-                    bp.wholesale_price,
-                    bp.retail_price,
-                    s.supplier_name,
-                    GROUP_CONCAT(DISTINCT c.color_name) as colors,
-                    SUM(pv.current_stock) as total_stock,
-                    bp.created_date,
-                    GROUP_CONCAT(DISTINCT t.tag_name) as tags
-                FROM base_products bp
-                LEFT JOIN brands b ON bp.brand_id = b.id
-                LEFT JOIN product_types pt ON bp.product_type_id = pt.id
-                LEFT JOIN suppliers s ON bp.supplier_id = s.id
-                LEFT JOIN product_variants pv ON bp.id = pv.base_product_id
-                LEFT JOIN colors c ON pv.color_id = c.id
-                LEFT JOIN product_tags ptags ON bp.id = ptags.product_id
-                LEFT JOIN tags t ON ptags.tag_id = t.id
-                GROUP BY bp.id
-                ORDER BY bp.created_date DESC
-            ''')
-        
-        products = cursor.fetchall()
-        conn.close()
-        return products
-    
     def get_product_details(self, product_id):
         """جلب تفاصيل منتج واحد مع مخزون كل لون والمقاس والـ Tags"""
         conn = self.get_connection()
@@ -914,7 +796,7 @@ class StockDatabase:
         cursor.execute('''
             SELECT 
                 pv.id as variant_id, c.id as color_id, c.color_name, c.color_code,
-                pv.current_stock, ci.image_url, ci.image_filename
+                pv.current_stock, ci.image_url, ci.image_filename, ci.image_variants
             FROM product_variants pv
             JOIN colors c ON pv.color_id = c.id
             LEFT JOIN color_images ci ON pv.id = ci.variant_id
@@ -938,38 +820,32 @@ class StockDatabase:
         }
     
     def delete_product(self, product_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        def write(conn):
+            cursor = conn.cursor()
             cursor.execute('DELETE FROM product_tags WHERE product_id = ?', (product_id,))
+            # صور المتغيرات أولاً حتى ينقص ref_count الـ blobs
+            cursor.execute('''
+                DELETE FROM color_images
+                WHERE variant_id IN (SELECT id FROM product_variants WHERE base_product_id = ?)
+            ''', (product_id,))
             cursor.execute('DELETE FROM product_variants WHERE base_product_id = ?', (product_id,))
             cursor.execute('DELETE FROM base_products WHERE id = ?', (product_id,))
-            
-            conn.commit()
-            conn.close()
+        
+        try:
+            self.run_write(write)
             return True, "Product deleted successfully"
         except Exception as e:
-            conn.close()
             return False, str(e)
     
     # وظائف إدارة الصور المحدثة
     def add_color_image(self, variant_id, image_url, image_filename=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        row = (variant_id, image_url, image_filename, variants_json(find_variants(image_url)))
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO color_images (variant_id, image_url, image_filename)
-                VALUES (?, ?, ?)
-            ''', (variant_id, image_url, image_filename))
-            
-            conn.commit()
-            conn.close()
+            # upsert + ربط الـ blob (ref_count يُحدث بالـ triggers)
+            self.run_write(lambda conn: link_color_images(conn.cursor(), [row]))
             return True
         except Exception as e:
             print(f"Error adding color image: {e}")
-            conn.close()
             return False
     
     def get_product_images_with_details(self, product_id):
@@ -1016,65 +892,143 @@ class StockDatabase:
         
         return result[0] if result else None
     
+    # ترتيب ثابت لقوائم المنتجات (الـ id يفصل بين المنتجات بنفس التاريخ)
+    PRODUCT_SORT = ['bp.created_date', 'bp.id']
+    # مع فهرس البحث: كود المنتج المطابق أولاً ثم الأحدث
+    PRODUCT_SEARCH_SORT = ['ps.search_rank', 'bp.created_date', 'bp.id']
+    
     def get_products_with_color_images(self, search_term=''):
+        match_query = self._search_match_query(search_term)
+        sort = self.PRODUCT_SEARCH_SORT if match_query else self.PRODUCT_SORT
+        products, _ = self._query_products_with_color_images(
+            search_term, order=order_by(sort, descending=True), match_query=match_query
+        )
+        return products
+    
+    def get_products_page(self, search_term='', cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        """صفحة واحدة من المنتجات مع الصور (keyset pagination بالأحدث أولاً)"""
+        match_query = self._search_match_query(search_term)
+        sort = self.PRODUCT_SEARCH_SORT if match_query else self.PRODUCT_SORT
+        
+        direction, key = decode_cursor(cursor)
+        before = direction == 'before'
+        keyset = keyset_condition(sort, key, descending=True, before=before) if key else None
+        
+        products, ranks = self._query_products_with_color_images(
+            search_term, keyset,
+            order_by(sort, descending=True, before=before),
+            limit=page_size + 1,
+            match_query=match_query
+        )
+        if match_query:
+            key_of = lambda product: [ranks[product[0]], product[9], product[0]]
+        else:
+            key_of = lambda product: [product[9], product[0]]
+        return build_page(products, page_size, direction, key_of)
+    
+    def _search_match_query(self, search_term):
+        """استعلام الفهرس النصي لنص البحث، أو None للرجوع لبحث LIKE
+        
+        (الفهرس يطابق بداية الكلمات فقط، فإذا لم يجد شيئاً نستخدم LIKE
+        الذي يطابق أي جزء من النص. مع وجود نتائج، search_join يضيف لها
+        الأكواد التي تحتوي النص في أي مكان)
+        """
+        if not search_term or not self.search_index_available:
+            return None
+        match_query = build_match_query(self.db_type, search_term)
+        if not match_query:
+            return None
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            found = has_matches(self.db_type, cursor, match_query)
+        except Exception as e:
+            print(f"⚠️ خطأ في فهرس البحث - سيتم استخدام LIKE: {e}")
+            found = False
+        conn.close()
+        return match_query if found else None
+    
+    def _query_products_with_color_images(self, search_term='', keyset=None,
+                                          order='bp.created_date DESC, bp.id DESC', limit=None,
+                                          match_query=None):
+        """يرجع (المنتجات، {product_id: search_rank}) - الـ ranks فارغة بدون match_query"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        if search_term:
+        conditions = []
+        params = []
+        if keyset and keyset[0]:
+            conditions.append(keyset[0])
+            params.extend(keyset[1])
+        
+        rank_column = ''
+        if match_query:
+            rank_column = ', ps.search_rank'
+            joins = search_join(self.db_type)
+            term = search_term.strip()
+            params = [term, term, match_query, term, term, term] + params
+            search_term = ''
+        elif search_term:
             search_term = f'%{search_term}%'
-            cursor.execute('''
-                SELECT DISTINCT
-                    bp.id, bp.product_code, b.brand_name, pt.type_name,
-                    bp.trader_category, bp.product_size, bp.wholesale_price, bp.retail_price,
-                    s.supplier_name, bp.created_date
-                FROM base_products bp
-                LEFT JOIN brands b ON bp.brand_id = b.id
-                LEFT JOIN product_types pt ON bp.product_type_id = pt.id
-                LEFT JOIN suppliers s ON bp.supplier_id = s.id
+            conditions.append('''(bp.product_code LIKE ? OR b.brand_name LIKE ? OR c.color_name LIKE ? 
+                   OR bp.product_size LIKE ? OR t.tag_name LIKE ?)''')
+            params.extend([search_term] * 5)
+            joins = '''
                 LEFT JOIN product_variants pv ON bp.id = pv.base_product_id
                 LEFT JOIN colors c ON pv.color_id = c.id
                 LEFT JOIN product_tags ptags ON bp.id = ptags.product_id
-                LEFT JOIN tags t ON ptags.tag_id = t.id
-                WHERE bp.product_code LIKE ? OR b.brand_name LIKE ? OR c.color_name LIKE ? 
-                   OR bp.product_size LIKE ? OR t.tag_name LIKE ?
-                ORDER BY bp.created_date DESC
-            ''', (search_term, search_term, search_term, search_term, search_term))
+                LEFT JOIN tags t ON ptags.tag_id = t.id'''
         else:
-            cursor.execute('''
-                SELECT 
-                    bp.id, bp.product_code, b.brand_name, pt.type_name,
-                    bp.trader_category, bp.product_size, bp.wholesale_price, bp.retail_price,
-                    s.supplier_name, bp.created_date
-                FROM base_products bp
-                LEFT JOIN brands b ON bp.brand_id = b.id
-                LEFT JOIN product_types pt ON bp.product_type_id = pt.id
-                LEFT JOIN suppliers s ON bp.supplier_id = s.id
-                ORDER BY bp.created_date DESC
-            ''')
+            joins = ''
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        limit_clause = f'LIMIT {int(limit)}' if limit else ''
+        cursor.execute(f'''
+            SELECT {'DISTINCT' if search_term else ''}
+                bp.id, bp.product_code, b.brand_name, pt.type_name,
+                bp.trader_category, bp.product_size, bp.wholesale_price, bp.retail_price,
+                s.supplier_name, bp.created_date{rank_column}
+            FROM base_products bp
+            LEFT JOIN brands b ON bp.brand_id = b.id
+            LEFT JOIN product_types pt ON bp.product_type_id = pt.id
+            LEFT JOIN suppliers s ON bp.supplier_id = s.id{joins}
+            {where}
+            ORDER BY {order}
+            {limit_clause}
+        ''', params)
         
         products = cursor.fetchall()
+        ranks = {}
+        if match_query:
+            ranks = {product[0]: product[10] for product in products}
+            products = [product[:10] for product in products]
+        
+        # تحميل المتغيرات والـ Tags لكل المنتجات مرة واحدة بدل استعلامين لكل منتج
+        product_ids = [product[0] for product in products] if (search_term or match_query or limit) else None
+        variants_by_product = self._load_variants_by_product(cursor, product_ids, '''
+            SELECT 
+                pv.base_product_id,
+                pv.id as variant_id,
+                c.color_name,
+                c.color_code,
+                pv.current_stock,
+                ci.image_url,
+                ci.image_variants
+            FROM product_variants pv
+            JOIN colors c ON pv.color_id = c.id
+            LEFT JOIN color_images ci ON pv.id = ci.variant_id
+            {where}
+            ORDER BY pv.base_product_id, pv.current_stock DESC, pv.id
+        ''')
+        tags_by_product = self._load_tags_by_product(cursor, product_ids)
+        conn.close()
         
         products_with_images = []
         for product in products:
-            cursor.execute('''
-                SELECT 
-                    pv.id as variant_id,
-                    c.color_name,
-                    c.color_code,
-                    pv.current_stock,
-                    ci.image_url
-                FROM product_variants pv
-                JOIN colors c ON pv.color_id = c.id
-                LEFT JOIN color_images ci ON pv.id = ci.variant_id
-                WHERE pv.base_product_id = ?
-                ORDER BY pv.current_stock DESC
-            ''', (product[0],))
-            
-            color_data = cursor.fetchall()
+            color_data = variants_by_product.get(product[0], [])
             total_stock = sum([cd[3] for cd in color_data])
             
-            product_tags = self.get_product_tags(product[0])
-            
             colors_with_images = []
             for cd in color_data:
                 colors_with_images.append({
@@ -1082,31 +1036,79 @@ class StockDatabase:
                     'name': cd[1],
                     'code': cd[2],
                     'stock': cd[3],
-                    'image_url': cd[4]
+                    'image_url': cd[4],
+                    'image_variants': cd[5]
                 })
             
-            product_data = list(product) + [colors_with_images, total_stock, product_tags]
+            product_data = list(product) + [colors_with_images, total_stock, tags_by_product.get(product[0], [])]
             products_with_images.append(product_data)
         
-        conn.close()
-        return products_with_images
+        return products_with_images, ranks
+    
+    # تحميل البيانات المرتبطة بالمنتجات على دفعات (بدل N+1 استعلام)
+    IN_LIST_CHUNK_SIZE = 500
+    
+    def _fetch_for_products(self, cursor, product_ids, query, column):
+        """تنفيذ استعلام لمجموعة منتجات - الاستعلام يحتوي على {where}
+        
+        product_ids ممكن يكون:
+        - None: كل المنتجات
+        - (subquery, params): استعلام فرعي يرجع الـ ids (عدد استعلامات ثابت)
+        - قائمة ids: يتم تقسيمها لدفعات حتى لا نتجاوز حد المتغيرات في SQLite
+        """
+        if product_ids is None:
+            cursor.execute(query.format(where=''))
+            return cursor.fetchall()
+        
+        if isinstance(product_ids, tuple):
+            subquery, params = product_ids
+            cursor.execute(query.format(where=f'WHERE {column} IN ({subquery})'), params)
+            return cursor.fetchall()
+        
+        rows = []
+        for start in range(0, len(product_ids), self.IN_LIST_CHUNK_SIZE):
+            chunk = product_ids[start:start + self.IN_LIST_CHUNK_SIZE]
+            placeholders = ', '.join(['?'] * len(chunk))
+            cursor.execute(query.format(where=f'WHERE {column} IN ({placeholders})'), chunk)
+            rows.extend(cursor.fetchall())
+        return rows
+    
+    def _load_variants_by_product(self, cursor, product_ids, query):
+        """تجميع صفوف المتغيرات حسب المنتج - أول عمود في الاستعلام هو base_product_id"""
+        variants_by_product = {}
+        for row in self._fetch_for_products(cursor, product_ids, query, 'pv.base_product_id'):
+            variants_by_product.setdefault(row[0], []).append(tuple(row[1:]))
+        return variants_by_product
+    
+    def _load_tags_by_product(self, cursor, product_ids):
+        """Tags كل المنتجات المطلوبة في استعلام واحد - نفس شكل get_product_tags"""
+        rows = self._fetch_for_products(cursor, product_ids, '''
+            SELECT pt.product_id, t.* FROM tags t
+            JOIN product_tags pt ON t.id = pt.tag_id
+            {where}
+            ORDER BY pt.product_id, t.tag_category, t.tag_name
+        ''', 'pt.product_id')
+        tags_by_product = {}
+        for row in rows:
+            tags_by_product.setdefault(row[0], []).append(tuple(row[1:]))
+        return tags_by_product
 
     # وظائف إضافة منتجات متعددة دفعة واحدة
     def add_multiple_products_batch(self, products_data):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         success_count = 0
         failed_products = []
         
-        try:
+        def write(conn):
+            nonlocal success_count
+            cursor = conn.cursor()
             for product_data in products_data:
                 try:
-                    if self.check_product_exists(
-                        product_data['product_code'], 
-                        product_data['brand_id'], 
-                        product_data['trader_category']
-                    ):
+                    # الفحص على اتصال الكاتب حتى يرى منتجات نفس الدفعة
+                    cursor.execute('''
+                        SELECT id FROM base_products 
+                        WHERE product_code = ? AND brand_id = ? AND trader_category = ?
+                    ''', (product_data['product_code'], product_data['brand_id'], product_data['trader_category']))
+                    if cursor.fetchone() is not None:
                         failed_products.append({
                             'product': product_data,
                             'error': 'Product already exists'
@@ -1151,9 +1153,9 @@ class StockDatabase:
                         'error': str(e)
                     })
                     continue
-            
-            conn.commit()
-            conn.close()
+        
+        try:
+            self.run_write(write)
             
             return {
                 'success': True,
@@ -1163,8 +1165,6 @@ class StockDatabase:
             }
             
         except Exception as e:
-            conn.rollback()
-            conn.close()
             return {
                 'success': False,
                 'error': str(e),
@@ -1173,65 +1173,105 @@ class StockDatabase:
             }
 
 
+    # ترتيب صفحة الجرد: البراند ثم الكود ثم الـ id لضمان ترتيب ثابت
+    INVENTORY_SORT = ["COALESCE(b.brand_name, '')", 'bp.product_code', 'bp.id']
+    
     def get_all_products_for_inventory(self, search_term='', brand_filter='', category_filter=''):
         """جلب جميع المنتجات للجرد الشامل مع تفاصيل كل لون والصور"""
+        return self._query_inventory(search_term, brand_filter, category_filter)
+    
+    def get_inventory_page(self, search_term='', brand_filter='', category_filter='',
+                           cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        """صفحة واحدة من الجرد (keyset pagination بالبراند ثم كود المنتج)"""
+        direction, key = decode_cursor(cursor)
+        before = direction == 'before'
+        keyset = keyset_condition(self.INVENTORY_SORT, key, descending=False, before=before) if key else None
+        
+        inventory_data = self._query_inventory(
+            search_term, brand_filter, category_filter, keyset,
+            order_by(self.INVENTORY_SORT, descending=False, before=before),
+            limit=page_size + 1
+        )
+        return build_page(inventory_data, page_size, direction,
+                          lambda item: [item['product'][2] or '', item['product'][1], item['product'][0]])
+    
+    def _query_inventory(self, search_term='', brand_filter='', category_filter='', keyset=None,
+                         order="COALESCE(b.brand_name, ''), bp.product_code, bp.id", limit=None):
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        base_query = '''
-            SELECT 
-                bp.id, bp.product_code, b.brand_name, pt.type_name,
-                bp.trader_category, bp.product_size, bp.wholesale_price, 
-                bp.retail_price, bp.created_date
-            FROM base_products bp
-            LEFT JOIN brands b ON bp.brand_id = b.id
-            LEFT JOIN product_types pt ON bp.product_type_id = pt.id
-            WHERE 1=1
-        '''
-        
+        filters = ''
         params = []
         
         if search_term:
-            base_query += ' AND (bp.product_code LIKE ? OR b.brand_name LIKE ? OR bp.product_size LIKE ?)'
+            filters += ' AND (bp.product_code LIKE ? OR b.brand_name LIKE ? OR bp.product_size LIKE ?)'
             search_param = f'%{search_term}%'
             params.extend([search_param, search_param, search_param])
         
         if brand_filter:
-            base_query += ' AND b.brand_name = ?'
+            filters += ' AND b.brand_name = ?'
             params.append(brand_filter)
         
         if category_filter:
-            base_query += ' AND bp.trader_category = ?'
+            filters += ' AND bp.trader_category = ?'
             params.append(category_filter)
         
-        base_query += ' ORDER BY b.brand_name, bp.product_code'
+        page_filter = ''
+        page_params = []
+        if keyset and keyset[0]:
+            page_filter = f' AND {keyset[0]}'
+            page_params = keyset[1]
         
-        cursor.execute(base_query, params)
+        limit_clause = f'LIMIT {int(limit)}' if limit else ''
+        cursor.execute(f'''
+            SELECT 
+                bp.id, bp.product_code, b.brand_name, pt.type_name,
+                bp.trader_category, bp.product_size, bp.wholesale_price, 
+                bp.retail_price, bp.created_date
+            FROM base_products bp
+            LEFT JOIN brands b ON bp.brand_id = b.id
+            LEFT JOIN product_types pt ON bp.product_type_id = pt.id
+            WHERE 1=1 {filters}{page_filter}
+            ORDER BY {order}
+            {limit_clause}
+        ''', params + page_params)
         products = cursor.fetchall()
         
+        # استعلام واحد للمتغيرات وواحد للـ Tags مهما كان عدد المنتجات
+        # (نفس الفلتر كاستعلام فرعي بدل قائمة ids، أو ids الصفحة الحالية)
+        product_ids = None
+        if limit:
+            product_ids = [product[0] for product in products]
+        elif params:
+            product_ids = (f'''
+                SELECT bp.id FROM base_products bp
+                LEFT JOIN brands b ON bp.brand_id = b.id
+                WHERE 1=1 {filters}
+            ''', params)
+        variants_by_product = self._load_variants_by_product(cursor, product_ids, '''
+            SELECT pv.base_product_id, pv.id, c.id, c.color_name, c.color_code, pv.current_stock, ci.image_url,
+                   ci.image_variants
+            FROM product_variants pv
+            JOIN colors c ON pv.color_id = c.id
+            LEFT JOIN color_images ci ON pv.id = ci.variant_id
+            {where}
+            ORDER BY pv.base_product_id, c.color_name, pv.id
+        ''')
+        tags_by_product = self._load_tags_by_product(cursor, product_ids)
+        conn.close()
+        
         inventory_data = []
         for product in products:
-            cursor.execute('''
-                SELECT pv.id, c.id, c.color_name, c.color_code, pv.current_stock, ci.image_url
-                FROM product_variants pv
-                JOIN colors c ON pv.color_id = c.id
-                LEFT JOIN color_images ci ON pv.id = ci.variant_id
-                WHERE pv.base_product_id = ?
-                ORDER BY c.color_name
-            ''', (product[0],))
-            
-            color_variants = cursor.fetchall()
+            color_variants = variants_by_product.get(product[0], [])
             total_stock = sum([cv[4] for cv in color_variants])
-            product_tags = self.get_product_tags(product[0])
             
             inventory_data.append({
                 'product': product,
                 'color_variants': color_variants,
                 'total_stock': total_stock,
-                'tags': product_tags
+                'tags': tags_by_product.get(product[0], [])
             })
         
-        conn.close()
         return inventory_data
 
     def get_inventory_summary(self):
@@ -1263,31 +1303,36 @@ class StockDatabase:
 
     def get_brands_for_filter(self):
         """جلب البراندات للفلترة"""
+        return [brand[1] for brand in self.reference_cache.rows('brands')]
+
+    def get_all_product_codes(self):
+        """أكواد المنتجات بدون تكرار (لفلتر التصدير)"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT brand_name FROM brands ORDER BY brand_name')
-        brands = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT DISTINCT product_code FROM base_products ORDER BY product_code')
+        codes = [row['product_code'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
         conn.close()
-        return brands
+        return codes
 
     def get_categories_for_filter(self):
         """جلب فئات التجار للفلترة"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT category_code FROM trader_categories ORDER BY category_code')
-        categories = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return categories
+        return [category[1] for category in self.reference_cache.rows('trader_categories')]
 
+    def update_variant_stock(self, variant_id, new_stock):
+        """تحديث مخزون لون واحد"""
+        def write(conn):
+            conn.cursor().execute('UPDATE product_variants SET current_stock = ? WHERE id = ?',
+                                  (new_stock, variant_id))
+        self.run_write(write)
+    
     def bulk_update_inventory(self, stock_updates):
         """تحديث المخزون بشكل جماعي"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         success_count = 0
         failed_updates = []
         
-        try:
+        def write(conn):
+            nonlocal success_count
+            cursor = conn.cursor()
             for update in stock_updates:
                 try:
                     cursor.execute('''
@@ -1303,9 +1348,9 @@ class StockDatabase:
                         'variant_id': update['variant_id'],
                         'error': str(e)
                     })
-            
-            conn.commit()
-            conn.close()
+        
+        try:
+            self.run_write(write)
             
             return {
                 'success': True,
@@ -1315,8 +1360,6 @@ class StockDatabase:
             }
             
         except Exception as e:
-            conn.rollback()
-            conn.close()
             return {
                 'success': False,
                 'error': str(e)
@@ -1324,246 +1367,29 @@ class StockDatabase:
 
 
     def bulk_add_products_from_excel_enhanced(self, excel_data):
-        """إضافة منتجات من Excel مع تحسين الذاكرة ومعالجة أخطاء البيانات المختلطة"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        success_count = 0
-        failed_products = []
-        processed_products = {}
-        created_brands = []
-        created_colors = []
-        created_types = []
-        
-        # معالجة البيانات في دفعات صغيرة لتوفير الذاكرة
-        BATCH_SIZE = 50
+        """إضافة منتجات من Excel على دفعات set-based - انظر excel_import.py"""
+        from excel_import import import_products
         
         try:
-            for batch_start in range(0, len(excel_data), BATCH_SIZE):
-                batch_end = min(batch_start + BATCH_SIZE, len(excel_data))
-                batch_data = excel_data[batch_start:batch_end]
-                
-                print(f"🔄 معالجة الدفعة {batch_start + 1}-{batch_end} من إجمالي {len(excel_data)}")
-                
-                for index, row in enumerate(batch_data, batch_start + 1):
-                    try:
-                        # تحويل جميع القيم إلى نصوص مع حماية من النوع float
-                        product_code = str(row.get('Product Code', '')).strip()
-                        brand_name = str(row.get('Brand Name', '')).strip()
-                        product_type_name = str(row.get('Product Type', '')).strip()
-                        color_name = str(row.get('Color Name', '')).strip()
-                        category = str(row.get('Category', '')).strip()
-                        size = str(row.get('Size', '')).strip()
-                        
-                        # معالجة الأسعار والأرقام بحذر
-                        try:
-                            wholesale_price = float(row.get('Wholesale Price', 0))
-                            retail_price = float(row.get('Retail Price', 0))
-                            initial_stock = int(row.get('Stock', 0))
-                        except (ValueError, TypeError):
-                            wholesale_price = 0.0
-                            retail_price = 0.0
-                            initial_stock = 0
-                        
-                        tags = str(row.get('Tags', '')).strip()
-                        image_url = str(row.get('Image URL', '')).strip()
-                        
-                        # التحقق من البيانات الأساسية المطلوبة
-                        if not product_code or not brand_name or not color_name:
-                            failed_products.append({
-                                'row': index,
-                                'product_code': product_code,
-                                'error': 'Missing required data (Product Code, Brand Name, or Color Name)'
-                            })
-                            continue
-
-                        # البحث عن أو إنشاء Brand
-                        cursor.execute('SELECT id FROM brands WHERE brand_name = ?', (brand_name,))
-                        brand_result = cursor.fetchone()
-                        if not brand_result:
-                            cursor.execute('INSERT INTO brands (brand_name) VALUES (?)', (brand_name,))
-                            brand_id = cursor.lastrowid
-                            created_brands.append(brand_name)
-                            print(f"✅ تم إنشاء براند جديد: {brand_name}")
-                        else:
-                            brand_id = brand_result[0]
-
-                        # البحث عن أو إنشاء Product Type
-                        cursor.execute('SELECT id FROM product_types WHERE type_name = ?', (product_type_name,))
-                        type_result = cursor.fetchone()
-                        if not type_result:
-                            cursor.execute('INSERT INTO product_types (type_name) VALUES (?)', (product_type_name,))
-                            product_type_id = cursor.lastrowid
-                            created_types.append(product_type_name)
-                            print(f"✅ تم إنشاء نوع منتج جديد: {product_type_name}")
-                        else:
-                            product_type_id = type_result[0]
-
-                        # البحث عن أو إنشاء Color
-                        cursor.execute('SELECT id FROM colors WHERE color_name = ?', (color_name,))
-                        color_result = cursor.fetchone()
-                        if not color_result:
-                            # أكواد ألوان افتراضية
-                            default_color_codes = {
-                                'black': '#000000', 'white': '#FFFFFF', 'red': '#FF0000',
-                                'blue': '#0000FF', 'green': '#008000', 'yellow': '#FFFF00',
-                                'brown': '#8B4513', 'pink': '#FFC0CB', 'purple': '#800080',
-                                'orange': '#FFA500', 'gray': '#808080', 'grey': '#808080',
-                                'gold': '#FFD700', 'silver': '#C0C0C0', 'navy': '#000080',
-                                'beige': '#F5F5DC', 'maroon': '#800000'
-                            }
-                            color_code = default_color_codes.get(color_name.lower(), '#FFFFFF')
-                            cursor.execute('INSERT INTO colors (color_name, color_code) VALUES (?, ?)',
-                                        (color_name, color_code))
-                            color_id = cursor.lastrowid
-                            created_colors.append(color_name)
-                            print(f"✅ تم إنشاء لون جديد: {color_name} ({color_code})")
-                        else:
-                            color_id = color_result[0]
-
-                        # إنشاء أو تحديث المنتج الأساسي
-                        product_key = f"{product_code}_{brand_id}"
-                        if product_key not in processed_products:
-                            # التحقق من وجود المنتج
-                            cursor.execute('''
-                                SELECT id FROM base_products
-                                WHERE product_code = ? AND brand_id = ? AND trader_category = ?
-                            ''', (product_code, brand_id, category))
-                            existing_product = cursor.fetchone()
-                            
-                            if existing_product:
-                                base_product_id = existing_product[0]
-                                # تحديث بيانات المنتج الموجود
-                                cursor.execute('''
-                                    UPDATE base_products
-                                    SET product_type_id = ?, product_size = ?,
-                                        wholesale_price = ?, retail_price = ?
-                                    WHERE id = ?
-                                ''', (product_type_id, size, wholesale_price, retail_price, base_product_id))
-                            else:
-                                # إنشاء منتج جديد
-                                cursor.execute('''
-                                    INSERT INTO base_products
-                                    (product_code, brand_id, product_type_id, trader_category,
-                                    product_size, wholesale_price, retail_price, supplier_id)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                                ''', (product_code, brand_id, product_type_id, category,
-                                    size, wholesale_price, retail_price, 1))
-                                base_product_id = cursor.lastrowid
-
-                            processed_products[product_key] = base_product_id
-                        else:
-                            base_product_id = processed_products[product_key]
-
-                        # إضافة أو تحديث متغير اللون
-                        cursor.execute('''
-                            SELECT id FROM product_variants
-                            WHERE base_product_id = ? AND color_id = ?
-                        ''', (base_product_id, color_id))
-                        existing_variant = cursor.fetchone()
-
-                        if existing_variant:
-                            # تحديث المخزون الموجود
-                            variant_id = existing_variant[0]
-                            cursor.execute('''
-                                UPDATE product_variants
-                                SET current_stock = ?
-                                WHERE id = ?
-                            ''', (initial_stock, variant_id))
-                        else:
-                            # إنشاء متغير جديد
-                            cursor.execute('''
-                                INSERT INTO product_variants
-                                (base_product_id, color_id, current_stock)
-                                VALUES (?, ?, ?)
-                            ''', (base_product_id, color_id, initial_stock))
-                            variant_id = cursor.lastrowid
-
-                        # إضافة أو تحديث الصورة
-                        if image_url and image_url not in ['nan', 'NaN', '', 'null']:
-                            try:
-                                local_image_path = self.download_and_save_image(image_url, product_code, color_name)
-                                if local_image_path:
-                                    filename = os.path.basename(local_image_path)
-                                    cursor.execute('''
-                                        INSERT OR REPLACE INTO color_images
-                                        (variant_id, image_url, image_filename)
-                                        VALUES (?, ?, ?)
-                                    ''', (variant_id, local_image_path, filename))
-                                    print(f"✅ تم تحميل صورة: {product_code} - {color_name}")
-                            except Exception as img_error:
-                                print(f"⚠️ فشل تحميل صورة {product_code} - {color_name}: {img_error}")
-
-                        # إضافة Tags
-                        if tags and tags not in ['nan', 'NaN', '', 'null']:
-                            tag_names = [tag.strip() for tag in tags.split(',') if tag.strip()]
-                            for tag_name in tag_names:
-                                cursor.execute('SELECT id FROM tags WHERE tag_name = ?', (tag_name,))
-                                tag_result = cursor.fetchone()
-                                if tag_result:
-                                    cursor.execute('''
-                                        INSERT OR IGNORE INTO product_tags (product_id, tag_id)
-                                        VALUES (?, ?)
-                                    ''', (base_product_id, tag_result[0]))
-
-                        success_count += 1
-
-                        # commit كل 10 منتجات لتوفير الذاكرة
-                        if success_count % 10 == 0:
-                            conn.commit()
-                            print(f"📦 تم حفظ {success_count} منتج حتى الآن")
-
-                    except Exception as e:
-                        failed_products.append({
-                            'row': index,
-                            'product_code': str(row.get('Product Code', 'Unknown')),
-                            'color': str(row.get('Color Name', 'Unknown')),
-                            'error': str(e)
-                        })
-                        print(f"❌ خطأ في الصف {index}: {str(e)}")
-                        continue
-
-                # commit قوي بعد كل دفعة
-                conn.commit()
-                
-                # فحص إضافي لضمان حفظ البيانات
-                if hasattr(conn, 'execute'):
-                    cursor.execute('PRAGMA synchronous = FULL')
-                    cursor.execute('PRAGMA journal_mode = WAL')
-                
-                print(f"✅ تم الانتهاء من الدفعة {batch_start + 1}-{batch_end}")
-
-            # commit نهائي
-            conn.commit()
-            
-            # فحص البيانات النهائي قبل إغلاق الاتصال
-            cursor.execute("SELECT COUNT(*) FROM base_products")
-            final_product_count = cursor.fetchone()[0]
-            print(f"📊 إجمالي المنتجات في قاعدة البيانات بعد الانتهاء: {final_product_count}")
-            
-            conn.close()
-
-            return {
-                'success': True,
-                'success_count': success_count,
-                'failed_count': len(failed_products),
-                'failed_products': failed_products,
-                'unique_products': len(set([k.split('_')[0] for k in processed_products.keys()])),
-                'created_brands': list(set(created_brands)),
-                'created_colors': list(set(created_colors)),
-                'created_types': list(set(created_types))
-            }
-
+            result = import_products(self, excel_data)
         except Exception as e:
             print(f"❌ خطأ عام في معالجة البيانات: {e}")
-            conn.rollback()
-            conn.close()
             return {
                 'success': False,
                 'error': str(e),
                 'success_count': 0,
                 'failed_count': len(excel_data)
             }
+        
+        # فحص البيانات النهائي
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM base_products")
+        final_product_count = cursor.fetchone()[0]
+        conn.close()
+        print(f"📊 إجمالي المنتجات في قاعدة البيانات بعد الانتهاء: {final_product_count}")
+        
+        return result
 
 # اختبار قاعدة البيانات المحدثة
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ import sqlite3
 from datetime import datetime
 import os
 
+from backup_snapshot import snapshot_connection
+
 class DropboxBackup:
     def __init__(self):
         self.access_token = os.getenv('DROPBOX_ACCESS_TOKEN')
@@ -18,9 +20,8 @@ class DropboxBackup:
     def export_database_to_json(self):
         """تصدير قاعدة البيانات لـ JSON مع فحص دقيق للبيانات"""
         try:
-            # استخدام نفس الـ connection من StockDatabase
-            import sqlite3
-            conn = sqlite3.connect('stock_management.db')
+            # نسخة متسقة في الذاكرة (backup API) بدل القراءة من الملف أثناء الكتابة
+            conn = snapshot_connection('stock_management.db')
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -0,0 +1,190 @@
+"""Dropbox client بتوكن يتجدد تلقائياً وإعادة محاولة عند الـ rate limit
+
+- صلاحية الـ access token (expires_in من الـ OAuth endpoint) محفوظة، والتوكن
+  يتجدد قبل انتهائه بـ REFRESH_MARGIN ثانية - بدون users_get_current_account
+  قبل كل عملية
+- requests.Session واحد (pool اتصالات keep-alive) لتجديد التوكن ولكل الـ API
+- الـ rate limit (429) وأخطاء السيرفر والشبكة المؤقتة: إعادة المحاولة بـ
+  exponential backoff (أو المدة التي يرسلها Dropbox في Retry-After)
+- AuthError (توكن ملغي قبل موعده): تجديد مرة واحدة وإعادة المحاولة
+- عدد الاستدعاءات والأخطاء والزمن لكل method في stats()
+
+الاستخدام بنفس أسماء methods الـ SDK:
+    client = DropboxClient(app_key, app_secret, refresh_token)
+    client.files_upload(data, '/backup.gz', mode=...)
+
+مكتبة dropbox (و requests) تُحمل عند إنشاء الـ client وليس مع بدء التطبيق.
+"""
+import functools
+import os
+import random
+import threading
+import time
+
+TOKEN_URL = 'https://api.dropboxapi.com/oauth2/token'
+# التجديد قبل انتهاء الصلاحية بـ 5 دقائق
+REFRESH_MARGIN = 300
+DEFAULT_TOKEN_LIFETIME = 4 * 60 * 60
+MAX_RETRIES = int(os.getenv('DROPBOX_MAX_RETRIES', '5'))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+MAX_CONNECTIONS = 8
+
+API_PREFIXES = ('files_', 'users_', 'sharing_')
+
+
+class TokenRefreshError(Exception):
+    """فشل تجديد الـ access token (refresh token أو app key/secret غير صحيح)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+    """base * 2^attempt بحد أقصى maximum، مع jitter حتى لا تتزامن المحاولات"""
+    return min(maximum, base * 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+class DropboxClient:
+
+    def __init__(self, app_key, app_secret, refresh_token, max_retries=MAX_RETRIES, session=None):
+        import dropbox
+
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.refresh_token = refresh_token
+        self.max_retries = max_retries
+        self.session = session or dropbox.create_session(max_connections=MAX_CONNECTIONS)
+        self._dbx = None
+        self._expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'refreshes': 0, 'rate_limited': 0, 'retries': 0, 'total_sleep_ms': 0.0}
+        self._calls = {}
+
+    # ------------------------------------------------------------------
+    # Token
+    # ------------------------------------------------------------------
+
+    def refresh(self):
+        """طلب access token جديد - يرفع TokenRefreshError عند الرفض"""
+        import dropbox
+
+        response = self.session.post(TOKEN_URL, data={
+            'grant_type': 'refresh_token',
+            'refresh_token': self.refresh_token,
+            'client_id': self.app_key,
+            'client_secret': self.app_secret,
+        }, timeout=30)
+        if response.status_code != 200:
+            try:
+                description = response.json().get('error_description') or response.text
+            except ValueError:
+                description = response.text
+            raise TokenRefreshError(description, response.status_code)
+
+        token = response.json()
+        self._expires_at = time.monotonic() + token.get('expires_in', DEFAULT_TOKEN_LIFETIME)
+        # إعادة المحاولة مسؤولية call() فقط (بدون retries داخل الـ SDK)
+        self._dbx = dropbox.Dropbox(oauth2_access_token=token['access_token'], session=self.session,
+                                    max_retries_on_error=0, max_retries_on_rate_limit=0)
+        self._incr('refreshes')
+
+    def ensure_token(self):
+        """الـ SDK client بتوكن صالح - يتجدد فقط لو قارب على الانتهاء"""
+        with self._token_lock:
+            if self._dbx is None or time.monotonic() >= self._expires_at - REFRESH_MARGIN:
+                self.refresh()
+            return self._dbx
+
+    def _invalidate_token(self, dbx):
+        with self._token_lock:
+            if self._dbx is dbx:
+                self._dbx = None
+
+    @property
+    def has_token(self):
+        return self._dbx is not None and time.monotonic() < self._expires_at
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+
+    def call(self, method, *args, **kwargs):
+        """تنفيذ method من الـ SDK مع إعادة المحاولة"""
+        import dropbox
+        import requests
+
+        refreshed = False
+        attempt = 0
+        while True:
+            dbx = self.ensure_token()
+            started = time.monotonic()
+            try:
+                result = getattr(dbx, method)(*args, **kwargs)
+            except dropbox.exceptions.AuthError:
+                self._record(method, started, failed=True)
+                if refreshed:
+                    raise
+                refreshed = True
+                self._invalidate_token(dbx)
+                continue
+            except dropbox.exceptions.RateLimitError as e:
+                self._record(method, started, failed=True)
+                self._incr('rate_limited')
+                if attempt >= self.max_retries:
+                    raise
+                delay = e.backoff if e.backoff else backoff_delay(attempt)
+            except (dropbox.exceptions.InternalServerError,
+                    requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(method, started, failed=True)
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+            except Exception:
+                self._record(method, started, failed=True)
+                raise
+            else:
+                self._record(method, started)
+                return result
+
+            self._incr('retries')
+            self._incr('total_sleep_ms', delay * 1000)
+            time.sleep(delay)
+            attempt += 1
+
+    def __getattr__(self, name):
+        if name.startswith(API_PREFIXES):
+            return functools.partial(self.call, name)
+        raise AttributeError(name)
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+
+    def _incr(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _record(self, method, started, failed=False):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._stats_lock:
+            stats = self._calls.setdefault(method, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['calls'] += 1
+            stats['errors'] += failed
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+            calls = {method: dict(values) for method, values in self._calls.items()}
+        for values in calls.values():
+            values['avg_ms'] = round(values['total_ms'] / values['calls'], 1)
+            values['total_ms'] = round(values['total_ms'], 1)
+            values['max_ms'] = round(values['max_ms'], 1)
+        data['total_sleep_ms'] = round(data['total_sleep_ms'], 1)
+        data['calls'] = calls
+        data['token_expires_in'] = max(0, round(self._expires_at - time.monotonic())) if self._dbx else None
+        return data
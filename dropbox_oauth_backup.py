@@ -1,18 +1,43 @@
-import dropbox
 import json
 import sqlite3
 from datetime import datetime
 import os
-import requests
+import tempfile
+import threading
+
+from backup_restore import backup_file_events, bulk_restore, json_backup_events
+from backup_snapshot import SNAPSHOT_SUFFIX, consistent_read, gzip_file, snapshot_change_seq, sqlite_snapshot
+from backup_stream import BACKUP_SUFFIX, BackupWriter, upload_file
+from change_log import (BACKUP_TABLES, current_seq, get_state, iter_changes,
+                        pending_changes, prune, reset_after_restore, save_state)
+from dropbox_client import DropboxClient, TokenRefreshError
+from image_sync import ImageSync
+
+FULL_PREFIX = 'stock_backup_'
+DELTA_PREFIX = 'stock_delta_'
+LOCAL_PREFIX = 'local_backup_'
+LOCAL_BACKUP_DIR = '.'
+# نسخة full جديدة بعد هذه المدة أو هذا العدد من الـ deltas (والباقي deltas صغيرة)
+FULL_BACKUP_INTERVAL_HOURS = float(os.getenv('FULL_BACKUP_INTERVAL_HOURS', '24'))
+MAX_DELTAS_PER_FULL = int(os.getenv('MAX_DELTAS_PER_FULL', '48'))
+
+
+def _backup_timestamp(filename, prefix):
+    """stock_backup_20250101_120000.ndjson.gz (أو .json القديمة) -> 20250101_120000"""
+    return filename[len(prefix):].split('.')[0]
+
 
 class DropboxOAuthBackup:
-    def __init__(self):
+    def __init__(self, db=None):
         self.app_key = os.getenv('DROPBOX_APP_KEY')
         self.app_secret = os.getenv('DROPBOX_APP_SECRET')
         self.refresh_token = os.getenv('DROPBOX_REFRESH_TOKEN')
-        self.access_token = None
-        self.dbx = None
+        self._dbx = None
+        self._images = None
+        self._client_lock = threading.Lock()
         self.max_backups = 10
+        # قاعدة البيانات لسجل التغييرات (change_log) وحالة آخر نسخة
+        self.db = db
                 # فحص فوري للمتغيرات
         print(f"🔍 Environment Variables Check:")
         print(f"  - DROPBOX_APP_KEY: {'✅ موجود' if self.app_key else '❌ غير موجود'}")
@@ -20,142 +45,240 @@ class DropboxOAuthBackup:
         print(f"  - DROPBOX_REFRESH_TOKEN: {'✅ موجود' if self.refresh_token else '❌ غير موجود'}")
         
 
-        if self.refresh_token and self.app_key and self.app_secret:
-            self.refresh_access_token()
-        else:
+        if not self.configured:
             print("⚠️ مطلوب DROPBOX_APP_KEY, DROPBOX_APP_SECRET, DROPBOX_REFRESH_TOKEN")
-    
-        if not all([self.app_key, self.app_secret, self.refresh_token]):
             print("⚠️ بعض المتغيرات مفقودة - النسخ الاحتياطية ستعمل محلياً فقط")
-            self.dbx = None
-            return
+    
+    @property
+    def configured(self):
+        return all([self.app_key, self.app_secret, self.refresh_token])
+    
+    @property
+    def dbx(self):
+        """الـ client يُنشأ عند أول استخدام (بدون طلبات شبكة مع بدء التطبيق)
+        
+        client واحد: session مشترك، تجديد التوكن قبل انتهائه، وإعادة المحاولة.
+        """
+        if self._dbx is None and self.configured:
+            with self._client_lock:
+                if self._dbx is None:
+                    self._dbx = DropboxClient(self.app_key, self.app_secret, self.refresh_token)
+        return self._dbx
+    
+    @dbx.setter
+    def dbx(self, client):
+        self._dbx = client
+        self._images = None
+    
+    @property
+    def images(self):
+        if self._images is None and self.dbx is not None:
+            with self._client_lock:
+                if self._images is None:
+                    self._images = ImageSync(self._dbx)
+        return self._images
+    
+    @images.setter
+    def images(self, image_sync):
+        self._images = image_sync
 
     def refresh_access_token(self):
         """تجديد Access Token باستخدام Refresh Token مع تشخيص مفصل"""
+        if self.dbx is None:
+            return False
         try:
-            # فحص المتغيرات البيئية أولاً
-            if not self.app_key:
-                print("❌ DROPBOX_APP_KEY غير موجود")
-                return False
-            if not self.app_secret:
-                print("❌ DROPBOX_APP_SECRET غير موجود")
-                return False
-            if not self.refresh_token:
-                print("❌ DROPBOX_REFRESH_TOKEN غير موجود")
-                return False
-            
             print(f"🔄 محاولة تجديد التوكن...")
-            print(f"📝 App Key: {self.app_key[:8]}..." if self.app_key else "❌ App Key فارغ")
-            print(f"📝 App Secret: {self.app_secret[:8]}..." if self.app_secret else "❌ App Secret فارغ") 
-            print(f"📝 Refresh Token: {self.refresh_token[:20]}..." if self.refresh_token else "❌ Refresh Token فارغ")
-            
-            url = 'https://api.dropboxapi.com/oauth2/token'
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
-            data = {
-                'grant_type': 'refresh_token',
-                'refresh_token': self.refresh_token,
-                'client_id': self.app_key,
-                'client_secret': self.app_secret
-            }
-            
-            response = requests.post(url, headers=headers, data=data, timeout=30)
-            
-            # تشخيص مفصل للاستجابة
-            print(f"📊 Response Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                token_data = response.json()
-                self.access_token = token_data['access_token']
-                self.dbx = dropbox.Dropbox(self.access_token)
-                print("✅ تم تجديد Dropbox Access Token بنجاح")
-                return True
-            else:
-                print(f"❌ فشل تجديد التوكن: {response.status_code}")
-                print(f"📄 Response Text: {response.text}")
-                
-                # تحليل الأخطاء الشائعة
-                if response.status_code == 400:
-                    try:
-                        error_data = response.json()
-                        error_description = error_data.get('error_description', 'Unknown error')
-                        print(f"🔍 تفاصيل الخطأ: {error_description}")
-                        
-                        if 'invalid_grant' in error_description:
-                            print("💡 الـ Refresh Token منتهي الصلاحية أو غير صحيح")
-                        elif 'invalid_client' in error_description:
-                            print("💡 App Key أو App Secret غير صحيح")
-                            
-                    except:
-                        print("🔍 لا يمكن تحليل تفاصيل الخطأ")
-                
-                return False
-                
+            self.dbx.refresh()
+            print(f"✅ تم تجديد Dropbox Access Token بنجاح (صالح لمدة {self.dbx.stats()['token_expires_in']} ثانية)")
+            return True
+        except TokenRefreshError as e:
+            print(f"❌ فشل تجديد التوكن: {e.status_code}")
+            print(f"🔍 تفاصيل الخطأ: {e}")
+            if 'invalid_grant' in str(e):
+                print("💡 الـ Refresh Token منتهي الصلاحية أو غير صحيح")
+            elif 'invalid_client' in str(e):
+                print("💡 App Key أو App Secret غير صحيح")
+            return False
         except Exception as e:
             print(f"❌ خطأ في الاتصال بـ Dropbox API: {e}")
             return False
         
     def ensure_valid_token(self):
-        """التأكد من صحة التوكن قبل أي عملية"""
-        if not self.dbx:
-            return self.refresh_access_token()
+        """التأكد من صحة التوكن قبل أي عملية - بدون طلب للـ API إلا لو قارب على الانتهاء"""
+        if self.dbx is None:
+            return False
+        if self.dbx.has_token:
+            return True
+        return self.refresh_access_token()
+    
+    @property
+    def connected(self):
+        return self._dbx is not None and self._dbx.has_token
+    
+    def api_stats(self):
+        """عدد طلبات Dropbox وزمنها وتجديدات التوكن"""
+        if not self.configured:
+            return {'configured': False}
+        if self._dbx is None:
+            return {'configured': True, 'initialized': False}
+        return self._dbx.stats()
+    
+    def _connect(self):
+        """اتصال القراءة للتصدير (من الـ pool لو قاعدة البيانات متاحة)"""
+        if self.db is not None:
+            return self.db.get_connection()
+        return sqlite3.connect('stock_management.db')
+    
+    @property
+    def db_type(self):
+        return self.db.db_type if self.db is not None else 'sqlite'
+    
+    @property
+    def db_path(self):
+        return self.db.db_name if self.db is not None else 'stock_management.db'
+    
+    def _backup_meta(self, backup_type, **extra):
+        return {
+            'backup_date': datetime.now().isoformat(),
+            'version': '3.0',
+            'source': 'dropbox_oauth_backup',
+            'app_info': {
+                'name': 'Stock Management System',
+                'backup_type': backup_type
+            },
+            **extra
+        }
+    
+    def write_full_backup(self, fileobj):
+        """كتابة كل جداول النسخ الاحتياطي في fileobj (gzip NDJSON) - يرجع change_seq
+        
+        الصفوف تُقرأ بـ fetchmany وتُكتب مباشرة فلا تبقى قاعدة البيانات في الذاكرة.
+        """
+        conn = self._connect()
+        try:
+            # كل الجداول والـ seq من نفس اللحظة (REPEATABLE READ على PostgreSQL)
+            with consistent_read(conn, self.db_type) as cursor:
+                change_seq = current_seq(cursor) if self.db is not None else None
+                writer = BackupWriter(fileobj, self._backup_meta('full_database', change_seq=change_seq))
+                for table_name in BACKUP_TABLES:
+                    count = writer.write_table(cursor, table_name)
+                    print(f"✅ تم تصدير {count} سجل من جدول {table_name}")
+                writer.close()
+        finally:
+            conn.close()
         
+        print(f"📊 إجمالي السجلات المُصدرة: {writer.row_count}")
+        return change_seq
+    
+    def write_sqlite_snapshot(self, target_path):
+        """snapshot متسق لقاعدة SQLite بالـ backup API مضغوط في target_path - يرجع change_seq"""
+        fd, snapshot_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
         try:
-            # اختبار بسيط للتوكن
-            self.dbx.users_get_current_account()
+            sqlite_snapshot(self.db_path, snapshot_path)
+            change_seq = snapshot_change_seq(snapshot_path) if self.db is not None else None
+            gzip_file(snapshot_path, target_path)
+        finally:
+            os.remove(snapshot_path)
+        return change_seq
+    
+    def export_full_backup(self, target_path):
+        """نسخة full في target_path - يرجع (الامتداد، change_seq)
+        
+        SQLite: صورة متسقة من الملف نفسه (.sqlite.gz). PostgreSQL: gzip NDJSON
+        من transaction واحد REPEATABLE READ.
+        """
+        if self.db_type != 'postgresql':
+            return SNAPSHOT_SUFFIX, self.write_sqlite_snapshot(target_path)
+        with open(target_path, 'wb') as f:
+            return BACKUP_SUFFIX, self.write_full_backup(f)
+    
+    def _needs_full_backup(self, state):
+        """full لو لا توجد نسخة أساسية، أو مر FULL_BACKUP_INTERVAL_HOURS، أو كثرت الـ deltas"""
+        if not state.get('base_backup') or state.get('last_seq') is None:
             return True
-        except dropbox.exceptions.AuthError:
-            print("🔄 انتهت صلاحية التوكن - تجديد...")
-            return self.refresh_access_token()
-        except Exception:
-            return False
+        if state.get('delta_count', 0) >= MAX_DELTAS_PER_FULL:
+            return True
+        full_at = datetime.fromisoformat(state['full_at'])
+        return (datetime.now() - full_at).total_seconds() >= FULL_BACKUP_INTERVAL_HOURS * 3600
     
-    def export_database_to_json(self):
-        """تصدير قاعدة البيانات لـ JSON"""
+    def write_delta_backup(self, fileobj, state):
+        """كتابة التغييرات منذ آخر نسخة في fileobj - يرجع change_seq أو None بدون تغييرات"""
+        conn = self.db.get_connection()
         try:
-            conn = sqlite3.connect('stock_management.db')
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            backup_data = {
-                'backup_date': datetime.now().isoformat(),
-                'version': '2.0',
-                'source': 'dropbox_oauth_backup',
-                'app_info': {
-                    'name': 'Stock Management System',
-                    'backup_type': 'full_database'
-                },
-                'tables': {}
-            }
-            
-            important_tables = [
-                'brands', 'colors', 'product_types', 'trader_categories',
-                'suppliers', 'tags', 'base_products', 'product_variants',
-                'color_images', 'product_tags'
-            ]
-            
-            total_records = 0
-            for table_name in important_tables:
-                try:
-                    cursor.execute(f"SELECT * FROM {table_name}")
-                    rows = cursor.fetchall()
-                    backup_data['tables'][table_name] = [dict(row) for row in rows]
-                    print(f"✅ تم تصدير {len(rows)} سجل من جدول {table_name}")
-                    total_records += len(rows)
-                except Exception as e:
-                    print(f"⚠️ تخطي جدول {table_name}: {e}")
-            
+            with consistent_read(conn, self.db_type) as cursor:
+                to_seq = current_seq(cursor)
+                if to_seq <= state['last_seq']:
+                    return None
+                writer = BackupWriter(fileobj, self._backup_meta(
+                    'delta', base=state['base_backup'], from_seq=state['last_seq'], change_seq=to_seq))
+                for event in iter_changes(cursor, state['last_seq'], to_seq):
+                    if event[0] == 'rows':
+                        _, table_name, columns, rows = event
+                        writer.table(table_name, columns)
+                        writer.rows(rows)
+                    else:
+                        _, table_name, ids = event
+                        writer.deletes(table_name, ids)
+                writer.close()
+        finally:
             conn.close()
-            print(f"📊 إجمالي السجلات المُصدرة: {total_records}")
-            return backup_data
-            
-        except Exception as e:
-            print(f"❌ خطأ في تصدير قاعدة البيانات: {e}")
+        
+        print(f"📊 {writer.row_count} سجل تغير منذ آخر نسخة")
+        return to_seq
+    
+    def pending_change_count(self):
+        """عدد التغييرات التي لم تدخل نسخة مرفوعة بعد"""
+        if self.db is None:
             return None
+        state = get_state(self.db)
+        conn = self.db.get_connection()
+        try:
+            return pending_changes(conn.cursor(), state.get('last_seq') or 0)
+        finally:
+            conn.close()
+    
+    def _mark_uploaded(self, change_seq, filename, full, state):
+        """حفظ حالة النسخة وحذف التغييرات التي أصبحت داخلها من change_log"""
+        if self.db is None or change_seq is None:
+            return
+        
+        def write(conn):
+            cursor = conn.cursor()
+            if full:
+                save_state(cursor, base_backup=filename, full_at=datetime.now().isoformat(timespec='seconds'),
+                           delta_count=0, last_seq=change_seq)
+            else:
+                save_state(cursor, delta_count=state.get('delta_count', 0) + 1, last_seq=change_seq)
+            prune(cursor, change_seq)
+        
+        self.db.run_write(write)
     
-    def create_backup(self):
-        """إنشاء نسخة احتياطية مع تجديد تلقائي للتوكن"""
+    def _mark_local_backup(self, change_seq):
+        """حذف التغييرات التي أصبحت داخل نسخة محلية full من change_log
+        
+        بدون Dropbox (أو مع فشل الرفع) لا يتم حذفها في _mark_uploaded فيكبر
+        الجدول بلا حد. سلسلة الـ deltas المرفوعة تنقطع بذلك، فالنسخة التالية
+        في Dropbox تكون full.
+        """
+        if self.db is None or change_seq is None:
+            return
+        
+        def write(conn):
+            cursor = conn.cursor()
+            save_state(cursor, base_backup=None, last_seq=change_seq)
+            prune(cursor, change_seq)
+        
+        self.db.run_write(write)
+    
+    def create_backup(self, full=False):
+        """إنشاء نسخة احتياطية مع تجديد تلقائي للتوكن
+        
+        مع قاعدة البيانات (self.db) النسخة تكون delta بالتغييرات فقط، و full
+        دورياً (انظر _needs_full_backup). بدون تغييرات لا يتم رفع شيء.
+        """
+        import dropbox
+        
         print("🔄 بدء إنشاء نسخة احتياطية في Dropbox...")
         
         if not self.ensure_valid_token():
@@ -163,64 +286,99 @@ class DropboxOAuthBackup:
             return self.create_local_backup()
         
         try:
-            backup_data = self.export_database_to_json()
-            if not backup_data:
-                return False
-            
+            state = get_state(self.db) if self.db is not None else {}
+            full = full or self.db is None or self._needs_full_backup(state)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'stock_backup_{timestamp}.json'
-            
-            json_content = json.dumps(backup_data, ensure_ascii=False, indent=2)
-            content_size = len(json_content.encode('utf-8'))
             
-            print(f"📦 حجم النسخة الاحتياطية: {content_size / 1024:.1f} KB")
-            
-            self.dbx.files_upload(
-                json_content.encode('utf-8'),
-                f'/{filename}',
-                mode=dropbox.files.WriteMode.overwrite
-            )
+            # الملف يُكتب على القرص ثم يُرفع على أجزاء (upload session)
+            fd, temp_path = tempfile.mkstemp(suffix='.backup')
+            os.close(fd)
+            try:
+                if full:
+                    suffix, change_seq = self.export_full_backup(temp_path)
+                    filename = f'{FULL_PREFIX}{timestamp}{suffix}'
+                else:
+                    with open(temp_path, 'wb') as temp_file:
+                        change_seq = self.write_delta_backup(temp_file, state)
+                    base_timestamp = _backup_timestamp(state['base_backup'], FULL_PREFIX)
+                    filename = f'{DELTA_PREFIX}{base_timestamp}_{timestamp}{BACKUP_SUFFIX}'
+                
+                if not full and change_seq is None:
+                    print("✅ لا توجد تغييرات منذ آخر نسخة احتياطية")
+                    return True
+                
+                print(f"📦 حجم النسخة الاحتياطية: {os.path.getsize(temp_path) / 1024:.1f} KB (مضغوطة)")
+                upload_file(self.dbx, temp_path, f'/{filename}')
+            finally:
+                os.remove(temp_path)
             
             print(f"✅ تم رفع النسخة الاحتياطية بنجاح: {filename}")
-            self.cleanup_old_backups()
+            self._mark_uploaded(change_seq, filename, full, state)
+            if full:
+                self.cleanup_old_backups()
+            self.sync_images()
             return True
             
-        except dropbox.exceptions.AuthError:
-            print("🔄 خطأ في المصادقة - محاولة تجديد التوكن...")
-            if self.refresh_access_token():
-                return self.create_backup()  # إعادة المحاولة
-            else:
-                return self.create_local_backup()
+        except dropbox.exceptions.AuthError as e:
+            # الـ client جدد التوكن وأعاد المحاولة مرة بالفعل
+            print(f"❌ خطأ في المصادقة مع Dropbox: {e}")
+            return self.create_local_backup()
         except Exception as e:
             print(f"❌ خطأ عام: {e}")
             return self.create_local_backup()
     
+    def sync_images(self):
+        """رفع الصور الجديدة مع النسخة الاحتياطية - فشلها لا يلغي النسخة"""
+        if self.images is None:
+            return None
+        try:
+            return self.images.sync()
+        except Exception as e:
+            print(f"⚠️ فشل مزامنة الصور: {e}")
+            return None
+    
+    def _list_backup_files(self):
+        """كل ملفات النسخ (full و delta) في مجلد التطبيق"""
+        import dropbox
+        
+        result = self.dbx.files_list_folder('')
+        entries = list(result.entries)
+        while result.has_more:
+            result = self.dbx.files_list_folder_continue(result.cursor)
+            entries.extend(result.entries)
+        return [entry for entry in entries if isinstance(entry, dropbox.files.FileMetadata)
+                and entry.name.startswith((FULL_PREFIX, DELTA_PREFIX))]
+    
+    def _deltas_for(self, entries, backup_name):
+        """الـ deltas التابعة لنسخة full بترتيب إنشائها"""
+        prefix = f'{DELTA_PREFIX}{_backup_timestamp(backup_name, FULL_PREFIX)}_'
+        return sorted((entry for entry in entries if entry.name.startswith(prefix)), key=lambda entry: entry.name)
+    
+    def _backups_from(self, entries):
+        """النسخ الـ full (الأحدث أولاً) مع عدد الـ deltas التابعة لكل منها"""
+        backups = []
+        for entry in entries:
+            if entry.name.startswith(FULL_PREFIX):
+                deltas = self._deltas_for(entries, entry.name)
+                latest = deltas[-1] if deltas else entry
+                backups.append({
+                    'name': entry.name,
+                    'size': entry.size,
+                    'modified': latest.server_modified.isoformat() if latest.server_modified else 'غير محدد',
+                    'path': entry.path_display,
+                    'deltas': len(deltas),
+                    'deltas_size': sum(delta.size for delta in deltas)
+                })
+        backups.sort(key=lambda x: x['name'], reverse=True)
+        return backups
+    
     def list_backups(self):
-        """قائمة النسخ الاحتياطية مع تجديد تلقائي للتوكن"""
+        """قائمة النسخ الاحتياطية (full) مع عدد الـ deltas التابعة لكل منها"""
         if not self.ensure_valid_token():
             return []
         
         try:
-            result = self.dbx.files_list_folder('')
-            backups = []
-            
-            for entry in result.entries:
-                if isinstance(entry, dropbox.files.FileMetadata) and entry.name.startswith('stock_backup_'):
-                    backups.append({
-                        'name': entry.name,
-                        'size': entry.size,
-                        'modified': entry.server_modified.isoformat() if entry.server_modified else 'غير محدد',
-                        'path': entry.path_display
-                    })
-            
-            backups.sort(key=lambda x: x['name'], reverse=True)
-            return backups
-            
-        except dropbox.exceptions.AuthError:
-            print("🔄 خطأ في المصادقة - محاولة تجديد التوكن...")
-            if self.refresh_access_token():
-                return self.list_backups()  # إعادة المحاولة
-            return []
+            return self._backups_from(self._list_backup_files())
         except Exception as e:
             print(f"❌ خطأ في جلب قائمة النسخ: {e}")
             return []
@@ -228,13 +386,14 @@ class DropboxOAuthBackup:
     def restore_from_backup(self, backup_name=None):
         """استرجاع البيانات من Dropbox"""
         try:
-            if not self.dbx:
+            if not self.ensure_valid_token():
                 print("❌ غير متصل بـ Dropbox")
                 return False
 
-            # اختيار النسخة الاحتياطية
+            # قائمة الملفات مرة واحدة: اختيار النسخة والـ deltas التابعة لها
+            entries = self._list_backup_files()
             if not backup_name:
-                backups = self.list_backups()
+                backups = self._backups_from(entries)
                 if not backups:
                     print("❌ لا توجد نسخ احتياطية متوفرة")
                     return False
@@ -243,185 +402,126 @@ class DropboxOAuthBackup:
             backup_path = f"/{backup_name}"
             print(f"🔄 استرجاع من النسخة: {backup_name}")
 
-            # تحميل الملف من Dropbox
-            _, response = self.dbx.files_download(backup_path)
-            backup_data = json.loads(response.content.decode('utf-8'))
+            deltas = self._deltas_for(entries, backup_name)
+            db = self.db
+            if db is None:
+                from database import StockDatabase
+                db = StockDatabase()
+            
+            # التحميل كله قبل الكتابة، ثم النسخة والـ deltas بالترتيب في transaction واحد
+            paths = [backup_path] + [delta_entry.path_display for delta_entry in deltas]
+            local_paths = []
+            try:
+                for dropbox_path in paths:
+                    local_paths.append(self._download_backup(dropbox_path))
+                    print(f"📥 تم تحميل {dropbox_path}")
+                counts = bulk_restore(db, (
+                    event
+                    for dropbox_path, local_path in zip(paths, local_paths)
+                    for event in backup_file_events(local_path, dropbox_path)
+                ))
+            finally:
+                for local_path in local_paths:
+                    os.remove(local_path)
 
-            # استرجاع البيانات
-            from database import StockDatabase
-            db = StockDatabase()
-            
-            # استرجاع كل جدول
-            tables_order = [
-                'brands', 'colors', 'product_types', 'trader_categories', 
-                'suppliers', 'tags', 'base_products', 'product_variants', 
-                'color_images', 'product_tags'
-            ]
+            # الصفوف المسترجعة ليست تغييرات جديدة - النسخة التالية full
+            reset_after_restore(db, backup_name)
+            # الصور الناقصة في الخلفية (والمطلوبة قبلها عند أول طلب)
+            if self.images is not None:
+                self.images.pull_in_background()
 
-            total_restored = 0
-            for table_name in tables_order:
-                    if table_name in backup_data.get('tables', {}):  # ✅ صحيح
-                        table_data = backup_data['tables'][table_name]  # ✅ صحيح
-                    
-                    # 🔧 هنا التصحيح المطلوب
-                    if isinstance(table_data, list):
-                        # إذا كانت البيانات قائمة، نتعامل معها مباشرة
-                        restored_count = self._restore_table_data(db, table_name, table_data)
-                    elif isinstance(table_data, dict):
-                        # إذا كانت البيانات قاموس، نحولها لقائمة
-                        rows = []
-                        for row_data in table_data.values():
-                            if isinstance(row_data, dict):
-                                rows.append(row_data)
-                        restored_count = self._restore_table_data(db, table_name, rows)
-                    else:
-                        print(f"⚠️ نوع بيانات غير مدعوم في جدول {table_name}: {type(table_data)}")
-                        continue
-                        
-                    total_restored += restored_count
-                    print(f"✅ تم استرجاع {restored_count} سجل من جدول {table_name}")
-
-            print(f"🎉 تم استرجاع {total_restored} سجل بنجاح!")
+            print(f"🎉 تم استرجاع {sum(counts.values())} سجل بنجاح!")
             return True
 
         except Exception as e:
             print(f"❌ خطأ في استرجاع النسخة الاحتياطية: {e}")
             return False
         
-    def _restore_table_data(self, db, table_name, rows):
-        """استرجاع بيانات جدول واحد"""
-        if not rows:
-            return 0
-            
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        restored_count = 0
-        
+    def _download_backup(self, dropbox_path):
+        """تحميل ملف نسخة (full أو delta) مباشرة لملف مؤقت - يرجع مساره"""
+        fd, local_path = tempfile.mkstemp(suffix='.backup')
+        os.close(fd)
         try:
-            for row in rows:
-                if not isinstance(row, dict):
-                    continue
-                    
-                # إنشاء استعلام INSERT
-                columns = list(row.keys())
-                placeholders = ', '.join(['?' for _ in columns])
-                values = [row[col] for col in columns]
-                
-                query = f"INSERT OR REPLACE INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
-                
-                try:
-                    cursor.execute(query, values)
-                    restored_count += 1
-                except Exception as e:
-                    print(f"⚠️ خطأ في إدراج سجل في {table_name}: {e}")
-                    continue
-            
-            conn.commit()
-            conn.close()
-            return restored_count
-            
-        except Exception as e:
-            print(f"❌ خطأ في استرجاع جدول {table_name}: {e}")
-            conn.close()
-            return 0
+            self.dbx.files_download_to_file(local_path, dropbox_path)
+        except Exception:
+            os.remove(local_path)
+            raise
+        return local_path
 
     def restore_data_to_database(self, backup_data):
-        """استرجاع البيانات لقاعدة البيانات مع معالجة أفضل للأخطاء"""
+        """استرجاع نسخة JSON (الصيغة القديمة) في transaction كتابة واحد عبر الكاتب"""
         try:
-            conn = sqlite3.connect('stock_management.db')
-            cursor = conn.cursor()
-            
-            # مسح البيانات الحالية
-            for table_name in backup_data['tables'].keys():
-                try:
-                    cursor.execute(f"DELETE FROM {table_name}")
-                    print(f"🗑️ تم مسح جدول {table_name}")
-                except:
-                    pass
-            
-            # استرجاع البيانات
-            total_restored = 0
-            for table_name, rows in backup_data['tables'].items():
-                if not rows:
-                    continue
-                
-                try:
-                    # 🎯 التحقق من نوع البيانات
-                    if isinstance(rows, list) and len(rows) > 0:
-                        # إذا كانت البيانات في شكل list of tuples، نحولها لـ list of dicts
-                        if isinstance(rows[0], (list, tuple)):
-                            # نحصل على أسماء الأعمدة من الجدول
-                            cursor.execute(f"PRAGMA table_info({table_name})")
-                            columns_info = cursor.fetchall()
-                            column_names = [col[1] for col in columns_info]
-                            
-                            # نحول البيانات لـ dicts
-                            dict_rows = []
-                            for row in rows:
-                                if len(row) <= len(column_names):
-                                    dict_rows.append(dict(zip(column_names, row)))
-                            rows = dict_rows
-                        
-                        # إذا كانت البيانات دلوقتي في شكل list of dicts
-                        if isinstance(rows[0], dict):
-                            columns = list(rows.keys())
-                            placeholders = ', '.join(['?' for _ in columns])
-                            insert_sql = f"INSERT OR REPLACE INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
-                            
-                            for row in rows:
-                                values = [row[col] for col in columns]
-                                cursor.execute(insert_sql, values)
-                            
-                            print(f"✅ تم استرجاع {len(rows)} سجل لجدول {table_name}")
-                            total_restored += len(rows)
-                        else:
-                            print(f"⚠️ تخطي جدول {table_name}: نوع بيانات غير مدعوم")
-                    else:
-                        print(f"⚠️ تخطي جدول {table_name}: بيانات فارغة أو غير صحيحة")
-                        
-                except Exception as e:
-                    print(f"⚠️ خطأ في استرجاع جدول {table_name}: {e}")
-            
-            conn.commit()
-            conn.close()
-            
-            print(f"🎉 تم استرجاع {total_restored} سجل بنجاح!")
+            db = self.db
+            if db is None:
+                from database import StockDatabase
+                db = StockDatabase()
+            bulk_restore(db, json_backup_events(backup_data))
             return True
-            
         except Exception as e:
             print(f"❌ خطأ في استرجاع البيانات: {e}")
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
             return False
         
     def cleanup_old_backups(self):
-        """حذف النسخ القديمة الزائدة"""
+        """حذف النسخ القديمة الزائدة مع الـ deltas التابعة لها"""
         try:
-            backups = self.list_backups()
+            entries = self._list_backup_files()
+            fulls = sorted((entry for entry in entries if entry.name.startswith(FULL_PREFIX)),
+                           key=lambda entry: entry.name, reverse=True)
             
-            if len(backups) > self.max_backups:
-                old_backups = backups[self.max_backups:]
+            if len(fulls) > self.max_backups:
+                old_backups = fulls[self.max_backups:]
                 
                 for backup in old_backups:
-                    self.dbx.files_delete_v2(backup['path'])
-                    print(f"🗑️ حذف نسخة قديمة: {backup['name']}")
+                    for delta in self._deltas_for(entries, backup.name):
+                        self.dbx.files_delete_v2(delta.path_display)
+                    self.dbx.files_delete_v2(backup.path_display)
+                    print(f"🗑️ حذف نسخة قديمة: {backup.name}")
                     
         except Exception as e:
             print(f"⚠️ خطأ في تنظيف النسخ القديمة: {e}")
     
+    def _local_backup_files(self):
+        """ملفات النسخ المحلية - الأحدث أولاً (الاسم فيه التاريخ)"""
+        return sorted((name for name in os.listdir(LOCAL_BACKUP_DIR) if name.startswith(LOCAL_PREFIX)),
+                      reverse=True)
+    
+    def _local_backup_current(self):
+        """True لو توجد نسخة محلية ولم يتغير شيء في change_log منذ آخر نسخة"""
+        if self.db is None or not self._local_backup_files():
+            return False
+        last_seq = get_state(self.db).get('last_seq')
+        if last_seq is None:
+            return False
+        conn = self.db.get_connection()
+        try:
+            return pending_changes(conn.cursor(), last_seq) == 0
+        finally:
+            conn.close()
+    
+    def cleanup_local_backups(self):
+        """حذف النسخ المحلية الزائدة عن max_backups"""
+        for name in self._local_backup_files()[self.max_backups:]:
+            try:
+                os.remove(os.path.join(LOCAL_BACKUP_DIR, name))
+                print(f"🗑️ حذف نسخة محلية قديمة: {name}")
+            except OSError as e:
+                print(f"⚠️ خطأ في حذف {name}: {e}")
+    
     def create_local_backup(self):
-        """نسخة احتياطية محلية كـ fallback"""
+        """نسخة احتياطية محلية كـ fallback - بدون نسخة جديدة لو لم يتغير شيء"""
         try:
-            backup_data = self.export_database_to_json()
-            if not backup_data:
-                return False
+            if self._local_backup_current():
+                print("✅ لا توجد تغييرات منذ آخر نسخة احتياطية - بدون نسخة محلية جديدة")
+                return True
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'local_backup_{timestamp}.json'
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, ensure_ascii=False, indent=2)
+            fd, temp_path = tempfile.mkstemp(suffix='.backup', dir=LOCAL_BACKUP_DIR)
+            os.close(fd)
+            suffix, change_seq = self.export_full_backup(temp_path)
+            filename = os.path.join(LOCAL_BACKUP_DIR, f'{LOCAL_PREFIX}{timestamp}{suffix}')
+            os.replace(temp_path, filename)
+            self._mark_local_backup(change_seq)
+            self.cleanup_local_backups()
             
             print(f"✅ نسخة احتياطية محلية: {filename}")
             return True
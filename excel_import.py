@@ -0,0 +1,519 @@
+"""استيراد المنتجات من Excel على دفعات (set-based)
+
+بدل ~10 استعلامات لكل صف، كل دفعة (chunk) تتم بعدد ثابت من الاستعلامات:
+- قراءة البراندات/الأنواع/الألوان/الـ Tags مرة واحدة وإنشاء الناقص بـ executemany
+- ربط الـ ids بالصفوف بـ pandas merge
+- تحديث/إضافة المنتجات والمتغيرات بـ executemany
+- تحميل الصور بالتوازي بعد الـ commit (خارج transaction الكتابة) وحفظها في
+  مخزن الصور بالـ SHA-256 (image_store) وربطها في color_images على دفعات
+
+iter_row_batches() تقرأ الملف كدفعات (openpyxl read_only أو CSV chunks)
+فلا يتم تحميل الملف كله في الذاكرة - الذاكرة ثابتة تقريباً مهما كبر الملف.
+
+نفس منطق الاستيراد القديم: أول صف للمنتج (كود + براند) يحدد بياناته،
+وآخر صف للون يحدد المخزون والصورة، والـ Tags الموجودة فقط يتم ربطها.
+"""
+import os
+import threading
+from concurrent.futures import as_completed
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from image_fetcher import get_image_fetcher
+from image_store import link_color_images
+from image_variants import find_variants, variants_json
+from search_index import defer_search_index, resume_search_index
+
+IMPORT_CHUNK_SIZE = 5000
+IN_LIST_CHUNK_SIZE = 500
+# عدد الصور المحملة قبل كتابتها في color_images
+IMAGE_FLUSH_SIZE = 25
+
+MISSING_VALUES = {'nan', 'NaN', '', 'null'}
+
+# أكواد ألوان افتراضية للألوان الجديدة
+DEFAULT_COLOR_CODES = {
+    'black': '#000000', 'white': '#FFFFFF', 'red': '#FF0000',
+    'blue': '#0000FF', 'green': '#008000', 'yellow': '#FFFF00',
+    'brown': '#8B4513', 'pink': '#FFC0CB', 'purple': '#800080',
+    'orange': '#FFA500', 'gray': '#808080', 'grey': '#808080',
+    'gold': '#FFD700', 'silver': '#C0C0C0', 'navy': '#000080',
+    'beige': '#F5F5DC', 'maroon': '#800000'
+}
+
+# عمود Excel -> عمود داخلي
+TEXT_COLUMNS = {
+    'Product Code': 'product_code',
+    'Brand Name': 'brand_name',
+    'Product Type': 'type_name',
+    'Color Name': 'color_name',
+    'Category': 'category',
+    'Size': 'size',
+    'Tags': 'tags',
+    'Image URL': 'image_url',
+}
+
+
+def _records(df, columns):
+    """صفوف كـ tuples بقيم Python عادية (sqlite3 لا يقبل أنواع numpy)"""
+    return list(zip(*(df[column].tolist() for column in columns)))
+
+
+def _in_chunks(values):
+    values = list(values)
+    for start in range(0, len(values), IN_LIST_CHUNK_SIZE):
+        yield values[start:start + IN_LIST_CHUNK_SIZE]
+
+
+def _text(df, column):
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    values = df[column].astype(object).where(df[column].notna(), '')
+    return values.astype(str).str.strip()
+
+
+def normalize_rows(df, first_row=1):
+    """تنظيف الصفوف - يرجع (صفوف صالحة، قائمة الصفوف الفاشلة)
+
+    الخلايا الفارغة تصبح '' (وليس 'nan')، وأي سعر/مخزون غير صالح يجعل
+    الثلاثة صفر كما في الاستيراد القديم.
+    """
+    rows = pd.DataFrame(index=df.index)
+    rows['row'] = range(first_row, first_row + len(df))
+    for excel_column, column in TEXT_COLUMNS.items():
+        rows[column] = _text(df, excel_column)
+
+    numbers = {}
+    for excel_column, column in (('Wholesale Price', 'wholesale_price'),
+                                 ('Retail Price', 'retail_price'),
+                                 ('Stock', 'stock')):
+        if excel_column in df.columns:
+            numbers[column] = pd.to_numeric(df[excel_column], errors='coerce')
+        else:
+            numbers[column] = pd.Series(0.0, index=df.index)
+    invalid = numbers['wholesale_price'].isna() | numbers['retail_price'].isna() | numbers['stock'].isna()
+    rows['wholesale_price'] = numbers['wholesale_price'].where(~invalid, 0.0).astype(float)
+    rows['retail_price'] = numbers['retail_price'].where(~invalid, 0.0).astype(float)
+    rows['stock'] = numbers['stock'].where(~invalid, 0).astype(int)
+
+    missing = (rows['product_code'] == '') | (rows['brand_name'] == '') | (rows['color_name'] == '')
+    failed = [{
+        'row': row,
+        'product_code': product_code,
+        'error': 'Missing required data (Product Code, Brand Name, or Color Name)'
+    } for row, product_code in _records(rows[missing], ['row', 'product_code'])]
+
+    return rows[~missing].reset_index(drop=True), failed
+
+
+class ExcelImporter:
+    """استيراد على دفعات مع الاحتفاظ بالنتائج بين الدفعات
+
+    process_chunk() لكل دفعة ثم result() للحصول على نفس dict النتيجة القديم.
+    """
+
+    def __init__(self, db, download_images=True):
+        self.db = db
+        self.download_images = download_images
+        self.success_count = 0
+        self.failed_products = []
+        # (product_code, brand_id) -> base_product_id لكل المنتجات في الملف
+        self.processed_products = {}
+        self.created_brands = []
+        self.created_colors = []
+        self.created_types = []
+        self._image_futures = []
+        self._downloaded_images = []
+        self._images_lock = threading.Lock()
+        self.images_saved = 0
+
+    # ------------------------------------------------------------------
+    # Reference tables
+    # ------------------------------------------------------------------
+
+    def _resolve_names(self, cursor, table_name, name_column, names, insert_columns, values_for):
+        """DataFrame (name, id) لكل الأسماء مع إنشاء الناقص - يرجع (map, الأسماء الجديدة)"""
+        cursor.execute(f'SELECT id, {name_column} FROM {table_name}')
+        ids = {row[1]: row[0] for row in cursor.fetchall()}
+
+        missing = [name for name in dict.fromkeys(names) if name not in ids]
+        if missing:
+            placeholders = ', '.join('?' for _ in insert_columns)
+            cursor.executemany(
+                f"INSERT INTO {table_name} ({', '.join(insert_columns)}) VALUES ({placeholders})",
+                [values_for(name) for name in missing]
+            )
+            cursor.execute(f'SELECT id, {name_column} FROM {table_name}')
+            ids = {row[1]: row[0] for row in cursor.fetchall()}
+
+        mapping = pd.DataFrame(list(ids.items()), columns=['name', 'id']).astype({'name': object, 'id': 'int64'})
+        return mapping, missing
+
+    def _map_ids(self, rows, mapping, name_column, id_column):
+        mapping = mapping.rename(columns={'name': name_column, 'id': id_column})
+        return rows.merge(mapping, on=name_column, how='left', validate='many_to_one')
+
+    # ------------------------------------------------------------------
+    # Products and variants
+    # ------------------------------------------------------------------
+
+    def _fetch_products(self, cursor, product_codes):
+        found = []
+        for chunk in _in_chunks(product_codes):
+            cursor.execute(f'''
+                SELECT id, product_code, brand_id, trader_category FROM base_products
+                WHERE product_code IN ({', '.join('?' for _ in chunk)})
+                ORDER BY id
+            ''', chunk)
+            found.extend(tuple(row) for row in cursor.fetchall())
+        products = pd.DataFrame(found, columns=['product_id', 'product_code', 'brand_id', 'category'])
+        products = products.astype({'product_id': 'int64', 'brand_id': 'Int64'})
+        # نفس نتيجة fetchone() القديمة عند وجود تكرار: أول منتج
+        return products.drop_duplicates(['product_code', 'brand_id', 'category'], keep='first')
+
+    def _upsert_products(self, cursor, rows):
+        """أول صف لكل (كود، براند) غير معالج سابقاً يحدد بيانات المنتج"""
+        first = rows.drop_duplicates(['product_code', 'brand_id'], keep='first')
+        first = first[[key not in self.processed_products
+                       for key in zip(first['product_code'], first['brand_id'])]]
+        if first.empty:
+            return
+
+        key = ['product_code', 'brand_id', 'category']
+        codes = first['product_code'].unique().tolist()
+        matched = first.merge(self._fetch_products(cursor, codes), on=key, how='left')
+
+        existing = matched[matched['product_id'].notna()].copy()
+        if not existing.empty:
+            existing['product_id'] = existing['product_id'].astype(int)
+            cursor.executemany('''
+                UPDATE base_products
+                SET product_type_id = ?, product_size = ?, wholesale_price = ?, retail_price = ?
+                WHERE id = ?
+            ''', _records(existing, ['type_id', 'size', 'wholesale_price', 'retail_price', 'product_id']))
+
+        new = matched[matched['product_id'].isna()]
+        if not new.empty:
+            cursor.executemany('''
+                INSERT INTO base_products
+                (product_code, brand_id, product_type_id, trader_category,
+                 product_size, wholesale_price, retail_price, supplier_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+            ''', _records(new, ['product_code', 'brand_id', 'type_id', 'category',
+                                'size', 'wholesale_price', 'retail_price']))
+            matched = first.merge(self._fetch_products(cursor, codes), on=key, how='left')
+
+        for product_code, brand_id, product_id in _records(matched, ['product_code', 'brand_id', 'product_id']):
+            self.processed_products[(product_code, brand_id)] = int(product_id)
+
+    def _fetch_variants(self, cursor, product_ids):
+        found = []
+        for chunk in _in_chunks(product_ids):
+            cursor.execute(f'''
+                SELECT id, base_product_id, color_id FROM product_variants
+                WHERE base_product_id IN ({', '.join('?' for _ in chunk)})
+                ORDER BY id
+            ''', chunk)
+            found.extend(tuple(row) for row in cursor.fetchall())
+        variants = pd.DataFrame(found, columns=['variant_id', 'product_id', 'color_id'])
+        variants = variants.astype({'variant_id': 'int64', 'product_id': 'int64', 'color_id': 'Int64'})
+        return variants.drop_duplicates(['product_id', 'color_id'], keep='first')
+
+    def _upsert_variants(self, cursor, rows):
+        """آخر صف لكل (منتج، لون) يحدد المخزون - يرجع الصفوف مع variant_id"""
+        last = rows.drop_duplicates(['product_id', 'color_id'], keep='last')
+        product_ids = last['product_id'].unique().tolist()
+        key = ['product_id', 'color_id']
+        matched = last.merge(self._fetch_variants(cursor, product_ids), on=key, how='left')
+
+        existing = matched[matched['variant_id'].notna()].copy()
+        if not existing.empty:
+            existing['variant_id'] = existing['variant_id'].astype(int)
+            cursor.executemany('UPDATE product_variants SET current_stock = ? WHERE id = ?',
+                               _records(existing, ['stock', 'variant_id']))
+
+        new = matched[matched['variant_id'].isna()]
+        if not new.empty:
+            cursor.executemany('''
+                INSERT INTO product_variants (base_product_id, color_id, current_stock)
+                VALUES (?, ?, ?)
+            ''', _records(new, ['product_id', 'color_id', 'stock']))
+            matched = last.merge(self._fetch_variants(cursor, product_ids), on=key, how='left')
+
+        matched['variant_id'] = matched['variant_id'].astype(int)
+        return rows.merge(matched[key + ['variant_id']], on=key, how='left')
+
+    def _link_tags(self, cursor, rows):
+        """ربط الـ Tags الموجودة فقط (كما في الاستيراد القديم)"""
+        tagged = rows[~rows['tags'].isin(MISSING_VALUES)][['product_id', 'tags']]
+        if tagged.empty:
+            return
+        tagged = tagged.assign(tag_name=tagged['tags'].str.split(',')).explode('tag_name')
+        tagged['tag_name'] = tagged['tag_name'].str.strip()
+        tagged = tagged[tagged['tag_name'] != '']
+
+        cursor.execute('SELECT id, tag_name FROM tags')
+        tag_ids = pd.DataFrame([tuple(row) for row in cursor.fetchall()], columns=['tag_id', 'tag_name'])
+        tag_ids = tag_ids.astype({'tag_id': 'int64', 'tag_name': object})
+        links = tagged.merge(tag_ids, on='tag_name', how='inner').drop_duplicates(['product_id', 'tag_id'])
+        if not links.empty:
+            cursor.executemany('INSERT OR IGNORE INTO product_tags (product_id, tag_id) VALUES (?, ?)',
+                               _records(links, ['product_id', 'tag_id']))
+
+    # ------------------------------------------------------------------
+    # Chunk pipeline
+    # ------------------------------------------------------------------
+
+    def _write_chunk(self, conn, rows):
+        cursor = conn.cursor()
+        if self.db.search_index_available:
+            defer_search_index(cursor)
+
+        brands, created = self._resolve_names(
+            cursor, 'brands', 'brand_name', rows['brand_name'],
+            ['brand_name'], lambda name: (name,))
+        self.created_brands.extend(created)
+
+        types, created = self._resolve_names(
+            cursor, 'product_types', 'type_name', rows['type_name'],
+            ['type_name'], lambda name: (name,))
+        self.created_types.extend(created)
+
+        colors, created = self._resolve_names(
+            cursor, 'colors', 'color_name', rows['color_name'],
+            ['color_name', 'color_code'],
+            lambda name: (name, DEFAULT_COLOR_CODES.get(name.lower(), '#FFFFFF')))
+        self.created_colors.extend(created)
+
+        rows = self._map_ids(rows, brands, 'brand_name', 'brand_id')
+        rows = self._map_ids(rows, types, 'type_name', 'type_id')
+        rows = self._map_ids(rows, colors, 'color_name', 'color_id')
+
+        self._upsert_products(cursor, rows)
+        rows['product_id'] = [self.processed_products[key]
+                              for key in zip(rows['product_code'], rows['brand_id'])]
+
+        rows = self._upsert_variants(cursor, rows)
+        self._link_tags(cursor, rows)
+        if self.db.search_index_available:
+            resume_search_index(self.db.db_type, cursor, rows['product_id'].unique().tolist())
+        return rows
+
+    def process_chunk(self, data, first_row=1):
+        """معالجة دفعة (DataFrame أو list of dicts) في transaction كتابة واحد"""
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(list(data))
+        last_row = first_row + len(df) - 1
+        rows, failed = normalize_rows(df, first_row)
+        self.failed_products.extend(failed)
+        if rows.empty:
+            return
+
+        state = (dict(self.processed_products), len(self.created_brands),
+                 len(self.created_colors), len(self.created_types))
+        try:
+            rows = self.db.run_write(lambda conn: self._write_chunk(conn, rows))
+        except Exception as e:
+            # الـ transaction اتلغى - نرجع الحالة لما قبل الدفعة
+            self.processed_products = state[0]
+            del self.created_brands[state[1]:]
+            del self.created_colors[state[2]:]
+            del self.created_types[state[3]:]
+            print(f"❌ خطأ في الصفوف {first_row}-{last_row}: {e}")
+            self.failed_products.extend({
+                'row': row,
+                'product_code': product_code,
+                'color': color_name,
+                'error': str(e)
+            } for row, product_code, color_name in _records(rows, ['row', 'product_code', 'color_name']))
+            return
+
+        self.success_count += len(rows)
+        print(f"✅ تم حفظ الصفوف {first_row}-{last_row} ({len(rows)} صف)")
+
+        if self.download_images:
+            self._queue_images(rows)
+
+    # ------------------------------------------------------------------
+    # Images
+    # ------------------------------------------------------------------
+
+    def _queue_images(self, rows):
+        """بدء تحميل صور الدفعة في الخلفية بعد الـ commit - الدفعة التالية لا تنتظرها"""
+        images = rows[~rows['image_url'].isin(MISSING_VALUES)]
+        images = images.drop_duplicates('variant_id', keep='last')
+        fetcher = get_image_fetcher()
+        for variant_id, image_url in _records(images, ['variant_id', 'image_url']):
+            self._image_futures.append(fetcher.submit(self._download_image, variant_id, image_url))
+
+    def _download_image(self, variant_id, image_url):
+        local_image_path = self.db.download_and_save_image(image_url)
+        if not local_image_path:
+            return
+        with self._images_lock:
+            self._downloaded_images.append(
+                (variant_id, local_image_path, os.path.basename(local_image_path),
+                 variants_json(find_variants(local_image_path))))
+            if len(self._downloaded_images) < IMAGE_FLUSH_SIZE:
+                return
+            batch, self._downloaded_images = self._downloaded_images, []
+        self._save_images(batch)
+
+    def _save_images(self, images):
+        self.db.run_write(lambda conn: link_color_images(conn.cursor(), images))
+        with self._images_lock:
+            self.images_saved += len(images)
+
+    def wait_for_images(self):
+        """انتظار انتهاء كل التحميلات وحفظ الباقي"""
+        for future in as_completed(self._image_futures):
+            try:
+                future.result()
+            except Exception as img_error:
+                print(f"⚠️ فشل تحميل صورة: {img_error}")
+        self._image_futures = []
+
+        with self._images_lock:
+            batch, self._downloaded_images = self._downloaded_images, []
+        if batch:
+            self._save_images(batch)
+        if self.images_saved:
+            print(f"✅ تم تحميل {self.images_saved} صورة")
+
+    def result(self):
+        return {
+            'success': True,
+            'success_count': self.success_count,
+            'failed_count': len(self.failed_products),
+            'failed_products': self.failed_products,
+            'unique_products': len({product_code for product_code, _ in self.processed_products}),
+            'created_brands': list(set(self.created_brands)),
+            'created_colors': list(set(self.created_colors)),
+            'created_types': list(set(self.created_types))
+        }
+
+
+# ---------------------------------------------------------------------------
+# Streaming readers
+# ---------------------------------------------------------------------------
+
+def _cell_text(value):
+    """نفس تحويل pd.read_excel(dtype=str): 10.0 -> '10' والخلية الفارغة None"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _header_names(values):
+    return [str(value).strip() if value is not None else f'Unnamed: {index}'
+            for index, value in enumerate(values)]
+
+
+def _is_csv(path):
+    return str(path).lower().endswith('.csv')
+
+
+def _is_xlsx(path):
+    return str(path).lower().endswith(('.xlsx', '.xlsm'))
+
+
+def read_header(file):
+    """أسماء الأعمدة فقط (path أو ملف مفتوح) بدون قراءة باقي الملف"""
+    name = getattr(file, 'filename', None) or getattr(file, 'name', None) or str(file)
+    # FileStorage من Flask: القراءة من الـ stream نفسه
+    file = getattr(file, 'stream', file)
+    if _is_csv(name):
+        return list(pd.read_csv(file, dtype=str, nrows=0).columns)
+    if _is_xlsx(name):
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            first = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+            return _header_names(first)
+        finally:
+            workbook.close()
+    return list(pd.read_excel(file, dtype=str, nrows=0).columns)
+
+
+def estimate_row_count(path):
+    """عدد صفوف البيانات التقريبي للـ progress (من أبعاد الـ sheet أو عدد الأسطر)"""
+    if _is_csv(path):
+        with open(path, 'rb') as f:
+            return max(sum(1 for _ in f) - 1, 0)
+    if _is_xlsx(path):
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max(max_row - 1, 0) if max_row else None
+    return None
+
+
+def _iter_xlsx_batches(path, batch_size, skip_rows):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _header_names(next(rows, ()))
+        width = len(header)
+        batch = []
+        blank = 0
+        first_row = skip_rows + 1
+        for index, values in enumerate(rows):
+            if index < skip_rows:
+                continue
+            values = [_cell_text(value) for value in values[:width]]
+            if all(value is None for value in values):
+                # مثل pandas: الصفوف الفارغة في آخر الـ sheet لا تُحسب
+                blank += 1
+                continue
+            if blank:
+                batch.extend([[None] * width] * blank)
+                blank = 0
+            values.extend([None] * (width - len(values)))
+            batch.append(values)
+            if len(batch) >= batch_size:
+                yield first_row, pd.DataFrame(batch[:batch_size], columns=header, dtype=object)
+                first_row += batch_size
+                batch = batch[batch_size:]
+        if batch:
+            yield first_row, pd.DataFrame(batch, columns=header, dtype=object)
+    finally:
+        workbook.close()
+
+
+def iter_row_batches(path, batch_size=IMPORT_CHUNK_SIZE, skip_rows=0):
+    """دفعات (رقم أول صف، DataFrame) من ملف Excel/CSV بدون تحميله كله
+
+    skip_rows لاستكمال استيراد من checkpoint. ملفات .xls القديمة لا يدعمها
+    openpyxl فتُقرأ بـ pandas مرة واحدة ثم تُقسم.
+    """
+    if _is_csv(path):
+        first_row = 1
+        for chunk in pd.read_csv(path, dtype=str, chunksize=batch_size):
+            # التخطي بعد القراءة (وليس skiprows) حتى تتطابق الأرقام مع الأسطر الفارغة والحقول متعددة الأسطر
+            if first_row + len(chunk) > skip_rows + 1:
+                offset = max(skip_rows + 1 - first_row, 0)
+                yield first_row + offset, chunk.iloc[offset:]
+            first_row += len(chunk)
+        return
+
+    if _is_xlsx(path):
+        yield from _iter_xlsx_batches(path, batch_size, skip_rows)
+        return
+
+    df = pd.read_excel(path, dtype=str)
+    for start in range(skip_rows, len(df), batch_size):
+        yield start + 1, df.iloc[start:start + batch_size]
+
+
+def import_products(db, excel_data, chunk_size=IMPORT_CHUNK_SIZE):
+    """استيراد كل الصفوف على دفعات - نفس نتيجة bulk_add_products_from_excel_enhanced"""
+    importer = ExcelImporter(db)
+    for start in range(0, len(excel_data), chunk_size):
+        chunk = excel_data[start:start + chunk_size]
+        print(f"🔄 معالجة الصفوف {start + 1}-{start + len(chunk)} من إجمالي {len(excel_data)}")
+        importer.process_chunk(chunk, first_row=start + 1)
+    importer.wait_for_images()
+    return importer.result()
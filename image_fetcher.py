@@ -0,0 +1,190 @@
+"""تحميل الصور من الإنترنت بالتوازي
+
+- Session لكل thread (keep-alive وإعادة استخدام الاتصالات مع نفس السيرفر)
+- حد أقصى للتحميلات المتزامنة من نفس الـ host
+- Circuit breaker: بعد عدد من الأخطاء المتتالية من نفس الـ host يتم تخطي
+  باقي صوره لفترة بدل انتظار الـ timeout مع كل صورة
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+
+class HostUnavailableError(Exception):
+    """الـ host متوقف مؤقتاً بسبب أخطاء متتالية (circuit breaker مفتوح)"""
+
+
+class CircuitBreaker:
+    """closed -> open بعد failure_threshold أخطاء متتالية، ومحاولة واحدة بعد reset_after ثانية"""
+
+    def __init__(self, failure_threshold=3, reset_after=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            # half-open: طلب تجريبي واحد، والباقي ينتظر فترة جديدة حتى تظهر نتيجته
+            self._opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class ImageFetcher:
+    def __init__(self, max_workers=8, per_host_limit=4, timeout=(5, 15),
+                 failure_threshold=3, reset_after=60.0):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._local = threading.local()
+        self._hosts_lock = threading.Lock()
+        self._host_slots = {}
+        self._breakers = {}
+        self._executor = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'downloaded': 0, 'failed': 0, 'skipped_open_circuit': 0, 'bytes': 0}
+
+    # ------------------------------------------------------------------
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.per_host_limit)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(DOWNLOAD_HEADERS)
+            self._local.session = session
+        return session
+
+    def _host(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._hosts_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_after)
+            return self._host_slots[host], self._breakers[host]
+
+    def _incr(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def download(self, url, file_path):
+        """تحميل url إلى file_path - يرجع True عند النجاح
+
+        HTTP غير 200 يرجع False، وأخطاء الشبكة تُرفع كما هي (بعد تسجيلها في
+        الـ circuit breaker). الملف يُكتب باسم مؤقت ثم يُنقل حتى لا يبقى ملف ناقص.
+        """
+        # requests يُحمل مع أول تحميل وليس مع بدء التطبيق
+        import requests
+
+        slots, breaker = self._host(url)
+        if not breaker.allow():
+            self._incr('skipped_open_circuit')
+            raise HostUnavailableError(f'Host temporarily skipped after repeated failures: {urlparse(url).netloc}')
+
+        with slots:
+            try:
+                response = self._session().get(url, timeout=self.timeout, stream=True)
+            except requests.exceptions.RequestException:
+                breaker.record_failure()
+                self._incr('failed')
+                raise
+
+            with response:
+                if response.status_code != 200:
+                    # 5xx = مشكلة في السيرفر، 4xx = مشكلة في الرابط نفسه
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    self._incr('failed')
+                    print(f"⚠️ فشل تحميل الصورة: HTTP {response.status_code} - {url}")
+                    return False
+
+                temp_path = f'{file_path}.part'
+                size = 0
+                try:
+                    with open(temp_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            if chunk:
+                                f.write(chunk)
+                                size += len(chunk)
+                    os.replace(temp_path, file_path)
+                except requests.exceptions.RequestException:
+                    breaker.record_failure()
+                    self._incr('failed')
+                    raise
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+
+        breaker.record_success()
+        self._incr('downloaded')
+        self._incr('bytes', size)
+        return True
+
+    # ------------------------------------------------------------------
+
+    def submit(self, fn, *args):
+        """تنفيذ fn(*args) في الـ thread pool - يرجع Future"""
+        if self._executor is None:
+            with self._hosts_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='image-fetch')
+        return self._executor.submit(fn, *args)
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+        with self._hosts_lock:
+            data['open_circuits'] = sorted(host for host, breaker in self._breakers.items() if breaker.is_open)
+        return data
+
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+
+def get_image_fetcher():
+    """ImageFetcher واحد للـ process (الـ sessions والـ breakers مشتركة بين كل الاستيرادات)"""
+    global _shared_fetcher
+    with _shared_fetcher_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = ImageFetcher(
+                max_workers=int(os.getenv('IMAGE_FETCH_WORKERS', '8')),
+                per_host_limit=int(os.getenv('IMAGE_FETCH_PER_HOST', '4'))
+            )
+        return _shared_fetcher
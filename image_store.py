@@ -0,0 +1,277 @@
+"""مخزن صور بعنوان المحتوى (content-addressed) مفتاحه SHA-256
+
+نفس صورة المورد كانت تُحفظ مرة لكل كود/لون:
+    static/uploads/products/<product_code>/<code>_<color>.<ext>
+الآن كل ملف يُحفظ مرة واحدة باسم الـ hash الخاص بمحتواه:
+    static/uploads/blobs/ab/ab12...ef.jpg
+(والنسخ المصغرة بجانبه ab12...ef_64.webp ... تُنشأ مرة واحدة لكل blob).
+
+- color_images.image_hash يشير للـ blob و image_url هو رابطه
+- image_blobs.ref_count يُحدث بـ triggers على color_images (إضافة/تعديل/حذف)
+- الامتداد يُحدد من محتوى الصورة نفسها، فنفس الـ bytes لها دائماً نفس الرابط
+
+الأوامر:
+    python image_store.py migrate [--delete-originals]   نقل الصور القديمة للمخزن
+    python image_store.py gc                             إعادة العد وحذف الـ blobs غير المستخدمة
+    python image_store.py stats
+"""
+import glob
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from PIL import Image
+
+from image_variants import (THUMBNAIL_SIZES, VARIANT_FORMATS, create_variants, find_variants,
+                            local_path, variant_url, variants_json)
+
+BLOB_DIR = os.path.join('static', 'uploads', 'blobs')
+BLOB_URL_PREFIX = '/static/uploads/blobs/'
+BLOB_URL_PATTERN = re.compile(r'^/static/uploads/blobs/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$')
+BLOB_NAME_PATTERN = re.compile(r'^([0-9a-f]{64})\.[a-z0-9]+$')
+
+# صيغة Pillow -> الامتداد المحفوظ
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# الـ gc لا يحذف blob أحدث من هذه المدة (ممكن يكون محفوظ ولم يُسجل بعد)
+GC_GRACE_SECONDS = 60 * 60
+
+COLOR_IMAGE_UPSERT = '''
+    INSERT INTO color_images (variant_id, image_url, image_filename, image_variants, image_hash)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (variant_id) DO UPDATE SET
+        image_url = excluded.image_url,
+        image_filename = excluded.image_filename,
+        image_variants = excluded.image_variants,
+        image_hash = excluded.image_hash
+'''
+
+
+def blob_url(sha256, extension):
+    return f'{BLOB_URL_PREFIX}{sha256[:2]}/{sha256}{extension}'
+
+
+def blob_hash(image_url):
+    """الـ SHA-256 من رابط blob (None للروابط الأخرى)"""
+    match = BLOB_URL_PATTERN.match(image_url or '')
+    return match.group(1) if match else None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _detect_extension(path):
+    try:
+        with Image.open(path) as image:
+            return FORMAT_EXTENSIONS.get(image.format)
+    except Exception:
+        return None
+
+
+def new_temp_path(suffix='.part'):
+    """ملف مؤقت داخل المخزن نفسه حتى يكون os.replace للـ blob atomic"""
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=BLOB_DIR)
+    os.close(fd)
+    return path
+
+
+def store_file(temp_path, extension='.jpg'):
+    """نقل ملف مؤقت للمخزن - يرجع رابط الـ blob
+
+    لو المحتوى موجود مسبقاً يُحذف الملف المؤقت ولا يُكتب شيء. extension
+    يُستخدم فقط لو تعذر تحديد الصيغة من المحتوى.
+    """
+    sha256 = file_sha256(temp_path)
+    url = blob_url(sha256, _detect_extension(temp_path) or extension)
+    target = local_path(url)
+
+    if os.path.exists(target):
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+
+    create_variants(url)
+    return url
+
+
+def register_blob(cursor, image_url):
+    """تسجيل الـ blob في image_blobs (بدون تغيير ref_count) - يرجع الـ hash أو None"""
+    sha256 = blob_hash(image_url)
+    if sha256 is None:
+        return None
+    path = local_path(image_url)
+    size = os.path.getsize(path) if os.path.exists(path) else None
+    cursor.execute('''
+        INSERT INTO image_blobs (sha256, image_url, size_bytes, created_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (sha256) DO UPDATE SET image_url = excluded.image_url, size_bytes = excluded.size_bytes
+    ''', (sha256, image_url, size, datetime.now().isoformat(sep=' ', timespec='seconds')))
+    return sha256
+
+
+def link_color_images(cursor, images):
+    """ربط صور بالمتغيرات - images: (variant_id, image_url, image_filename, image_variants)
+
+    upsert وليس INSERT OR REPLACE: الـ REPLACE يحذف الصف القديم بدون تشغيل
+    trigger الحذف فيبقى ref_count الـ blob القديم زائداً.
+    """
+    rows = [(variant_id, image_url, image_filename, variants, register_blob(cursor, image_url))
+            for variant_id, image_url, image_filename, variants in images]
+    cursor.executemany(COLOR_IMAGE_UPSERT, rows)
+    return len(rows)
+
+
+# ---------------------------------------------------------------------------
+# Maintenance
+# ---------------------------------------------------------------------------
+
+def _fetch(db, query, params=()):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return [tuple(row.values()) if isinstance(row, dict) else tuple(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def _remove_blob_files(image_url):
+    """حذف الـ blob ونسخه المصغرة - يرجع عدد الـ bytes المحررة"""
+    path = local_path(image_url)
+    freed = 0
+    for file_path in [path] + glob.glob(f'{os.path.splitext(path)[0]}_*'):
+        if os.path.exists(file_path):
+            freed += os.path.getsize(file_path)
+            os.remove(file_path)
+    return freed
+
+
+def migrate_legacy(db, delete_originals=False, workers=None):
+    """نقل صور color_images المحلية القديمة للمخزن وتحديث الروابط"""
+    rows = _fetch(db, '''
+        SELECT id, image_url FROM color_images
+        WHERE image_url LIKE '/static/%' AND image_hash IS NULL
+    ''')
+    rows = [row for row in rows if blob_hash(row[1]) is None and os.path.exists(local_path(row[1]))]
+    print(f"🔄 نقل {len(rows)} صورة للمخزن...")
+
+    def store(row):
+        temp_path = new_temp_path()
+        shutil.copyfile(local_path(row[1]), temp_path)
+        return store_file(temp_path, os.path.splitext(row[1])[1].lower() or '.jpg')
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        urls = list(executor.map(store, rows))
+
+    def update(conn):
+        cursor = conn.cursor()
+        for (image_id, _), url in zip(rows, urls):
+            cursor.execute('''
+                UPDATE color_images SET image_url = ?, image_filename = ?, image_variants = ?, image_hash = ?
+                WHERE id = ?
+            ''', (url, os.path.basename(url), variants_json(find_variants(url)),
+                  register_blob(cursor, url), image_id))
+
+    db.run_write(update)
+
+    old_bytes = sum(os.path.getsize(local_path(row[1])) for row in rows)
+    new_bytes = sum(os.path.getsize(local_path(url)) for url in set(urls))
+    print(f"✅ {len(rows)} صورة -> {len(set(urls))} blob "
+          f"({old_bytes / 1024 / 1024:.1f}MB -> {new_bytes / 1024 / 1024:.1f}MB)")
+
+    if delete_originals:
+        still_used = {row[0] for row in _fetch(db, 'SELECT DISTINCT image_url FROM color_images')}
+        for old_url in {row[1] for row in rows} - still_used:
+            os.remove(local_path(old_url))
+            for size in THUMBNAIL_SIZES:
+                for extension in VARIANT_FORMATS:
+                    derived = local_path(variant_url(old_url, size, extension))
+                    if os.path.exists(derived):
+                        os.remove(derived)
+        print("🗑️ تم حذف الملفات القديمة")
+    return len(rows)
+
+
+def recount(db):
+    """إعادة حساب ref_count من color_images (بعد restore أو تعديل SQL مباشر)"""
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO image_blobs (sha256, ref_count)
+            SELECT DISTINCT image_hash, 0 FROM color_images
+            WHERE image_hash IS NOT NULL AND image_hash NOT IN (SELECT sha256 FROM image_blobs)
+        ''')
+        cursor.execute('''
+            UPDATE image_blobs SET ref_count = (
+                SELECT COUNT(*) FROM color_images ci WHERE ci.image_hash = image_blobs.sha256
+            )
+        ''')
+
+    db.run_write(write)
+
+
+def gc(db, grace_seconds=GC_GRACE_SECONDS):
+    """حذف الـ blobs التي لا يشير لها أي صف - يرجع (عدد الـ blobs، الـ bytes المحررة)
+
+    يُشغل يدوياً والاستيراد متوقف: blob قديم غير مستخدم قد يُربط من جديد
+    أثناء الـ gc. الـ blobs الأحدث من grace_seconds لا تُحذف.
+    """
+    recount(db)
+    referenced = {row[0] for row in _fetch(db, 'SELECT sha256 FROM image_blobs WHERE ref_count > 0')}
+    cutoff = time.time() - grace_seconds
+
+    removed = []
+    freed = 0
+    for path in glob.glob(os.path.join(BLOB_DIR, '*', '*')):
+        match = BLOB_NAME_PATTERN.match(os.path.basename(path))
+        if not match or match.group(1) in referenced or os.path.getmtime(path) > cutoff:
+            continue
+        freed += _remove_blob_files(blob_url(match.group(1), os.path.splitext(path)[1]))
+        removed.append(match.group(1))
+
+    if removed:
+        db.run_write(lambda conn: conn.cursor().executemany(
+            'DELETE FROM image_blobs WHERE sha256 = ? AND ref_count = 0', [(sha256,) for sha256 in removed]))
+    print(f"🗑️ تم حذف {len(removed)} blob غير مستخدم ({freed / 1024 / 1024:.1f}MB)")
+    return len(removed), freed
+
+
+def stats(db):
+    """عدد الـ blobs والمراجع والمساحة الموفرة بالـ deduplication"""
+    row = _fetch(db, '''
+        SELECT COUNT(*), COALESCE(SUM(ref_count), 0), COALESCE(SUM(size_bytes), 0),
+               COALESCE(SUM(size_bytes * (ref_count - 1)), 0)
+        FROM image_blobs WHERE ref_count > 0
+    ''')[0]
+    return {
+        'blobs': row[0],
+        'references': row[1],
+        'stored_bytes': row[2],
+        'deduplicated_bytes': row[3],
+    }
+
+
+if __name__ == '__main__':
+    from database import StockDatabase
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    database = StockDatabase()
+    if command == 'migrate':
+        migrate_legacy(database, delete_originals='--delete-originals' in sys.argv[2:])
+    elif command == 'gc':
+        gc(database)
+    print(stats(database))
@@ -0,0 +1,327 @@
+"""مزامنة صور المنتجات مع Dropbox (تزايدية بـ manifest)
+
+النسخ الاحتياطية تحفظ صفوف الجداول فقط، فالنسخة المسترجعة على instance جديد
+كانت ترجع بروابط صور مكسورة. هنا كل ما تحت static/uploads يُرفع إلى
+/images/<نفس المسار> مع manifest في /images/manifest.json:
+    {"blobs/ab/ab12....jpg": {"sha256": "ab12...", "size": 48213}, ...}
+
+- sync: يرفع فقط الملفات الجديدة أو التي تغير الـ hash الخاص بها، على
+  SYNC_WORKERS بالتوازي. الـ manifest يُحفظ كل CHECKPOINT_EVERY ملف، فالمزامنة
+  المتوقفة تكمل من حيث توقفت. المزامنة المتكررة بدون تغييرات لا ترفع شيئاً
+- الـ hash لملفات المخزن (image_store) من اسمها، وللملفات الأخرى من
+  image_sync_state.json (cache بالحجم و mtime) فلا يُعاد حسابه كل مرة
+- النسخ المصغرة (image_variants) لا تُرفع - تُنشأ من جديد بعد التحميل
+- pull: تحميل الملفات الناقصة بالتوازي (في الخلفية بعد الـ restore)، و
+  init_image_sync يحمّل أي صورة تُطلب قبل وصول الـ pull لها عند أول طلب
+
+المزامنة لا تحذف ملفات من Dropbox (instance فارغ قبل الـ restore لا يمسح
+الصور المرفوعة).
+
+من سطر الأوامر:
+    python image_sync.py [sync|pull|status]
+"""
+import json
+import os
+import re
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+
+from backup_stream import upload_file
+from image_store import BLOB_NAME_PATTERN, file_sha256
+from image_variants import THUMBNAIL_SIZES, VARIANT_FORMATS, create_variants
+
+UPLOADS_DIR = os.path.join('static', 'uploads')
+UPLOADS_URL_PREFIX = '/static/uploads/'
+REMOTE_DIR = '/images'
+MANIFEST_PATH = f'{REMOTE_DIR}/manifest.json'
+LOCAL_STATE_PATH = 'image_sync_state.json'
+SYNC_WORKERS = int(os.getenv('IMAGE_SYNC_WORKERS', '4'))
+CHECKPOINT_EVERY = 50
+
+VARIANT_PATTERN = re.compile(r'^(.*)_({})\.({})$'.format(
+    '|'.join(str(size) for size in THUMBNAIL_SIZES), '|'.join(VARIANT_FORMATS)))
+SKIP_SUFFIXES = ('.part', '.gz', '.br')
+
+
+def remote_path(relpath):
+    return f'{REMOTE_DIR}/{relpath}'
+
+
+def local_file(relpath):
+    return os.path.join(UPLOADS_DIR, *relpath.split('/'))
+
+
+def image_url(relpath):
+    return UPLOADS_URL_PREFIX + relpath
+
+
+def is_variant(relpath):
+    return VARIANT_PATTERN.match(relpath) is not None
+
+
+def _is_not_found(error):
+    try:
+        return error.error.is_path() and error.error.get_path().is_not_found()
+    except AttributeError:
+        return False
+
+
+def scan(cache):
+    """الملفات الأصلية تحت static/uploads - {relpath: {'sha256', 'size'}}
+
+    cache: {relpath: [size, mtime_ns, sha256]} ويتم تحديثه في مكانه.
+    """
+    files = {}
+    for root, _, names in os.walk(UPLOADS_DIR):
+        for name in names:
+            if name.startswith('.') or name.endswith(SKIP_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, UPLOADS_DIR).replace(os.sep, '/')
+            if is_variant(relpath):
+                continue
+            stat = os.stat(path)
+            match = BLOB_NAME_PATTERN.match(name)
+            if match:
+                sha256 = match.group(1)
+            else:
+                cached = cache.get(relpath)
+                if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                    sha256 = cached[2]
+                else:
+                    sha256 = file_sha256(path)
+                    cache[relpath] = [stat.st_size, stat.st_mtime_ns, sha256]
+            files[relpath] = {'sha256': sha256, 'size': stat.st_size}
+    return files
+
+
+def _load_local_state():
+    try:
+        with open(LOCAL_STATE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_local_state(cache):
+    temp_path = f'{LOCAL_STATE_PATH}.{uuid.uuid4().hex}.part'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(temp_path, LOCAL_STATE_PATH)
+
+
+class ImageSync:
+    """مزامنة static/uploads مع Dropbox عبر dbx (DropboxClient)"""
+
+    def __init__(self, dbx, workers=SYNC_WORKERS):
+        self.dbx = dbx
+        self.workers = workers
+        self._manifest = None
+        self._stems = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._stats = {'uploaded': 0, 'uploaded_bytes': 0, 'downloaded': 0, 'downloaded_bytes': 0,
+                       'lazy_fetches': 0, 'failed': 0, 'last_sync': None, 'last_pull': None}
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+
+    def manifest(self, reload=False):
+        """الـ manifest المرفوع - يُحمل مرة واحدة ثم يبقى في الذاكرة"""
+        import dropbox
+
+        with self._lock:
+            if self._manifest is None or reload:
+                try:
+                    _, response = self.dbx.files_download(MANIFEST_PATH)
+                    self._manifest = json.loads(response.content.decode('utf-8'))
+                except dropbox.exceptions.ApiError as e:
+                    if not _is_not_found(e):
+                        raise
+                    self._manifest = {}
+                self._stems = None
+            return self._manifest
+
+    def _save_manifest(self):
+        import dropbox
+
+        with self._lock:
+            data = json.dumps(self._manifest, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        self.dbx.files_upload(data, MANIFEST_PATH, mode=dropbox.files.WriteMode.overwrite)
+
+    def _original_for(self, relpath):
+        """relpath لصورة أصلية من الـ manifest (أو الأصل لو كان relpath نسخة مصغرة)"""
+        manifest = self.manifest()
+        if relpath in manifest:
+            return relpath
+        match = VARIANT_PATTERN.match(relpath)
+        if not match:
+            return None
+        with self._lock:
+            if self._stems is None:
+                self._stems = {os.path.splitext(path)[0]: path for path in self._manifest}
+            return self._stems.get(match.group(1))
+
+    # ------------------------------------------------------------------
+    # Sync / pull
+    # ------------------------------------------------------------------
+
+    def sync(self):
+        """رفع الصور الجديدة أو المتغيرة - يرجع ملخص المزامنة"""
+        with self._sync_lock:
+            manifest = self.manifest()
+            cache = _load_local_state()
+            files = scan(cache)
+            _save_local_state(cache)
+            pending = [relpath for relpath, entry in files.items() if manifest.get(relpath) != entry]
+            summary = {'files': len(files), 'uploaded': 0, 'bytes': 0, 'failed': 0}
+            if not pending:
+                self._stats['last_sync'] = summary
+                return summary
+
+            print(f"🔄 مزامنة {len(pending)} صورة من {len(files)} مع Dropbox...")
+            since_checkpoint = 0
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-sync') as executor:
+                futures = {executor.submit(upload_file, self.dbx, local_file(relpath), remote_path(relpath)): relpath
+                           for relpath in pending}
+                for future, relpath in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        summary['failed'] += 1
+                        print(f"⚠️ فشل رفع {relpath}: {e}")
+                        continue
+                    with self._lock:
+                        self._manifest[relpath] = files[relpath]
+                        self._stems = None
+                    summary['uploaded'] += 1
+                    summary['bytes'] += files[relpath]['size']
+                    since_checkpoint += 1
+                    if since_checkpoint >= CHECKPOINT_EVERY:
+                        self._save_manifest()
+                        since_checkpoint = 0
+            if since_checkpoint:
+                self._save_manifest()
+
+            self._add_stats(uploaded=summary['uploaded'], uploaded_bytes=summary['bytes'],
+                            failed=summary['failed'])
+            self._stats['last_sync'] = summary
+            print(f"✅ مزامنة الصور: {summary['uploaded']} ملف ({summary['bytes'] / 1024 / 1024:.1f} MB)")
+            return summary
+
+    def fetch(self, relpath):
+        """تحميل ملف واحد من الـ manifest (مع إنشاء نسخه المصغرة) - يرجع True لو تم"""
+        path = local_file(relpath)
+        temp_path = f'{path}.{uuid.uuid4().hex}.part'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            self.dbx.files_download_to_file(temp_path, remote_path(relpath))
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        create_variants(image_url(relpath))
+        self._add_stats(downloaded=1, downloaded_bytes=os.path.getsize(path))
+        return True
+
+    def missing(self, manifest=None):
+        manifest = manifest if manifest is not None else self.manifest()
+        return [relpath for relpath, entry in manifest.items()
+                if not os.path.isfile(local_file(relpath))
+                or os.path.getsize(local_file(relpath)) != entry['size']]
+
+    def pull(self):
+        """تحميل كل الصور الناقصة محلياً بالتوازي - يرجع ملخص التحميل"""
+        pending = self.missing(self.manifest(reload=True))
+        summary = {'files': len(self._manifest), 'downloaded': 0, 'failed': 0}
+        if pending:
+            print(f"📥 تحميل {len(pending)} صورة من Dropbox...")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-pull') as executor:
+            for relpath, future in [(relpath, executor.submit(self.fetch, relpath)) for relpath in pending]:
+                try:
+                    future.result()
+                    summary['downloaded'] += 1
+                except Exception as e:
+                    summary['failed'] += 1
+                    print(f"⚠️ فشل تحميل {relpath}: {e}")
+        self._add_stats(failed=summary['failed'])
+        self._stats['last_pull'] = summary
+        if pending:
+            print(f"✅ تم تحميل {summary['downloaded']} صورة")
+        return summary
+
+    def pull_in_background(self):
+        thread = threading.Thread(target=self.pull, name='image-pull', daemon=True)
+        thread.start()
+        return thread
+
+    def fetch_missing(self, relpath):
+        """تحميل صورة مطلوبة غير موجودة محلياً (أو أصل نسختها المصغرة)"""
+        original = self._original_for(relpath)
+        if original is None:
+            return False
+        if original != relpath and os.path.isfile(local_file(original)):
+            return bool(create_variants(image_url(original)))
+        self._add_stats(lazy_fetches=1)
+        return self.fetch(original)
+
+    # ------------------------------------------------------------------
+
+    def _add_stats(self, **values):
+        with self._lock:
+            for key, amount in values.items():
+                self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['manifest_files'] = len(self._manifest) if self._manifest is not None else None
+        return data
+
+
+def init_image_sync(app, get_image_sync):
+    """تحميل صور /static/uploads/ الناقصة من Dropbox عند أول طلب لها
+
+    get_image_sync() يرجع ImageSync (أو None لو Dropbox غير متاح).
+    """
+
+    @app.before_request
+    def fetch_missing_upload():
+        if request.endpoint != 'static' or not request.view_args:
+            return None
+        filename = request.view_args.get('filename', '')
+        if not filename.startswith('uploads/') or '..' in filename.split('/'):
+            return None
+        relpath = filename[len('uploads/'):]
+        if os.path.isfile(local_file(relpath)):
+            return None
+        image_sync = get_image_sync()
+        if image_sync is None:
+            return None
+        try:
+            image_sync.fetch_missing(relpath)
+        except Exception as e:
+            print(f"⚠️ فشل تحميل {relpath} من Dropbox: {e}")
+        return None
+
+    return app
+
+
+if __name__ == '__main__':
+    from dropbox_oauth_backup import DropboxOAuthBackup
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    backup = DropboxOAuthBackup()
+    if backup.images is None:
+        sys.exit("❌ Dropbox غير متاح")
+    if command == 'sync':
+        print(backup.images.sync())
+    elif command == 'pull':
+        print(backup.images.pull())
+    else:
+        print({'missing': len(backup.images.missing()), **backup.images.stats()})
@@ -0,0 +1,179 @@
+"""نسخ مصغرة (thumbnails) لصور المنتجات بصيغتي WebP و JPEG
+
+الصفحات تعرض الصور في مربعات 30-50px لكن كانت تحمل الصورة الأصلية كاملة.
+عند حفظ أي صورة يتم إنشاء نسخ بالمقاسات THUMBNAIL_SIZES بجانبها:
+    P1_black.jpg -> P1_black_64.webp, P1_black_64.jpg, P1_black_200.webp ...
+
+الروابط تُحفظ في color_images.image_variants كـ JSON:
+    [{"size": 64, "webp": "/static/...", "jpg": "/static/..."}, ...]
+والـ templates تبني منها srcset (image_srcset / thumbnail_url).
+
+لإنشاء النسخ للصور الموجودة:
+    python image_variants.py [--force]
+"""
+import json
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = (64, 200, 800)
+
+# امتداد -> (صيغة Pillow، إعدادات الحفظ)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+STATIC_PREFIX = '/static/'
+
+
+def local_path(image_url):
+    """/static/uploads/... -> static/uploads/... (None للروابط الخارجية)"""
+    if not image_url or not image_url.startswith(STATIC_PREFIX):
+        return None
+    return image_url.lstrip('/').replace('/', os.sep)
+
+
+def variant_url(image_url, size, extension):
+    stem = os.path.splitext(image_url)[0]
+    return f'{stem}_{size}.{extension}'
+
+
+def _flatten(image):
+    """JPEG لا يدعم الشفافية - الخلفية الشفافة تصبح بيضاء"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def create_variants(image_url, force=False):
+    """إنشاء النسخ المصغرة لصورة محلية - يرجع قائمة الـ variants (فارغة عند الفشل)
+
+    النسخ الموجودة والأحدث من الأصل لا يعاد إنشاؤها إلا مع force.
+    """
+    source = local_path(image_url)
+    if source is None or not os.path.exists(source):
+        return []
+
+    source_mtime = os.path.getmtime(source)
+    pending = []
+    for size in THUMBNAIL_SIZES:
+        for extension in VARIANT_FORMATS:
+            target = local_path(variant_url(image_url, size, extension))
+            if force or not os.path.exists(target) or os.path.getmtime(target) < source_mtime:
+                pending.append((size, extension, target))
+
+    if pending:
+        try:
+            with Image.open(source) as image:
+                image = ImageOps.exif_transpose(image)
+                image.load()
+                resized = {}
+                for size, extension, target in pending:
+                    if size not in resized:
+                        resized[size] = image.copy()
+                        # thumbnail لا يكبر الصور الأصغر من المقاس
+                        resized[size].thumbnail((size, size), Image.LANCZOS)
+                    pil_format, options = VARIANT_FORMATS[extension]
+                    frame = resized[size]
+                    if pil_format == 'JPEG':
+                        frame = _flatten(frame)
+                    elif frame.mode not in ('RGB', 'RGBA'):
+                        frame = frame.convert('RGBA')
+                    # اسم مؤقت فريد - نفس الـ blob ممكن يُحفظ من أكثر من thread
+                    temp_path = f'{target}.{uuid.uuid4().hex}.part'
+                    frame.save(temp_path, pil_format, **options)
+                    os.replace(temp_path, target)
+        except Exception as e:
+            print(f"⚠️ فشل إنشاء النسخ المصغرة لـ {image_url}: {e}")
+            return []
+
+    return find_variants(image_url)
+
+
+def find_variants(image_url):
+    """الـ variants الموجودة على القرص لصورة"""
+    if local_path(image_url) is None:
+        return []
+    variants = []
+    for size in THUMBNAIL_SIZES:
+        urls = {extension: variant_url(image_url, size, extension) for extension in VARIANT_FORMATS}
+        if all(os.path.exists(local_path(url)) for url in urls.values()):
+            variants.append({'size': size, **urls})
+    return variants
+
+
+def variants_json(variants):
+    """قيمة عمود image_variants (NULL بدون نسخ)"""
+    return json.dumps(variants) if variants else None
+
+
+# ---------------------------------------------------------------------------
+# Template helpers
+# ---------------------------------------------------------------------------
+
+def _parse(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return []
+    return value
+
+
+def image_srcset(value, extension='webp'):
+    """srcset من عمود image_variants: "/..._64.webp 64w, /..._200.webp 200w, ..." """
+    return ', '.join(f"{variant[extension]} {variant['size']}w"
+                     for variant in _parse(value) if extension in variant)
+
+
+def thumbnail_url(value, size=64, extension='jpg'):
+    """أصغر نسخة مقاسها >= size (أو أكبر نسخة متاحة) - '' بدون نسخ"""
+    variants = [variant for variant in _parse(value) if extension in variant]
+    if not variants:
+        return ''
+    for variant in sorted(variants, key=lambda variant: variant['size']):
+        if variant['size'] >= size:
+            return variant[extension]
+    return variants[-1][extension]
+
+
+# ---------------------------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------------------------
+
+def backfill(db, force=False, workers=None):
+    """إنشاء النسخ لكل صور color_images المحلية وتحديث image_variants"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, image_url FROM color_images WHERE image_url LIKE '/static/%'")
+    rows = [tuple(row.values()) if isinstance(row, dict) else tuple(row) for row in cursor.fetchall()]
+    conn.close()
+
+    print(f"🔄 إنشاء النسخ المصغرة لـ {len(rows)} صورة...")
+    # Pillow يحرر الـ GIL أثناء الضغط فالـ threads تستخدم كل الأنوية
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = list(executor.map(lambda row: create_variants(row[1], force=force), rows))
+
+    # صورة بدون ملف أصلي لا تمسح نسخاً أنشأها تشغيل سابق
+    updates = [(variants_json(variants), row[0]) for row, variants in zip(rows, results) if variants]
+    db.run_write(lambda conn: conn.cursor().executemany(
+        'UPDATE color_images SET image_variants = ? WHERE id = ?', updates))
+
+    done = sum(1 for variants in results if variants)
+    print(f"✅ تم إنشاء النسخ لـ {done} صورة ({len(rows) - done} بدون ملف أصلي أو فشلت)")
+    return done
+
+
+if __name__ == '__main__':
+    from database import StockDatabase
+
+    backfill(StockDatabase(), force='--force' in sys.argv[1:])
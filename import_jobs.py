@@ -0,0 +1,288 @@
+"""استيراد Excel كمهام في الخلفية (background jobs)
+
+الـ request يحفظ الملف ويسجل مهمة في جدول import_jobs ثم يرجع فوراً،
+وworker pool في نفس الـ process ينفذ الاستيراد على دفعات:
+- بعد كل دفعة يتم حفظ checkpoint (عدد الصفوف المعالجة والنجاح والفشل)،
+  فلو توقف الـ process تكمل المهمة من آخر دفعة عند التشغيل التالي
+- إعادة دفعة بعد توقف قبل حفظ الـ checkpoint آمنة: الاستيراد upsert
+  (المنتج والمخزون بنفس القيم، والـ Tags بـ INSERT OR IGNORE)
+- الملف يُقرأ كدفعات (iter_row_batches) فلا يتم تحميله كله في الذاكرة
+- /jobs/<id> يقرأ حالة المهمة من الجدول (من أي worker) مع الـ ETA
+- كل مهمة running مسجلة باسم الـ process المنفذ (owner = BOOT_ID)، وthread
+  يحدّث heartbeat_at لمهامه كل HEARTBEAT_INTERVAL ثانية. مهمة running بدون
+  heartbeat حديث (process انتهى أثناءها، حتى لو أعيد التشغيل فوراً) تُعاد
+  للطابور عند بدء التشغيل أو في الفحص الدوري
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+IMPORT_JOBS_DIR = os.getenv('IMPORT_JOBS_DIR', 'import_jobs')
+# عدد الأخطاء المحفوظة مع المهمة (العدد الكلي في failed_count)
+MAX_STORED_FAILURES = 500
+# كل process له id جديد - المهام running لـ owner آخر بدون heartbeat متوقفة
+BOOT_ID = uuid.uuid4().hex
+HEARTBEAT_INTERVAL = 30
+# مهمة running بدون heartbeat لهذه المدة تعتبر متوقفة (process انتهى أثناءها)
+STALE_AFTER = 4 * HEARTBEAT_INTERVAL
+
+JOB_COLUMNS = [
+    'id', 'status', 'filename', 'file_path', 'total_rows', 'rows_processed',
+    'start_row', 'success_count', 'failed_count', 'failures', 'result', 'error',
+    'created_at', 'started_at', 'heartbeat_at', 'finished_at', 'owner',
+]
+
+
+def _now():
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+
+def _stale_before():
+    return datetime.fromtimestamp(time.time() - STALE_AFTER).isoformat(sep=' ', timespec='seconds')
+
+
+def _row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return dict(row)
+    return dict(zip(JOB_COLUMNS, row))
+
+
+class ImportJobManager:
+    """طابور مهام الاستيراد وworker threads تنفذها
+
+    on_complete(job_id, result) تُستدعى بعد نجاح المهمة (مثلاً نسخة احتياطية).
+    """
+
+    def __init__(self, db, workers=2, chunk_size=None, jobs_dir=IMPORT_JOBS_DIR,
+                 on_complete=None):
+        self.db = db
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.jobs_dir = jobs_dir
+        self.on_complete = on_complete
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._heartbeat_thread = None
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Enqueue / status
+    # ------------------------------------------------------------------
+
+    def create_job(self, file_storage, filename):
+        """حفظ الملف المرفوع وتسجيل المهمة - يرجع job id"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        file_path = os.path.join(self.jobs_dir, f'{job_id}{os.path.splitext(filename)[1].lower()}')
+        file_storage.save(file_path)
+
+        self.db.run_write(lambda conn: conn.cursor().execute('''
+            INSERT INTO import_jobs (id, status, filename, file_path, created_at)
+            VALUES (?, 'queued', ?, ?, ?)
+        ''', (job_id, filename, file_path, _now())))
+        self.enqueue(job_id)
+        print(f"📦 تم تسجيل مهمة استيراد {job_id} ({filename})")
+        return job_id
+
+    def enqueue(self, job_id):
+        self._ensure_started()
+        self._queue.put(job_id)
+
+    def get_job(self, job_id):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM import_jobs WHERE id = ?", (job_id,))
+        job = _row_to_dict(cursor.fetchone())
+        conn.close()
+        return job
+
+    def job_status(self, job_id):
+        """حالة المهمة للـ API - يرجع None لو غير موجودة"""
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+
+        total = job['total_rows']
+        processed = job['rows_processed'] or 0
+        rows_per_second = None
+        eta_seconds = None
+        if job['status'] == 'running' and job['started_at']:
+            elapsed = time.time() - datetime.fromisoformat(job['started_at']).timestamp()
+            done_in_run = processed - (job['start_row'] or 0)
+            if elapsed > 0 and done_in_run > 0:
+                rows_per_second = round(done_in_run / elapsed, 1)
+                if total:
+                    eta_seconds = round((total - processed) / rows_per_second)
+
+        return {
+            'id': job['id'],
+            'status': job['status'],
+            'filename': job['filename'],
+            'total_rows': total,
+            'rows_processed': processed,
+            'progress': round(processed * 100 / total, 1) if total else 0.0,
+            'success_count': job['success_count'] or 0,
+            'failed_count': job['failed_count'] or 0,
+            'failures': json.loads(job['failures']) if job['failures'] else [],
+            'rows_per_second': rows_per_second,
+            'eta_seconds': eta_seconds,
+            'result': json.loads(job['result']) if job['result'] else None,
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+        }
+
+    def resume_pending(self, include_queued=True):
+        """إعادة المهام التي لم تنتهِ للطابور - يرجع أرقامها
+
+        running لـ process آخر بدون heartbeat حديث تُعاد دائماً، و queued فقط
+        عند بدء التشغيل (include_queued) لأنها في طابور process حي غير ذلك.
+        """
+        self._ensure_started()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id FROM import_jobs
+            WHERE {"status = 'queued' OR " if include_queued else ''}
+                  (status = 'running' AND (owner IS NULL OR owner <> ?) AND heartbeat_at < ?)
+            ORDER BY created_at
+        ''', (BOOT_ID, _stale_before()))
+        job_ids = [row['id'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+        conn.close()
+        for job_id in job_ids:
+            print(f"🔄 استكمال مهمة استيراد {job_id}")
+            self.enqueue(job_id)
+        return job_ids
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self):
+        with self._start_lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for index in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._worker, name=f'import-job-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat, name='import-job-heartbeat',
+                                                          daemon=True)
+                self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        """تحديث heartbeat_at لمهام هذا الـ process وإعادة المهام المتوقفة للطابور"""
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.touch_running()
+                self.resume_pending(include_queued=False)
+            except Exception as e:
+                print(f"⚠️ خطأ في heartbeat مهام الاستيراد: {e}")
+
+    def touch_running(self):
+        self.db.run_write(lambda conn: conn.cursor().execute(
+            "UPDATE import_jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+            (_now(), BOOT_ID)))
+
+    def stop(self):
+        """إيقاف فحص الـ heartbeat (الـ workers daemon threads)"""
+        self._stop.set()
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self.run_job(job_id)
+            except Exception as e:
+                print(f"❌ خطأ في مهمة الاستيراد {job_id}: {e}")
+                self._update(job_id, status='failed', error=str(e), finished_at=_now())
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        self.db.run_write(lambda conn: conn.cursor().execute(
+            f'UPDATE import_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id)))
+
+    def _claim(self, job_id):
+        """تحويل المهمة لـ running باسم هذا الـ process - False لو worker آخر أخذها أو انتهت"""
+        now = _now()
+
+        def claim(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE import_jobs
+                SET status = 'running', owner = ?, started_at = ?, heartbeat_at = ?, start_row = rows_processed
+                WHERE id = ? AND (status = 'queued' OR (status = 'running' AND (owner IS NULL OR owner <> ?)
+                                                        AND heartbeat_at < ?))
+            ''', (BOOT_ID, now, now, job_id, BOOT_ID, _stale_before()))
+            return cursor.rowcount == 1
+
+        return self.db.run_write(claim)
+
+    def _checkpoint(self, job_id, rows_processed, succeeded, failures):
+        """حفظ تقدم الدفعة - الأخطاء تُضاف لقائمة محدودة بـ MAX_STORED_FAILURES"""
+        def checkpoint(conn):
+            cursor = conn.cursor()
+            cursor.execute('SELECT failures FROM import_jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            value = row['failures'] if isinstance(row, dict) else row[0]
+            stored = json.loads(value) if value else []
+            stored.extend(failures[:MAX_STORED_FAILURES - len(stored)])
+            cursor.execute('''
+                UPDATE import_jobs
+                SET rows_processed = ?, success_count = success_count + ?,
+                    failed_count = failed_count + ?, failures = ?, heartbeat_at = ?
+                WHERE id = ?
+            ''', (rows_processed, succeeded, len(failures), json.dumps(stored, ensure_ascii=False),
+                  _now(), job_id))
+
+        self.db.run_write(checkpoint)
+
+    def run_job(self, job_id):
+        # pandas/openpyxl تُحمل مع أول مهمة فقط وليس مع بدء التطبيق
+        from excel_import import IMPORT_CHUNK_SIZE, ExcelImporter, estimate_row_count, iter_row_batches
+
+        if not self._claim(job_id):
+            return
+        job = self.get_job(job_id)
+        started = time.monotonic()
+
+        # العدد تقريبي (أبعاد الـ sheet) ويُصحح عند الانتهاء
+        total = estimate_row_count(job['file_path'])
+        self._update(job_id, total_rows=total)
+        print(f"📊 مهمة {job_id}: ~{total} صف، البدء من الصف {job['rows_processed'] + 1}")
+
+        importer = ExcelImporter(self.db)
+        rows_processed = job['rows_processed']
+        for first_row, chunk in iter_row_batches(job['file_path'], self.chunk_size or IMPORT_CHUNK_SIZE,
+                                                 skip_rows=job['rows_processed']):
+            succeeded_before = importer.success_count
+            failed_before = len(importer.failed_products)
+            importer.process_chunk(chunk, first_row=first_row)
+            rows_processed = first_row + len(chunk) - 1
+            self._checkpoint(job_id, rows_processed,
+                             importer.success_count - succeeded_before,
+                             importer.failed_products[failed_before:])
+
+        importer.wait_for_images()
+        result = importer.result()
+        summary = {key: result[key] for key in
+                   ('unique_products', 'created_brands', 'created_colors', 'created_types')}
+        self._update(job_id, status='completed', total_rows=rows_processed,
+                     result=json.dumps(summary, ensure_ascii=False), finished_at=_now())
+        print(f"✅ انتهت مهمة {job_id} في {time.monotonic() - started:.1f} ثانية")
+
+        if os.path.exists(job['file_path']):
+            os.remove(job['file_path'])
+        if self.on_complete is not None:
+            try:
+                self.on_complete(job_id, result)
+            except Exception as e:
+                print(f"⚠️ خطأ بعد انتهاء مهمة {job_id}: {e}")
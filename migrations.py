@@ -0,0 +1,528 @@
+"""نظام ترحيل (migrations) مرقّم لقاعدة البيانات
+
+كل migration له رقم ثابت ويتم تسجيله في جدول schema_version بعد تطبيقه،
+فلا يتم تنفيذه مرة أخرى. لإضافة تعديل جديد على الـ schema أضف دالة جديدة
+في آخر قائمة MIGRATIONS برقم أكبر - لا تعدل migration تم تطبيقه.
+
+التشغيل من سطر الأوامر لعرض الحالة وخطط الاستعلامات:
+    python migrations.py
+"""
+from datetime import datetime
+
+from change_log import BACKUP_TABLES
+from reference_cache import REFERENCE_TABLES
+from search_index import (create_postgres_search_index, create_postgres_search_triggers,
+                          create_search_state_table, create_sqlite_search_index,
+                          create_sqlite_search_triggers, search_index_exists)
+
+
+def _scalar(row):
+    """أول قيمة في الصف - يدعم tuples (SQLite) و dict rows (PostgreSQL)"""
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return next(iter(row.values()))
+    return row[0]
+
+
+def _placeholder(db):
+    return '%s' if db.db_type == 'postgresql' else '?'
+
+
+def column_exists(db, cursor, table_name, column_name):
+    if db.db_type == 'postgresql':
+        cursor.execute('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = %s AND column_name = %s
+        ''', (table_name, column_name))
+        return cursor.fetchone() is not None
+    cursor.execute(f'PRAGMA table_info({table_name})')
+    return any(row[1] == column_name for row in cursor.fetchall())
+
+
+# ---------------------------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------------------------
+
+def _add_product_size_column(db, cursor):
+    """عمود المقاس لقواعد البيانات القديمة (كان ALTER TABLE داخل try/except)"""
+    if not column_exists(db, cursor, 'base_products', 'product_size'):
+        cursor.execute('ALTER TABLE base_products ADD COLUMN product_size TEXT')
+
+
+# color_images.variant_id و product_tags(product_id, tag_id) لهم UNIQUE index
+# بالفعل، فلا يحتاجون index إضافي.
+HOT_PATH_INDEXES = [
+    ('idx_product_variants_base_product', 'product_variants', 'base_product_id'),
+    ('idx_product_variants_color', 'product_variants', 'color_id'),
+    ('idx_product_tags_tag', 'product_tags', 'tag_id'),
+    ('idx_base_products_created_date', 'base_products', 'created_date'),
+    ('idx_base_products_lookup', 'base_products', 'product_code, brand_id, trader_category'),
+    ('idx_base_products_brand', 'base_products', 'brand_id'),
+    ('idx_base_products_type', 'base_products', 'product_type_id'),
+]
+
+
+def _create_hot_path_indexes(db, cursor):
+    """Indexes للـ joins والترتيب وفحص تكرار المنتج"""
+    for index_name, table_name, columns in HOT_PATH_INDEXES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})')
+
+
+def _create_search_index(db, cursor):
+    """فهرس البحث النصي (FTS5 / tsvector) مع الـ triggers - انظر search_index.py
+
+    بنفس SQL الـ migration الأصلي (deferrable=False)، والـ triggers القابلة
+    للإيقاف في migration 6.
+    """
+    if db.db_type == 'postgresql':
+        create_postgres_search_index(cursor, deferrable=False)
+    else:
+        create_sqlite_search_index(cursor, deferrable=False)
+
+
+def _make_search_triggers_deferrable(db, cursor):
+    """جدول search_index_state وإعادة إنشاء triggers الفهرس بشرط deferred"""
+    if not search_index_exists(db.db_type, cursor):
+        # FTS5 غير متاح - البحث بـ LIKE بدون triggers
+        return
+    create_search_state_table(cursor)
+    if db.db_type == 'postgresql':
+        create_postgres_search_triggers(cursor)
+    else:
+        create_sqlite_search_triggers(cursor)
+
+
+# الجداول التي تؤثر على أرقام الـ Dashboard
+DASHBOARD_STATS_TABLES = [
+    'base_products', 'product_variants', 'brands', 'colors',
+    'product_types', 'trader_categories', 'tags',
+]
+
+
+def _create_dashboard_stats_cache(db, cursor):
+    """صف واحد لإحصائيات الـ Dashboard - أي كتابة على الجداول تزيد version
+    
+    الإحصائيات صالحة فقط إذا computed_version = version، فلا يتم عرض أرقام
+    قديمة حتى لو تمت الكتابة من worker آخر أو من SQL مباشر (مثل الاستيراد).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_stats (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1,
+            computed_version INTEGER NOT NULL DEFAULT 0,
+            total_products INTEGER DEFAULT 0,
+            total_stock_value REAL DEFAULT 0,
+            low_stock_items INTEGER DEFAULT 0,
+            brands_count INTEGER DEFAULT 0,
+            colors_count INTEGER DEFAULT 0,
+            types_count INTEGER DEFAULT 0,
+            categories_count INTEGER DEFAULT 0,
+            tags_count INTEGER DEFAULT 0,
+            updated_date TEXT
+        )
+    ''')
+    cursor.execute('INSERT INTO dashboard_stats (id) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM dashboard_stats)')
+    
+    if db.db_type == 'postgresql':
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION invalidate_dashboard_stats() RETURNS TRIGGER AS $$
+            BEGIN
+                UPDATE dashboard_stats SET version = version + 1 WHERE id = 1;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table_name in DASHBOARD_STATS_TABLES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS dashboard_stats_{table_name} ON {table_name}')
+            cursor.execute(f'''
+                CREATE TRIGGER dashboard_stats_{table_name}
+                AFTER INSERT OR UPDATE OR DELETE ON {table_name}
+                FOR EACH STATEMENT EXECUTE FUNCTION invalidate_dashboard_stats()
+            ''')
+        return
+    
+    # SQLite لا يدعم triggers متعددة الأحداث أو FOR EACH STATEMENT
+    for table_name in DASHBOARD_STATS_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            trigger_name = f'dashboard_stats_{table_name}_{event.lower()}'
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+            cursor.execute(f'''
+                CREATE TRIGGER {trigger_name} AFTER {event} ON {table_name}
+                BEGIN
+                    UPDATE dashboard_stats SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+
+def _create_cache_versions(db, cursor):
+    """رقم إصدار لكل جدول مرجعي يزيد مع أي كتابة - انظر reference_cache.py"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    for table_name in REFERENCE_TABLES:
+        cursor.execute(
+            f'INSERT INTO cache_versions (name) SELECT {_placeholder(db)} '
+            f'WHERE NOT EXISTS (SELECT 1 FROM cache_versions WHERE name = {_placeholder(db)})',
+            (table_name, table_name)
+        )
+    
+    if db.db_type == 'postgresql':
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION bump_cache_version() RETURNS TRIGGER AS $$
+            BEGIN
+                UPDATE cache_versions SET version = version + 1 WHERE name = TG_TABLE_NAME;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table_name in REFERENCE_TABLES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS cache_version_{table_name} ON {table_name}')
+            cursor.execute(f'''
+                CREATE TRIGGER cache_version_{table_name}
+                AFTER INSERT OR UPDATE OR DELETE ON {table_name}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_cache_version()
+            ''')
+        return
+    
+    for table_name in REFERENCE_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            trigger_name = f'cache_version_{table_name}_{event.lower()}'
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+            cursor.execute(f'''
+                CREATE TRIGGER {trigger_name} AFTER {event} ON {table_name}
+                BEGIN
+                    UPDATE cache_versions SET version = version + 1 WHERE name = '{table_name}';
+                END
+            ''')
+
+
+def _create_import_jobs(db, cursor):
+    """مهام استيراد Excel في الخلفية مع checkpoint لكل دفعة - انظر import_jobs.py"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'queued',
+            filename TEXT,
+            file_path TEXT,
+            total_rows INTEGER,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            start_row INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            failed_count INTEGER NOT NULL DEFAULT 0,
+            failures TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            heartbeat_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs (status, created_at)')
+
+
+def _add_import_job_owner(db, cursor):
+    """الـ process الذي ينفذ المهمة (BOOT_ID في import_jobs.py)"""
+    if not column_exists(db, cursor, 'import_jobs', 'owner'):
+        cursor.execute('ALTER TABLE import_jobs ADD COLUMN owner TEXT')
+
+
+def _add_image_variants_column(db, cursor):
+    """روابط النسخ المصغرة لكل صورة (JSON) - انظر image_variants.py"""
+    if not column_exists(db, cursor, 'color_images', 'image_variants'):
+        cursor.execute('ALTER TABLE color_images ADD COLUMN image_variants TEXT')
+
+
+def _create_image_blobs(db, cursor):
+    """مخزن الصور بالـ SHA-256 - ref_count يُحدث بـ triggers على color_images (انظر image_store.py)
+    
+    الـ trigger ينشئ صف الـ blob لو غير موجود (مثلاً بعد restore بدون image_blobs).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            sha256 TEXT PRIMARY KEY,
+            image_url TEXT,
+            size_bytes INTEGER,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT
+        )
+    ''')
+    if not column_exists(db, cursor, 'color_images', 'image_hash'):
+        cursor.execute('ALTER TABLE color_images ADD COLUMN image_hash TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_color_images_image_hash ON color_images (image_hash)')
+    
+    if db.db_type == 'postgresql':
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION update_image_blob_refs() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.image_hash IS NOT NULL THEN
+                    UPDATE image_blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.image_hash;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.image_hash IS NOT NULL THEN
+                    INSERT INTO image_blobs (sha256, ref_count) VALUES (NEW.image_hash, 1)
+                    ON CONFLICT (sha256) DO UPDATE SET ref_count = image_blobs.ref_count + 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS image_blob_refs ON color_images')
+        cursor.execute('''
+            CREATE TRIGGER image_blob_refs
+            AFTER INSERT OR DELETE OR UPDATE OF image_hash ON color_images
+            FOR EACH ROW EXECUTE FUNCTION update_image_blob_refs()
+        ''')
+        return
+    
+    decrement = 'UPDATE image_blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.image_hash;'
+    # WHERE في الـ SELECT مطلوب حتى لا يختلط ON CONFLICT بصيغة الـ JOIN
+    increment = '''
+        INSERT INTO image_blobs (sha256, ref_count) SELECT NEW.image_hash, 1 WHERE NEW.image_hash IS NOT NULL
+        ON CONFLICT (sha256) DO UPDATE SET ref_count = ref_count + 1;
+    '''
+    triggers = {
+        'insert': ('AFTER INSERT', increment),
+        'delete': ('AFTER DELETE', decrement),
+        'update': ('AFTER UPDATE OF image_hash', decrement + increment),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS image_blob_refs_{name}')
+        cursor.execute(f'''
+            CREATE TRIGGER image_blob_refs_{name} {event} ON color_images
+            BEGIN
+                {body}
+            END
+        ''')
+
+
+def _create_change_log(db, cursor):
+    """سجل التغييرات للنسخ الاحتياطية التزايدية + حالة آخر نسخة - انظر change_log.py"""
+    if db.db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                id BIGSERIAL PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    else:
+        # AUTOINCREMENT حتى لا يعاد استخدام الأرقام بعد حذف التغييرات المرفوعة
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backup_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    
+    if db.db_type == 'postgresql':
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION log_backup_change() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    INSERT INTO change_log (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id);
+                ELSE
+                    INSERT INTO change_log (table_name, row_id) VALUES (TG_TABLE_NAME, NEW.id);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table_name in BACKUP_TABLES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS change_log_{table_name} ON {table_name}')
+            cursor.execute(f'''
+                CREATE TRIGGER change_log_{table_name}
+                AFTER INSERT OR UPDATE OR DELETE ON {table_name}
+                FOR EACH ROW EXECUTE FUNCTION log_backup_change()
+            ''')
+        return
+    
+    for table_name in BACKUP_TABLES:
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            trigger_name = f'change_log_{table_name}_{event.lower()}'
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+            cursor.execute(f'''
+                CREATE TRIGGER {trigger_name} AFTER {event} ON {table_name}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id) VALUES ('{table_name}', {row}.id);
+                END
+            ''')
+
+
+MIGRATIONS = [
+    (1, 'add base_products.product_size', _add_product_size_column),
+    (2, 'hot-path secondary indexes', _create_hot_path_indexes),
+    (3, 'product full-text search index', _create_search_index),
+    (4, 'dashboard stats cache', _create_dashboard_stats_cache),
+    (5, 'reference table cache versions', _create_cache_versions),
+    (6, 'deferrable search index triggers', _make_search_triggers_deferrable),
+    (7, 'background import jobs', _create_import_jobs),
+    (8, 'add color_images.image_variants', _add_image_variants_column),
+    (9, 'content-addressed image blobs', _create_image_blobs),
+    (10, 'backup change log', _create_change_log),
+    (11, 'add import_jobs.owner', _add_import_job_owner),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def ensure_version_table(db, cursor):
+    timestamp_type = 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_date {timestamp_type}
+        )
+    ''')
+
+
+def get_current_version(db, cursor):
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return _scalar(cursor.fetchone()) or 0
+
+
+def schema_is_current(db, conn):
+    """True لو قاعدة البيانات عليها كل الـ migrations - بدون أي DDL
+
+    يسمح بتخطي CREATE TABLE IF NOT EXISTS والـ migrations مع كل تشغيل.
+    """
+    cursor = conn.cursor()
+    try:
+        current = get_current_version(db, cursor) >= LATEST_VERSION
+    except Exception:
+        # schema_version غير موجود: قاعدة بيانات جديدة
+        current = False
+    conn.rollback()
+    return current
+
+
+def run_migrations(db, conn, report_plans=True):
+    """تطبيق الـ migrations الناقصة بالترتيب - كل migration في transaction مستقل
+
+    يرجع قائمة أرقام الـ migrations التي تم تطبيقها.
+    """
+    cursor = conn.cursor()
+    ensure_version_table(db, cursor)
+    conn.commit()
+
+    current_version = get_current_version(db, cursor)
+    pending = [m for m in MIGRATIONS if m[0] > current_version]
+    if not pending:
+        return []
+
+    plans_before = explain_hot_queries(db, cursor) if report_plans else None
+
+    applied = []
+    for version, description, migrate in pending:
+        try:
+            migrate(db, cursor)
+            cursor.execute(
+                f'INSERT INTO schema_version (version, description, applied_date) VALUES ({_placeholder(db)}, {_placeholder(db)}, {_placeholder(db)})',
+                (version, description, datetime.now().isoformat(sep=' ', timespec='seconds'))
+            )
+            conn.commit()
+            applied.append(version)
+            print(f"✅ Migration {version} applied: {description}")
+        except Exception as e:
+            conn.rollback()
+            # worker آخر طبّق نفس الـ migration في نفس الوقت
+            if get_current_version(db, cursor) >= version:
+                continue
+            print(f"❌ Migration {version} failed: {e}")
+            raise
+
+    if report_plans:
+        print_plan_report(plans_before, explain_hot_queries(db, cursor))
+    return applied
+
+
+# ---------------------------------------------------------------------------
+# Query plans
+# ---------------------------------------------------------------------------
+
+HOT_QUERIES = [
+    ('variants by product', '''
+        SELECT pv.id, c.color_name, pv.current_stock, ci.image_url
+        FROM product_variants pv
+        JOIN colors c ON pv.color_id = c.id
+        LEFT JOIN color_images ci ON pv.id = ci.variant_id
+        WHERE pv.base_product_id = {p}
+    ''', (1,)),
+    ('tags by product', '''
+        SELECT t.* FROM tags t
+        JOIN product_tags pt ON t.id = pt.tag_id
+        WHERE pt.product_id = {p}
+    ''', (1,)),
+    ('products by created_date', '''
+        SELECT bp.id FROM base_products bp ORDER BY bp.created_date DESC
+    ''', ()),
+    ('check_product_exists', '''
+        SELECT id FROM base_products
+        WHERE product_code = {p} AND brand_id = {p} AND trader_category = {p}
+    ''', ('X', 1, 'L')),
+    ('tag usage count', '''
+        SELECT COUNT(*) FROM product_tags WHERE tag_id = {p}
+    ''', (1,)),
+]
+
+
+def explain_hot_queries(db, cursor):
+    """خطة التنفيذ لكل استعلام مهم - {name: [plan lines]}"""
+    plans = {}
+    for name, query, params in HOT_QUERIES:
+        query = query.format(p=_placeholder(db))
+        try:
+            if db.db_type == 'postgresql':
+                cursor.execute(f'EXPLAIN {query}', params)
+                lines = [_scalar(row) for row in cursor.fetchall()]
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+                lines = [row[3] for row in cursor.fetchall()]
+        except Exception as e:
+            lines = [f'unavailable: {e}']
+        plans[name] = lines
+    return plans
+
+
+def print_plan_report(before, after):
+    print("📊 Query plans before/after migrations:")
+    for name in after:
+        old = before.get(name, []) if before else []
+        new = after[name]
+        marker = '' if old == new else ' (changed)'
+        print(f"  • {name}{marker}")
+        for line in old:
+            print(f"      before: {line}")
+        for line in new:
+            print(f"      after:  {line}")
+
+
+if __name__ == '__main__':
+    from database import StockDatabase
+
+    stock_db = StockDatabase()
+    connection = stock_db.get_connection()
+    cursor = connection.cursor()
+    print(f"📦 Schema version: {get_current_version(stock_db, cursor)} (latest {LATEST_VERSION})")
+    for query_name, plan in explain_hot_queries(stock_db, cursor).items():
+        print(f"  • {query_name}")
+        for plan_line in plan:
+            print(f"      {plan_line}")
+    connection.close()
@@ -0,0 +1,89 @@
+"""Keyset (cursor) pagination
+
+بدل OFFSET (اللي بيعمل scan لكل الصفوف اللي قبل الصفحة) نحفظ مفتاح الترتيب
+لأول/آخر صف في الصفحة داخل cursor، والصفحة التالية تبدأ بعده مباشرة باستخدام
+الـ index. تكلفة أي صفحة ثابتة مهما كان عدد المنتجات.
+"""
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 48
+MAX_PAGE_SIZE = 200
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """حجم الصفحة من الـ query string مع حد أقصى"""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(direction, key):
+    """direction: 'after' أو 'before' - key: قيم أعمدة الترتيب للصف الحدودي"""
+    payload = json.dumps([direction, list(key)], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """إرجاع (direction, key) أو (None, None) إذا كان الـ cursor فارغ أو غير صالح"""
+    if not token:
+        return None, None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError):
+        return None, None
+    if direction not in ('after', 'before') or not isinstance(key, list):
+        return None, None
+    return direction, key
+
+
+def keyset_condition(sort_columns, key, descending, before=False):
+    """شرط WHERE للصفوف بعد (أو قبل) المفتاح حسب ترتيب الأعمدة
+
+    مكتوب بالشكل الموسع (a < ? OR (a = ? AND b < ?)) بدل row values
+    ليعمل على SQLite و PostgreSQL.
+    """
+    if len(key) != len(sort_columns):
+        return '', []
+
+    # التالي في ترتيب تنازلي = أصغر، والعكس
+    operator = '<' if descending != before else '>'
+    clauses = []
+    params = []
+    for position, column in enumerate(sort_columns):
+        parts = [f'{prev} = ?' for prev in sort_columns[:position]]
+        parts.append(f'{column} {operator} ?')
+        clauses.append('(' + ' AND '.join(parts) + ')')
+        params.extend(key[:position + 1])
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+def order_by(sort_columns, descending, before=False):
+    """ORDER BY - معكوس عند طلب الصفحة السابقة ثم نعكس النتائج في build_page"""
+    direction = 'DESC' if descending != before else 'ASC'
+    return ', '.join(f'{column} {direction}' for column in sort_columns)
+
+
+def build_page(rows, page_size, direction, key_of):
+    """تجهيز الصفحة من صفوف تم جلبها بـ LIMIT page_size + 1
+
+    key_of(row) ترجع قيم أعمدة الترتيب للصف.
+    """
+    has_more = len(rows) > page_size
+    rows = list(rows[:page_size])
+
+    if direction == 'before':
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = direction == 'after', has_more
+
+    return {
+        'items': rows,
+        'page_size': page_size,
+        'next_cursor': encode_cursor('after', key_of(rows[-1])) if rows and has_next else None,
+        'prev_cursor': encode_cursor('before', key_of(rows[0])) if rows and has_prev else None,
+    }
@@ -0,0 +1,130 @@
+"""تصدير المنتجات (صف لكل لون) بنفس شكل ملف الاستيراد
+
+الفلاتر (براند، فئة، نوع، كود، لون، حالة المخزون) تتحول لاستعلام SQL واحد
+بـ parameters على جدول المتغيرات، والصفوف تُقرأ بـ fetchmany وتُكتب مباشرة:
+- Excel: openpyxl write_only في ملف مؤقت (الـ workbook لا يبقى في الذاكرة)
+- CSV: response مقسم (chunked) يُكتب أثناء القراءة من قاعدة البيانات
+"""
+import csv
+import io
+
+
+EXPORT_COLUMNS = [
+    'Product Code', 'Brand Name', 'Product Type', 'Category', 'Size',
+    'Wholesale Price', 'Retail Price', 'Color Name', 'Stock', 'Image URL', 'Tags',
+]
+
+EXPORT_BATCH_SIZE = 2000
+
+# فلتر الـ form -> عمود SQL
+LIST_FILTERS = [
+    ('brands', 'b.brand_name'),
+    ('categories', 'bp.trader_category'),
+    ('product_types', 'pt.type_name'),
+    ('product_codes', 'bp.product_code'),
+    ('colors', 'c.color_name'),
+]
+
+STOCK_FILTERS = {
+    'in_stock': 'pv.current_stock > 0',
+    'out_of_stock': 'pv.current_stock <= 0',
+    'low_stock': 'pv.current_stock > 0 AND pv.current_stock <= 5',
+}
+
+
+def _tags_subquery(db_type):
+    """Tags كل منتج كنص مفصول بفواصل بنفس ترتيب get_product_tags"""
+    if db_type == 'postgresql':
+        return '''
+            SELECT pt.product_id, string_agg(t.tag_name, ',' ORDER BY t.tag_category, t.tag_name) AS tags
+            FROM product_tags pt JOIN tags t ON t.id = pt.tag_id
+            GROUP BY pt.product_id
+        '''
+    # GROUP_CONCAT في SQLite يحافظ على ترتيب الاستعلام الفرعي
+    return '''
+        SELECT product_id, GROUP_CONCAT(tag_name, ',') AS tags FROM (
+            SELECT pt.product_id, t.tag_name FROM product_tags pt JOIN tags t ON t.id = pt.tag_id
+            ORDER BY pt.product_id, t.tag_category, t.tag_name
+        ) GROUP BY product_id
+    '''
+
+
+def build_export_query(db_type, filters):
+    """(sql, params) - filters: dict فيه قوائم LIST_FILTERS و stock_filter"""
+    conditions = []
+    params = []
+    for name, column in LIST_FILTERS:
+        values = [value for value in filters.get(name) or [] if value != '']
+        if values:
+            conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+
+    stock_condition = STOCK_FILTERS.get(filters.get('stock_filter') or 'all')
+    if stock_condition:
+        conditions.append(stock_condition)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    # نفس ترتيب صفحة المنتجات: الأحدث أولاً، والألوان حسب المخزون
+    return f'''
+        SELECT bp.product_code, b.brand_name, pt.type_name, bp.trader_category,
+               bp.product_size, bp.wholesale_price, bp.retail_price,
+               c.color_name, pv.current_stock, ci.image_url, tg.tags
+        FROM product_variants pv
+        JOIN base_products bp ON bp.id = pv.base_product_id
+        JOIN colors c ON c.id = pv.color_id
+        LEFT JOIN brands b ON b.id = bp.brand_id
+        LEFT JOIN product_types pt ON pt.id = bp.product_type_id
+        LEFT JOIN color_images ci ON ci.variant_id = pv.id
+        LEFT JOIN ({_tags_subquery(db_type)}) tg ON tg.product_id = bp.id
+        {where}
+        ORDER BY bp.created_date DESC, bp.id DESC, pv.current_stock DESC, pv.id
+    ''', params
+
+
+def iter_export_rows(db, filters, batch_size=EXPORT_BATCH_SIZE):
+    """صفوف التصدير (tuples بترتيب EXPORT_COLUMNS) على دفعات من قاعدة البيانات"""
+    query, params = build_export_query(db.db_type, filters)
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                row = tuple(row.values()) if isinstance(row, dict) else row
+                # الحقول الفارغة '' كما في التصدير القديم
+                yield row[:4] + (row[4] or '',) + row[5:9] + (row[9] or '', row[10] or '')
+    finally:
+        conn.close()
+
+
+def write_xlsx(rows, file):
+    """كتابة الصفوف في file (path أو ملف) بـ write_only - يرجع عدد الصفوف"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(file)
+    return count
+
+
+def iter_csv(rows, batch_size=EXPORT_BATCH_SIZE):
+    """نص CSV على أجزاء للـ streaming response (مع BOM حتى يقرأ Excel العربي صحيحاً)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    for index, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if index % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
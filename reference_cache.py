@@ -0,0 +1,121 @@
+"""Cache في الذاكرة للجداول المرجعية (البراندات، الألوان، الأنواع، الفئات، الـ Tags)
+
+الجداول دي بتتغير مرات قليلة في الشهر لكن كل صفحة فورم كانت بتقرأها
+بالكامل. كل جدول له نسخة (snapshot) في الذاكرة فيها الصفوف بنفس ترتيب
+الاستعلام الأصلي مع map من الـ id للصف ومن الاسم للـ id.
+
+الإلغاء (invalidation):
+- دوال add_/update_/delete_ في StockDatabase تلغي نسخة الجدول فوراً
+- جدول cache_versions يزيد رقم الإصدار بـ triggers مع أي كتابة (حتى من
+  worker آخر أو SQL مباشر مثل الاستيراد)، ويتم فحصه كل CHECK_INTERVAL ثانية
+"""
+import threading
+import time
+
+# جدول -> (استعلام التحميل، عمود الاسم المستخدم في name -> id)
+REFERENCE_TABLES = {
+    'brands': ('SELECT * FROM brands ORDER BY brand_name', 'brand_name'),
+    'colors': ('SELECT * FROM colors ORDER BY color_name', 'color_name'),
+    'product_types': ('SELECT * FROM product_types ORDER BY type_name', 'type_name'),
+    'trader_categories': ('SELECT * FROM trader_categories ORDER BY category_code', 'category_code'),
+    'tags': ('SELECT * FROM tags ORDER BY tag_category, tag_name', 'tag_name'),
+}
+
+CHECK_INTERVAL = 1.0
+
+
+class _TableSnapshot:
+    __slots__ = ('rows', 'by_id', 'id_by_name', 'version')
+
+    def __init__(self, rows, columns, name_column, version):
+        self.rows = rows
+        self.version = version
+        if rows and isinstance(rows[0], dict):
+            self.by_id = {row['id']: row for row in rows}
+            self.id_by_name = {row[name_column]: row['id'] for row in rows}
+        else:
+            name_index = columns.index(name_column)
+            self.by_id = {row[0]: row for row in rows}
+            self.id_by_name = {row[name_index]: row[0] for row in rows}
+
+
+class ReferenceCache:
+    """Snapshots للجداول المرجعية - آمنة للاستخدام من أكثر من thread"""
+
+    def __init__(self, get_connection, check_interval=CHECK_INTERVAL):
+        self._get_connection = get_connection
+        self.check_interval = check_interval
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._stats = {'hits': 0, 'loads': 0, 'invalidations': 0}
+
+    def _versions(self, cursor):
+        try:
+            cursor.execute('SELECT name, version FROM cache_versions')
+        except Exception:
+            # قاعدة بيانات قبل migration جدول الإصدارات
+            return {}
+        rows = cursor.fetchall()
+        if rows and isinstance(rows[0], dict):
+            return {row['name']: row['version'] for row in rows}
+        return {row[0]: row[1] for row in rows}
+
+    def _check_versions(self):
+        """إلغاء النسخ التي تغير إصدارها في قاعدة البيانات"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        conn = self._get_connection()
+        versions = self._versions(conn.cursor())
+        conn.close()
+        with self._lock:
+            for table_name, snapshot in list(self._snapshots.items()):
+                if versions.get(table_name, 0) != snapshot.version:
+                    del self._snapshots[table_name]
+
+    def snapshot(self, table_name):
+        self._check_versions()
+        snapshot = self._snapshots.get(table_name)
+        if snapshot is not None:
+            self._stats['hits'] += 1
+            return snapshot
+
+        query, name_column = REFERENCE_TABLES[table_name]
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        # الإصدار يُقرأ قبل الصفوف: لو حصلت كتابة بينهما نعيد التحميل في الفحص التالي
+        version = self._versions(cursor).get(table_name, 0)
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        columns = [description[0] for description in cursor.description]
+        conn.close()
+
+        snapshot = _TableSnapshot(rows, columns, name_column, version)
+        with self._lock:
+            self._snapshots[table_name] = snapshot
+        self._stats['loads'] += 1
+        return snapshot
+
+    def rows(self, table_name):
+        return list(self.snapshot(table_name).rows)
+
+    def get(self, table_name, row_id):
+        return self.snapshot(table_name).by_id.get(row_id)
+
+    def id_for_name(self, table_name, name):
+        return self.snapshot(table_name).id_by_name.get(name)
+
+    def invalidate(self, table_name=None):
+        with self._lock:
+            if table_name is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(table_name, None)
+        self._stats['invalidations'] += 1
+
+    def stats(self):
+        data = dict(self._stats)
+        data['cached_tables'] = sorted(self._snapshots)
+        return data
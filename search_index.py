@@ -0,0 +1,347 @@
+"""فهرس البحث النصي للمنتجات
+
+- SQLite: جدول FTS5 باسم product_search (rowid = base_products.id)
+- PostgreSQL: جدول product_search فيه tsvector مع GIN index (و pg_trgm إن وجد)
+
+الفهرس يتحدث تلقائياً بـ triggers عند أي تعديل على المنتجات أو الألوان أو
+الـ Tags أو أسماء البراندات/الأنواع، فلا يحتاج الكود لتحديثه يدوياً.
+البحث بالـ prefix لكل كلمة، والترتيب: تطابق كود المنتج تماماً أولاً ثم كود
+يبدأ بالكلمة ثم باقي النتائج.
+"""
+import re
+
+# الأعمدة المفهرسة بنفس ترتيب DOCUMENT_SELECT
+INDEXED_COLUMNS = ['product_code', 'brand', 'product_type', 'size', 'category', 'colors', 'tags']
+
+DOCUMENT_SELECT = '''
+    SELECT
+        bp.id,
+        bp.product_code,
+        COALESCE(b.brand_name, ''),
+        COALESCE(pt.type_name, ''),
+        COALESCE(bp.product_size, ''),
+        COALESCE(bp.trader_category, ''),
+        COALESCE((SELECT {concat_colors} FROM product_variants pv
+                  JOIN colors c ON c.id = pv.color_id
+                  WHERE pv.base_product_id = bp.id), ''),
+        COALESCE((SELECT {concat_tags} FROM product_tags ptg
+                  JOIN tags t ON t.id = ptg.tag_id
+                  WHERE ptg.product_id = bp.id), '')
+    FROM base_products bp
+    LEFT JOIN brands b ON b.id = bp.brand_id
+    LEFT JOIN product_types pt ON pt.id = bp.product_type_id
+    WHERE {where}
+'''
+
+# (جدول، حدث، شرط المنتجات المتأثرة) - OLD/NEW حسب نوع الـ trigger
+REFRESH_TRIGGERS = [
+    ('base_products', 'INSERT', ['bp.id = NEW.id']),
+    ('base_products', 'UPDATE OF product_code, brand_id, product_type_id, product_size, trader_category',
+     ['bp.id = OLD.id', 'bp.id = NEW.id']),
+    ('product_variants', 'INSERT', ['bp.id = NEW.base_product_id']),
+    ('product_variants', 'UPDATE OF color_id, base_product_id',
+     ['bp.id = OLD.base_product_id', 'bp.id = NEW.base_product_id']),
+    ('product_variants', 'DELETE', ['bp.id = OLD.base_product_id']),
+    ('product_tags', 'INSERT', ['bp.id = NEW.product_id']),
+    ('product_tags', 'DELETE', ['bp.id = OLD.product_id']),
+    ('brands', 'UPDATE OF brand_name', ['bp.brand_id = NEW.id']),
+    ('product_types', 'UPDATE OF type_name', ['bp.product_type_id = NEW.id']),
+    ('colors', 'UPDATE OF color_name',
+     ['bp.id IN (SELECT base_product_id FROM product_variants WHERE color_id = NEW.id)']),
+    ('tags', 'UPDATE OF tag_name',
+     ['bp.id IN (SELECT product_id FROM product_tags WHERE tag_id = NEW.id)']),
+]
+
+
+def _trigger_name(table_name, event):
+    return f"product_search_{table_name}_{event.split()[0].lower()}"
+
+
+# الاستيراد الجماعي يوقف الـ triggers داخل الـ transaction الخاص به ثم يحدّث
+# المنتجات المتأثرة مرة واحدة في النهاية (بدل إعادة بناء المستند مع كل لون)
+STATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS search_index_state (
+        id INTEGER PRIMARY KEY,
+        deferred INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+
+def create_search_state_table(cursor):
+    cursor.execute(STATE_TABLE_SQL)
+    cursor.execute('INSERT INTO search_index_state (id, deferred) SELECT 1, 0 '
+                   'WHERE NOT EXISTS (SELECT 1 FROM search_index_state)')
+
+
+# ---------------------------------------------------------------------------
+# SQLite (FTS5)
+# ---------------------------------------------------------------------------
+
+def _sqlite_refresh_sql(where):
+    document = DOCUMENT_SELECT.format(
+        concat_colors="GROUP_CONCAT(c.color_name, ' ')",
+        concat_tags="GROUP_CONCAT(t.tag_name, ' ')",
+        where=where
+    )
+    return f'''
+        DELETE FROM product_search WHERE rowid IN (SELECT bp.id FROM base_products bp WHERE {where});
+        INSERT INTO product_search (rowid, {', '.join(INDEXED_COLUMNS)}) {document};
+    '''
+
+
+def create_sqlite_search_index(cursor, deferrable=True):
+    """إنشاء جدول FTS5 والـ triggers وملء الفهرس - يرجع False إذا كان FTS5 غير متاح
+
+    deferrable=False: الـ triggers بدون search_index_state (SQL الـ migration 3).
+    """
+    try:
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+                {', '.join(INDEXED_COLUMNS)},
+                tokenize = "unicode61 remove_diacritics 2 tokenchars '-'",
+                prefix = '2 3'
+            )
+        ''')
+    except Exception as e:
+        print(f"⚠️ FTS5 غير متاح - البحث سيستخدم LIKE: {e}")
+        return False
+
+    if deferrable:
+        create_search_state_table(cursor)
+    create_sqlite_search_triggers(cursor, deferrable)
+
+    cursor.execute('DROP TRIGGER IF EXISTS product_search_base_products_delete')
+    cursor.execute('''
+        CREATE TRIGGER product_search_base_products_delete
+        AFTER DELETE ON base_products
+        BEGIN
+            DELETE FROM product_search WHERE rowid = OLD.id;
+        END
+    ''')
+
+    rebuild_sqlite_search_index(cursor)
+    return True
+
+
+def create_sqlite_search_triggers(cursor, deferrable=True):
+    """triggers تحديث الفهرس - deferrable تتوقف مع defer_search_index"""
+    when = 'WHEN (SELECT deferred FROM search_index_state WHERE id = 1) = 0' if deferrable else ''
+    for table_name, event, conditions in REFRESH_TRIGGERS:
+        body = ''.join(_sqlite_refresh_sql(condition) for condition in conditions)
+        cursor.execute(f'DROP TRIGGER IF EXISTS {_trigger_name(table_name, event)}')
+        cursor.execute(f'''
+            CREATE TRIGGER {_trigger_name(table_name, event)}
+            AFTER {event} ON {table_name}
+            {when}
+            BEGIN
+                {body}
+            END
+        ''')
+
+
+def rebuild_sqlite_search_index(cursor):
+    cursor.execute('DELETE FROM product_search')
+    for statement in _sqlite_refresh_sql('1 = 1').split(';'):
+        if statement.strip():
+            cursor.execute(statement)
+
+
+# ---------------------------------------------------------------------------
+# PostgreSQL (tsvector + pg_trgm)
+# ---------------------------------------------------------------------------
+
+def create_postgres_search_index(cursor, deferrable=True):
+    """جدول product_search مع tsvector و GIN index، والـ triggers بـ plpgsql
+
+    deferrable=False: الـ triggers بدون search_index_state (SQL الـ migration 3).
+    """
+    try:
+        cursor.execute('SAVEPOINT pg_trgm_extension')
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute('RELEASE SAVEPOINT pg_trgm_extension')
+        has_trigram = True
+    except Exception as e:
+        cursor.execute('ROLLBACK TO SAVEPOINT pg_trgm_extension')
+        print(f"⚠️ pg_trgm غير متاح - سيتم استخدام tsvector فقط: {e}")
+        has_trigram = False
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_search (
+            product_id INTEGER PRIMARY KEY,
+            product_code TEXT,
+            document TEXT,
+            search_vector TSVECTOR
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_search_vector ON product_search USING GIN (search_vector)')
+    if has_trigram:
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_product_search_trgm
+            ON product_search USING GIN (document gin_trgm_ops)
+        ''')
+
+    document = DOCUMENT_SELECT.format(
+        concat_colors="STRING_AGG(c.color_name, ' ')",
+        concat_tags="STRING_AGG(t.tag_name, ' ')",
+        where='bp.id = ANY(product_ids)'
+    )
+    cursor.execute(f'''
+        CREATE OR REPLACE FUNCTION refresh_product_search(product_ids INTEGER[]) RETURNS VOID AS $$
+        BEGIN
+            DELETE FROM product_search WHERE product_id = ANY(product_ids);
+            INSERT INTO product_search (product_id, product_code, document, search_vector)
+            SELECT doc.id, doc.product_code, doc.document,
+                   to_tsvector('simple', regexp_replace(doc.document, '[^[:alnum:]]+', ' ', 'g'))
+            FROM (
+                SELECT d.id, d.product_code,
+                       concat_ws(' ', d.product_code, d.brand, d.product_type, d.size,
+                                 d.category, d.colors, d.tags) AS document
+                FROM ({document}) AS d(id, product_code, brand, product_type, size, category, colors, tags)
+            ) doc;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+
+    if deferrable:
+        create_search_state_table(cursor)
+    create_postgres_search_triggers(cursor, deferrable)
+
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION product_search_base_products_delete() RETURNS TRIGGER AS $$
+        BEGIN
+            DELETE FROM product_search WHERE product_id = OLD.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS product_search_base_products_delete ON base_products')
+    cursor.execute('''
+        CREATE TRIGGER product_search_base_products_delete AFTER DELETE ON base_products
+        FOR EACH ROW EXECUTE FUNCTION product_search_base_products_delete()
+    ''')
+
+    cursor.execute('SELECT refresh_product_search(ARRAY(SELECT id FROM base_products))')
+    return True
+
+
+def create_postgres_search_triggers(cursor, deferrable=True):
+    """triggers تحديث الفهرس - deferrable تتوقف مع defer_search_index"""
+    skip = '''
+                IF (SELECT deferred FROM search_index_state WHERE id = 1) <> 0 THEN
+                    RETURN NULL;
+                END IF;''' if deferrable else ''
+    for table_name, event, conditions in REFRESH_TRIGGERS:
+        ids = ' || '.join(
+            f"ARRAY(SELECT bp.id FROM base_products bp WHERE {condition})"
+            for condition in conditions
+        )
+        function_name = _trigger_name(table_name, event)
+        cursor.execute(f'''
+            CREATE OR REPLACE FUNCTION {function_name}() RETURNS TRIGGER AS $$
+            BEGIN{skip}
+                PERFORM refresh_product_search({ids});
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute(f'DROP TRIGGER IF EXISTS {function_name} ON {table_name}')
+        cursor.execute(f'''
+            CREATE TRIGGER {function_name} AFTER {event} ON {table_name}
+            FOR EACH ROW EXECUTE FUNCTION {function_name}()
+        ''')
+
+
+# ---------------------------------------------------------------------------
+# Bulk writes
+# ---------------------------------------------------------------------------
+
+def defer_search_index(cursor):
+    """إيقاف تحديث الفهرس حتى نهاية الـ transaction الحالي - لازم يتبعه resume_search_index"""
+    cursor.execute('UPDATE search_index_state SET deferred = 1 WHERE id = 1')
+
+
+def resume_search_index(db_type, cursor, product_ids):
+    """تحديث مستندات المنتجات المتأثرة مرة واحدة وإعادة تشغيل الـ triggers"""
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        if db_type == 'postgresql':
+            cursor.execute('SELECT refresh_product_search(?)', (chunk,))
+            continue
+        where = f"bp.id IN ({', '.join('?' for _ in chunk)})"
+        for statement in _sqlite_refresh_sql(where).split(';'):
+            if statement.strip():
+                cursor.execute(statement, chunk)
+    cursor.execute('UPDATE search_index_state SET deferred = 0 WHERE id = 1')
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def search_tokens(search_term):
+    """تقسيم نص البحث لكلمات (الـ - جزء من الكلمة مثل أكواد 027-1)"""
+    return re.findall(r'[\w\-]+', search_term or '')
+
+
+def build_match_query(db_type, search_term):
+    """تحويل نص البحث لاستعلام prefix - كل الكلمات مطلوبة (AND)"""
+    tokens = search_tokens(search_term)
+    if db_type == 'postgresql':
+        tokens = [part for token in tokens for part in re.split(r'[^\w]+|_', token) if part]
+        return ' & '.join(f"{token}:*" for token in tokens) if tokens else None
+    return ' '.join('"' + token.replace('"', '""') + '"*' for token in tokens) if tokens else None
+
+
+# ترتيب النتائج حسب كود المنتج - الـ parameters: search_term, search_term
+CODE_RANK = '''CASE WHEN lower(product_code) = lower(?) THEN 2
+                            WHEN lower(product_code) LIKE lower(?) || '%' THEN 1
+                            ELSE 0 END'''
+
+
+def search_join(db_type):
+    """JOIN على نتائج الفهرس مع search_rank (2 = كود مطابق، 1 = كود يبدأ بالكلمة، 0 = باقي النتائج)
+
+    الفهرس يطابق بداية الكلمات فقط، فتُضاف المنتجات التي يحتوي كودها على
+    النص في أي مكان (مثل "010" في "A010") كما في بحث LIKE القديم.
+
+    الـ parameters بالترتيب: search_term, search_term, match_query,
+    search_term, search_term, search_term
+    """
+    if db_type == 'postgresql':
+        index_match = f'''
+                SELECT product_id, {CODE_RANK} AS search_rank
+                FROM product_search
+                WHERE search_vector @@ to_tsquery('simple', ?)'''
+    else:
+        index_match = f'''
+                SELECT rowid AS product_id, {CODE_RANK} AS search_rank
+                FROM product_search
+                WHERE product_search MATCH ?'''
+    return f'''
+            JOIN ({index_match}
+                UNION
+                SELECT id AS product_id, {CODE_RANK} AS search_rank
+                FROM base_products
+                WHERE lower(product_code) LIKE '%' || lower(?) || '%'
+            ) ps ON ps.product_id = bp.id'''
+
+
+def has_matches(db_type, cursor, match_query):
+    """هل يوجد أي نتيجة في الفهرس؟ (لو لا، نرجع لبحث LIKE بالأجزاء من النص)"""
+    if db_type == 'postgresql':
+        cursor.execute("SELECT 1 FROM product_search WHERE search_vector @@ to_tsquery('simple', ?) LIMIT 1",
+                       (match_query,))
+    else:
+        cursor.execute('SELECT 1 FROM product_search WHERE product_search MATCH ? LIMIT 1', (match_query,))
+    return cursor.fetchone() is not None
+
+
+def search_index_exists(db_type, cursor):
+    if db_type == 'postgresql':
+        cursor.execute("SELECT to_regclass('product_search')")
+        row = cursor.fetchone()
+        value = next(iter(row.values())) if isinstance(row, dict) else row[0]
+        return value is not None
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'product_search'")
+    return cursor.fetchone() is not None
@@ -0,0 +1,171 @@
+"""كاتب واحد (single writer) لقاعدة SQLite مع قراءات متوازية بـ WAL
+
+SQLite يسمح بكاتب واحد فقط في نفس الوقت. بدل أن تتنافس الـ threads على
+الـ lock (مع timeout 30 ثانية) يتم وضع كل transaction كتابة في طابور،
+وthread واحد مخصص ينفذها بالترتيب بـ BEGIN IMMEDIATE على اتصال واحد.
+القراءات تستخدم اتصالات الـ pool العادية ولا تنتظر الكاتب بفضل WAL.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# تُطبق مرة واحدة عند فتح كل اتصال
+SQLITE_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),   # آمن مع WAL ويوفر fsync مع كل commit
+    ('cache_size', -20000),      # ~20MB لكل اتصال (القيمة السالبة بالـ KB)
+    ('mmap_size', 268435456),    # 256MB
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 30000),
+]
+
+
+def apply_sqlite_pragmas(conn, pragmas=SQLITE_PRAGMAS):
+    for name, value in pragmas:
+        conn.execute(f'PRAGMA {name} = {value}')
+
+
+class _WriteJob:
+    __slots__ = ('fn', 'future', 'enqueued_at')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+_STOP = object()
+
+
+class SQLiteWriteQueue:
+    """طابور transactions الكتابة - thread واحد واتصال واحد ينفذها بالترتيب
+
+    fn(conn) تنفذ الكتابات فقط: الـ commit/rollback مسؤولية الطابور،
+    ولا يتم إغلاق الاتصال.
+    """
+
+    def __init__(self, connect, name='sqlite-writer'):
+        self._connect = connect
+        self.name = name
+        self._queue = queue.Queue()
+        self._conn = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'completed': 0,
+            'failed': 0,
+            'max_queue_depth': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'total_exec_ms': 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, fn):
+        """إضافة transaction للطابور - يرجع Future بنتيجة fn"""
+        job = _WriteJob(fn)
+        self._ensure_started()
+        self._queue.put(job)
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+        return job.future
+
+    def run(self, fn, timeout=None):
+        """تنفيذ fn في transaction كتابة وانتظار النتيجة
+
+        الاستدعاء من داخل transaction للكاتب نفسه ينفذ fn مباشرة ضمن نفس
+        الـ transaction (بدل انتظار الطابور للأبد).
+        """
+        if threading.current_thread() is self._thread:
+            return fn(self._conn)
+        return self.submit(fn).result(timeout)
+
+    def _open(self):
+        conn = self._connect()
+        # إدارة الـ transactions يدوياً بدل الـ BEGIN الضمني في sqlite3
+        conn.isolation_level = None
+        return conn
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                break
+            if not job.future.set_running_or_notify_cancel():
+                continue
+
+            started = time.monotonic()
+            wait_ms = (started - job.enqueued_at) * 1000
+            try:
+                if self._conn is None:
+                    self._conn = self._open()
+                self._conn.execute('BEGIN IMMEDIATE')
+                result = job.fn(self._conn)
+                if self._conn.in_transaction:
+                    self._conn.execute('COMMIT')
+            except BaseException as e:
+                self._rollback()
+                self._record(wait_ms, started, failed=True)
+                job.future.set_exception(e)
+            else:
+                self._record(wait_ms, started, failed=False)
+                job.future.set_result(result)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _rollback(self):
+        """إلغاء الـ transaction الفاشل - لو فشل الـ ROLLBACK نفسه يُغلق الاتصال
+
+        الـ thread لا يموت أبداً هنا، وإلا تبقى الـ futures بدون نتيجة وكل
+        run() بعدها ينتظر للأبد. الـ job التالي يفتح اتصالاً جديداً.
+        """
+        if self._conn is None:
+            return
+        try:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+        except Exception as e:
+            print(f"⚠️ فشل ROLLBACK في كاتب SQLite - إعادة فتح الاتصال: {e}")
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _record(self, wait_ms, started, failed):
+        with self._stats_lock:
+            self._stats['failed' if failed else 'completed'] += 1
+            self._stats['total_wait_ms'] += wait_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+            self._stats['total_exec_ms'] += (time.monotonic() - started) * 1000
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+        jobs = data['completed'] + data['failed']
+        data['queue_depth'] = self._queue.qsize()
+        data['avg_wait_ms'] = round(data['total_wait_ms'] / jobs, 2) if jobs else 0.0
+        data['avg_exec_ms'] = round(data['total_exec_ms'] / jobs, 2) if jobs else 0.0
+        data['total_wait_ms'] = round(data['total_wait_ms'], 2)
+        data['max_wait_ms'] = round(data['max_wait_ms'], 2)
+        data['total_exec_ms'] = round(data['total_exec_ms'], 2)
+        data['writer_alive'] = self._thread is not None and self._thread.is_alive()
+        return data
+
+    def close(self, timeout=None):
+        """إيقاف الكاتب بعد تنفيذ ما في الطابور"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
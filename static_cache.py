@@ -0,0 +1,89 @@
+"""Cache طويل في المتصفح للصور والملفات الثابتة
+
+الروابط التي لا يتغير محتواها أبداً تُرسل بـ
+    Cache-Control: public, max-age=<سنة>, immutable
+فالزيارة المتكررة لصفحات المخزون والمنتج لا تطلب الصور إطلاقاً:
+- صور المخزن /static/uploads/blobs/... اسمها SHA-256 للمحتوى (image_store.py)
+  ونسخها المصغرة مشتقة منها
+- باقي الملفات الثابتة (style.css ...) يضيف لها url_for('static', ...)
+  ?v=<hash> للمحتوى، فأي تعديل على الملف يغير الرابط (و ?v= لا يطابق
+  المحتوى الحالي يأخذ الإعداد العادي)
+
+الملفات الأخرى (مثل صور قديمة بأسماء ثابتة لم تُنقل للمخزن) تبقى بإعداد
+Flask الافتراضي: no-cache مع ETag و Last-Modified، فالزيارة المتكررة ترجع
+304 بدون bytes.
+"""
+import hashlib
+import os
+import threading
+
+from flask import request
+from werkzeug.security import safe_join
+
+from image_store import BLOB_URL_PREFIX
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+VERSION_ARG = 'v'
+FINGERPRINT_LENGTH = 12
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprint(path):
+    """hash قصير لمحتوى الملف - محفوظ في الذاكرة حتى يتغير mtime أو الحجم"""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _fingerprints_lock:
+        cached = _fingerprints.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()[:FINGERPRINT_LENGTH]
+    with _fingerprints_lock:
+        _fingerprints[path] = (key, value)
+    return value
+
+
+def is_immutable_request(static_folder):
+    """روابط المخزن، أو ?v= يطابق hash المحتوى الحالي للملف
+
+    ?v= قديم (صفحة من cache) أو مكتوب يدوياً لا يثبت المحتوى الحالي لسنة.
+    """
+    if request.path.startswith(BLOB_URL_PREFIX):
+        return True
+    version = request.args.get(VERSION_ARG)
+    if not version:
+        return False
+    path = safe_join(static_folder, (request.view_args or {}).get('filename', ''))
+    return path is not None and os.path.isfile(path) and version == fingerprint(path)
+
+
+def init_static_cache(app):
+    """تسجيل إضافة ?v= لروابط static وheaders الـ cache في الـ responses"""
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint != 'static' or VERSION_ARG in values or 'filename' not in values:
+            return
+        path = os.path.join(app.static_folder, values['filename'])
+        if os.path.isfile(path):
+            values[VERSION_ARG] = fingerprint(path)
+
+    @app.after_request
+    def cache_static_responses(response):
+        # 304 من send_file (ETag/Last-Modified) يأخذ نفس الـ headers
+        if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+            return response
+        if is_immutable_request(app.static_folder):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    return app
@@ -0,0 +1,90 @@
+"""استرجاع نسخة full ثم delta بالـ bulk loader
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup_restore import backup_file_events, bulk_restore
+from database import StockDatabase
+from dropbox_oauth_backup import DropboxOAuthBackup
+
+IMAGE_HASH = 'a' * 64
+OTHER_HASH = 'b' * 64
+
+
+@pytest.fixture(autouse=True)
+def sqlite_only(monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    for name in ('DROPBOX_APP_KEY', 'DROPBOX_APP_SECRET', 'DROPBOX_REFRESH_TOKEN'):
+        monkeypatch.delenv(name, raising=False)
+
+
+def execute(db, sql, params=()):
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.lastrowid
+    return db.run_write(write)
+
+
+def ref_counts(db):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT sha256, ref_count FROM image_blobs ORDER BY sha256')
+        return dict(cursor.fetchall())
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def backups(tmp_path):
+    """(مسار النسخة full، مسار الـ delta) - الـ delta تعدل صور نفس الصفوف"""
+    source = StockDatabase(str(tmp_path / 'source.db'))
+    source.add_default_data()
+    product_id = execute(source, '''
+        INSERT INTO base_products (product_code, brand_id, product_type_id, trader_category, supplier_id)
+        VALUES ('P1', 1, 1, 'L', 1)
+    ''')
+    variant_ids = [execute(source, 'INSERT INTO product_variants (base_product_id, color_id) VALUES (?, ?)',
+                           (product_id, color_id)) for color_id in (1, 2)]
+    for variant_id in variant_ids:
+        execute(source, 'INSERT INTO color_images (variant_id, image_url, image_hash) VALUES (?, ?, ?)',
+                (variant_id, f'/static/uploads/blobs/{IMAGE_HASH}.jpg', IMAGE_HASH))
+
+    backup = DropboxOAuthBackup(source)
+    full_path = str(tmp_path / 'full')
+    suffix, change_seq = backup.export_full_backup(full_path)
+    full_name = f'full{suffix}'
+
+    # صورة الأول تتغير والثاني يعاد حفظه بنفس الصورة
+    execute(source, 'UPDATE color_images SET image_hash = ? WHERE variant_id = ?', (OTHER_HASH, variant_ids[0]))
+    execute(source, 'UPDATE color_images SET image_url = image_url WHERE variant_id = ?', (variant_ids[1],))
+    delta_path = str(tmp_path / 'delta')
+    with open(delta_path, 'wb') as f:
+        assert backup.write_delta_backup(f, {'last_seq': change_seq, 'base_backup': full_name})
+    return (full_path, full_name), (delta_path, 'delta.ndjson.gz')
+
+
+def restore(db, *files):
+    bulk_restore(db, itertools.chain.from_iterable(backup_file_events(path, name) for path, name in files))
+
+
+def test_full_and_delta_restore_keeps_ref_counts(tmp_path, backups):
+    target = StockDatabase(str(tmp_path / 'target.db'))
+    restore(target, *backups)
+    assert ref_counts(target) == {IMAGE_HASH: 1, OTHER_HASH: 1}
+
+
+def test_repeated_restore_does_not_inflate_ref_counts(tmp_path, backups):
+    target = StockDatabase(str(tmp_path / 'target.db'))
+    for _ in range(3):
+        restore(target, *backups)
+    assert ref_counts(target) == {IMAGE_HASH: 1, OTHER_HASH: 1}
@@ -0,0 +1,102 @@
+"""ضغط الـ responses والملفات المضغوطة مسبقاً و headers الـ cache للملفات الثابتة
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import gzip
+import os
+import sys
+
+import pytest
+from flask import Flask, url_for
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import init_compression
+from static_cache import IMMUTABLE_MAX_AGE, fingerprint, init_static_cache
+
+PAGE = 'مخزون ' * 1000
+
+
+@pytest.fixture
+def app(tmp_path):
+    static = tmp_path / 'static'
+    static.mkdir()
+    (static / 'style.css').write_text('body { color: red; }\n' * 200)
+
+    app = Flask(__name__, static_folder=str(static))
+
+    @app.route('/page')
+    def page():
+        return PAGE
+
+    @app.route('/tiny')
+    def tiny():
+        return 'ok'
+
+    init_compression(app)
+    init_static_cache(app)
+    return app
+
+
+def test_large_html_is_gzipped(app):
+    response = app.test_client().get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data).decode('utf-8') == PAGE
+
+
+def test_small_or_unaccepted_responses_are_not_compressed(app):
+    client = app.test_client()
+    tiny = client.get('/tiny', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in tiny.headers
+    assert tiny.data == b'ok'
+
+    plain = client.get('/page', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+
+def test_precompressed_static_file_is_served(app):
+    path = os.path.join(app.static_folder, 'style.css')
+    with open(path, 'rb') as f:
+        original = f.read()
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(original))
+
+    response = app.test_client().get('/static/style.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.get_data()) == original
+
+
+def test_stale_precompressed_file_is_ignored(app):
+    path = os.path.join(app.static_folder, 'style.css')
+    with open(path, 'rb') as f:
+        original = f.read()
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(b'old'))
+    modified = os.path.getmtime(path + '.gz') + 10
+    os.utime(path, (modified, modified))
+
+    response = app.test_client().get('/static/style.css', headers={'Accept-Encoding': 'gzip'})
+    # الملف اتعدل بعد الـ build - يُرسل الأصل كما هو (send_file لا يُضغط أثناء الطلب)
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data() == original
+
+
+def test_fingerprinted_static_url_is_immutable(app):
+    with app.test_request_context():
+        url = url_for('static', filename='style.css')
+    assert url.endswith('?v=' + fingerprint(os.path.join(app.static_folder, 'style.css')))
+
+    client = app.test_client()
+    response = client.get(url)
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == IMMUTABLE_MAX_AGE
+    assert response.cache_control.public
+
+    # ?v= لا يطابق المحتوى الحالي يأخذ إعداد Flask العادي
+    stale = client.get('/static/style.css?v=000000000000')
+    assert not stale.cache_control.immutable
+    assert stale.cache_control.max_age != IMMUTABLE_MAX_AGE
@@ -0,0 +1,113 @@
+"""اختبارات الـ connection pool: context manager، إعادة الاستخدام، والتخلص من الاتصالات
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection_pool import PoolTimeoutError, PostgresConnectionPool, SQLiteConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / 'pool.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (name TEXT)')
+    conn.close()
+    pool = SQLiteConnectionPool(lambda: sqlite3.connect(path))
+    yield pool
+    pool.close_all()
+
+
+def count_items(pool):
+    conn = pool.get_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def is_closed(raw):
+    try:
+        raw.execute('SELECT 1')
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def test_with_block_commits(pool):
+    conn = pool.get_connection()
+    with conn:
+        conn.execute("INSERT INTO items VALUES ('a')")
+    conn.close()
+    assert count_items(pool) == 1
+
+
+def test_with_block_rolls_back_on_error(pool):
+    conn = pool.get_connection()
+    with pytest.raises(ValueError):
+        with conn:
+            conn.execute("INSERT INTO items VALUES ('a')")
+            raise ValueError('boom')
+    conn.close()
+    assert count_items(pool) == 0
+
+
+def test_released_connection_is_reused_without_open_transaction(pool):
+    conn = pool.get_connection()
+    raw = conn.raw
+    conn.execute("INSERT INTO items VALUES ('a')")
+    conn.close()
+
+    again = pool.get_connection()
+    assert again.raw is raw
+    assert not again.in_transaction
+    again.close()
+    assert count_items(pool) == 0
+    assert pool.stats()['reused'] == 2
+
+
+def test_unclosed_connection_is_discarded_and_closed(pool):
+    conn = pool.get_connection()
+    raw = conn.raw
+    del conn
+
+    stats = pool.stats()
+    assert stats['discarded'] == 1
+    assert stats['in_use'] == 0
+    assert is_closed(raw)
+
+
+def test_discard_from_other_thread_closes_on_owner_thread(pool):
+    conn = pool.get_connection()
+    raw = conn.raw
+    worker = threading.Thread(target=pool.discard, args=(raw,))
+    worker.start()
+    worker.join()
+    conn._released = True
+
+    assert not is_closed(raw)
+    pool.get_connection().close()
+    assert is_closed(raw)
+
+
+def test_postgres_pool_times_out_when_exhausted(tmp_path):
+    path = str(tmp_path / 'pg.db')
+    pool = PostgresConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False),
+                                  max_size=1, timeout=0.05)
+    conn = pool.get_connection()
+    with pytest.raises(PoolTimeoutError):
+        pool.get_connection()
+
+    conn.close()
+    again = pool.get_connection()
+    assert again.raw is conn.raw
+    again.close()
+    pool.close_all()
@@ -0,0 +1,50 @@
+"""إحصائيات الـ Dashboard المخزنة في صف dashboard_stats
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import StockDatabase
+
+
+def stats_row(db):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT version, computed_version, brands_count FROM dashboard_stats')
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def test_stats_follow_writes(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+
+    brands = db.get_dashboard_stats()['brands_count']
+    assert brands == len(db.get_all_brands())
+
+    db.add_brand('Prada')
+    assert db.get_dashboard_stats()['brands_count'] == brands + 1
+
+
+def test_missing_stats_row_is_recomputed_and_recreated(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    db.run_write(lambda conn: conn.execute('DELETE FROM dashboard_stats'))
+
+    stats = db.get_dashboard_stats()
+    assert stats['brands_count'] == len(db.get_all_brands())
+
+    # الحفظ يمر بطابور الكاتب - مهمة فارغة بعده تضمن انتهاءه
+    db.run_write(lambda conn: None)
+    rows = stats_row(db)
+    assert len(rows) == 1
+    assert rows[0][0] == rows[0][1]
+    assert rows[0][2] == stats['brands_count']
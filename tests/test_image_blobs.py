@@ -0,0 +1,78 @@
+"""image_blobs.ref_count يتبع color_images عبر الـ triggers (إضافة/تعديل/حذف)
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import StockDatabase
+from image_store import blob_url, recount
+
+HASH_A = 'a' * 64
+HASH_B = 'b' * 64
+
+
+def ref_counts(db):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT sha256, ref_count FROM image_blobs')
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def variant_ids(db, product_id):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM product_variants WHERE base_product_id = ? ORDER BY id', (product_id,))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_ref_count_follows_color_images(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.chdir(tmp_path)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    colors = [color[0] for color in db.get_all_colors()[:2]]
+    ok, product_id = db.add_base_product_with_variants('A1', 1, 1, 'L', '', 10, 20, colors)
+    assert ok
+    first, second = variant_ids(db, product_id)
+
+    # نفس الصورة للونين: blob واحد مستخدم مرتين
+    assert db.add_color_image(first, blob_url(HASH_A, '.jpg'))
+    assert db.add_color_image(second, blob_url(HASH_A, '.jpg'))
+    assert ref_counts(db) == {HASH_A: 2}
+
+    # تغيير صورة لون (upsert) ينقل المرجع للـ blob الجديد
+    assert db.add_color_image(second, blob_url(HASH_B, '.png'))
+    assert ref_counts(db) == {HASH_A: 1, HASH_B: 1}
+
+    # حفظ نفس الصورة مرة ثانية لا يزيد العدد
+    assert db.add_color_image(first, blob_url(HASH_A, '.jpg'))
+    assert ref_counts(db) == {HASH_A: 1, HASH_B: 1}
+
+    ok, _ = db.delete_product(product_id)
+    assert ok
+    assert ref_counts(db) == {HASH_A: 0, HASH_B: 0}
+
+
+def test_recount_repairs_counts(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.chdir(tmp_path)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    ok, product_id = db.add_base_product_with_variants('A1', 1, 1, 'L', '', 10, 20, [1])
+    assert ok
+    assert db.add_color_image(variant_ids(db, product_id)[0], blob_url(HASH_A, '.jpg'))
+
+    # تعديل SQL مباشر بدون triggers (مثل restore قديم)
+    db.run_write(lambda conn: conn.execute('UPDATE image_blobs SET ref_count = 5'))
+    recount(db)
+    assert ref_counts(db) == {HASH_A: 1}
@@ -0,0 +1,118 @@
+"""مهام الاستيراد: claim و checkpoint واستكمال المهام المتوقفة
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_jobs
+from database import StockDatabase
+from import_jobs import BOOT_ID, ImportJobManager
+
+
+def _timestamp(seconds_ago):
+    return (datetime.now() - timedelta(seconds=seconds_ago)).isoformat(sep=' ', timespec='seconds')
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    return db
+
+
+@pytest.fixture
+def manager(db, tmp_path):
+    # بدون workers: المهام تبقى في الطابور والاختبار ينفذها بنفسه
+    manager = ImportJobManager(db, workers=0, chunk_size=2, jobs_dir=str(tmp_path / 'jobs'))
+    yield manager
+    manager.stop()
+
+
+def add_job(db, job_id, status='queued', owner=None, heartbeat_ago=None, rows_processed=0, file_path=None):
+    db.run_write(lambda conn: conn.cursor().execute('''
+        INSERT INTO import_jobs (id, status, filename, file_path, rows_processed, created_at, heartbeat_at, owner)
+        VALUES (?, ?, 'sheet.xlsx', ?, ?, ?, ?, ?)
+    ''', (job_id, status, file_path, rows_processed, _timestamp(0),
+          None if heartbeat_ago is None else _timestamp(heartbeat_ago), owner)))
+
+
+def test_claim_is_exclusive(db, manager):
+    add_job(db, 'job1')
+    assert manager._claim('job1')
+    assert not manager._claim('job1')
+    job = manager.get_job('job1')
+    assert job['status'] == 'running' and job['owner'] == BOOT_ID
+
+
+def test_claim_takes_over_only_stale_jobs_of_other_processes(db, manager):
+    stale = import_jobs.STALE_AFTER + 60
+    add_job(db, 'crashed', 'running', owner='old-boot', heartbeat_ago=stale)
+    add_job(db, 'alive', 'running', owner='other-boot', heartbeat_ago=5)
+    add_job(db, 'finished', 'completed', owner='old-boot', heartbeat_ago=stale)
+    assert manager._claim('crashed')
+    assert not manager._claim('alive')
+    assert not manager._claim('finished')
+
+
+def test_checkpoint_accumulates_counts_and_caps_failures(db, manager, monkeypatch):
+    monkeypatch.setattr(import_jobs, 'MAX_STORED_FAILURES', 3)
+    add_job(db, 'job1')
+    manager._claim('job1')
+    manager._checkpoint('job1', 2, 1, [{'row': 2, 'error': 'a'}])
+    manager._checkpoint('job1', 4, 0, [{'row': 3, 'error': 'b'}, {'row': 4, 'error': 'c'}, {'row': 5, 'error': 'd'}])
+    status = manager.job_status('job1')
+    assert status['rows_processed'] == 4
+    assert status['success_count'] == 1
+    assert status['failed_count'] == 4
+    assert [failure['row'] for failure in status['failures']] == [2, 3, 4]
+
+
+def test_resume_pending_requeues_interrupted_jobs(db, manager):
+    stale = import_jobs.STALE_AFTER + 60
+    add_job(db, 'queued')
+    add_job(db, 'crashed', 'running', owner='old-boot', heartbeat_ago=stale)
+    add_job(db, 'alive', 'running', owner='other-boot', heartbeat_ago=5)
+    add_job(db, 'mine', 'running', owner=BOOT_ID, heartbeat_ago=stale)
+    assert manager.resume_pending() == ['queued', 'crashed']
+    # الفحص الدوري لا يعيد المهام queued (موجودة في طابور process حي)
+    assert manager.resume_pending(include_queued=False) == ['crashed']
+
+
+def test_heartbeat_keeps_own_jobs_fresh(db, manager):
+    add_job(db, 'mine', 'running', owner=BOOT_ID, heartbeat_ago=import_jobs.STALE_AFTER + 60)
+    manager.touch_running()
+    assert manager.resume_pending() == []
+
+
+def test_run_job_resumes_from_checkpoint(db, manager, tmp_path):
+    from openpyxl import Workbook
+
+    path = str(tmp_path / 'sheet.xlsx')
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['Product Code', 'Brand Name', 'Product Type', 'Category', 'Size',
+                  'Wholesale Price', 'Retail Price', 'Color Name', 'Stock', 'Image URL', 'Tags'])
+    for index in range(5):
+        sheet.append([f'R{index}', 'Gucci', 'Handbag', 'L', '', 100, 150, 'Black', 3, '', ''])
+    workbook.save(path)
+
+    # أول صفين تم استيرادهما قبل توقف الـ process
+    add_job(db, 'job1', 'running', owner='old-boot', heartbeat_ago=import_jobs.STALE_AFTER + 60,
+            rows_processed=2, file_path=path)
+    manager.run_job('job1')
+
+    status = manager.job_status('job1')
+    assert status['status'] == 'completed'
+    assert status['rows_processed'] == 5
+    conn = db.get_connection()
+    codes = [row[0] for row in conn.execute('SELECT product_code FROM base_products ORDER BY product_code')]
+    conn.close()
+    assert codes == ['R2', 'R3', 'R4']
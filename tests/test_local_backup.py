@@ -0,0 +1,75 @@
+"""النسخ المحلية بدون Dropbox تحذف التغييرات المنسوخة من change_log
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from change_log import get_state, pending_changes
+from database import StockDatabase
+from dropbox_oauth_backup import DropboxOAuthBackup
+
+
+def pending(db):
+    conn = db.get_connection()
+    try:
+        return pending_changes(conn.cursor(), 0)
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def backup(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    for name in ('DROPBOX_APP_KEY', 'DROPBOX_APP_SECRET', 'DROPBOX_REFRESH_TOKEN'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.chdir(tmp_path)
+
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    return DropboxOAuthBackup(db)
+
+
+def local_backups(path):
+    return sorted(name for name in os.listdir(path) if name.startswith('local_backup_'))
+
+
+def test_local_backup_prunes_change_log(tmp_path, backup):
+    db = backup.db
+    assert pending(db) > 0
+
+    assert backup.create_backup()
+    assert pending(db) == 0
+    assert local_backups(tmp_path)
+    # السلسلة في Dropbox انقطعت: النسخة المرفوعة التالية full
+    assert backup._needs_full_backup(get_state(db))
+
+
+def test_unchanged_database_skips_local_backup(tmp_path, backup):
+    assert backup.create_backup()
+    first = local_backups(tmp_path)
+    for name in first:
+        os.rename(tmp_path / name, tmp_path / name.replace('local_backup_', 'local_backup_0'))
+
+    assert backup.create_backup()
+    assert len(local_backups(tmp_path)) == 1
+
+    backup.db.add_brand('Prada')
+    assert backup.create_backup()
+    assert len(local_backups(tmp_path)) == 2
+
+
+def test_local_backups_are_pruned_to_max_backups(tmp_path, backup):
+    backup.max_backups = 3
+    for day in range(1, 6):
+        (tmp_path / f'local_backup_2020010{day}_000000.sqlite.gz').write_bytes(b'old')
+
+    assert backup.create_backup()
+    kept = local_backups(tmp_path)
+    assert len(kept) == 3
+    assert kept[:2] == ['local_backup_20200104_000000.sqlite.gz', 'local_backup_20200105_000000.sqlite.gz']
@@ -0,0 +1,39 @@
+"""الـ migrations المطبقة لا يتغير الـ SQL الخاص بها
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+from database import StockDatabase
+
+
+def search_triggers(cursor):
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'product_search_%'")
+    return dict(cursor.fetchall())
+
+
+def test_search_index_migrations_are_separate(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    fresh = search_triggers(cursor)
+
+    # migration 3 بـ SQL الأصلي (بدون search_index_state)
+    migrations._create_search_index(db, cursor)
+    assert not any('search_index_state' in sql for sql in search_triggers(cursor).values())
+
+    # migration 6 يعيد إنشاء الـ triggers فقط
+    migrations._make_search_triggers_deferrable(db, cursor)
+    assert search_triggers(cursor) == fresh
+    conn.rollback()
+    conn.close()
+
+    registered = {version: migrate for version, _, migrate in migrations.MIGRATIONS}
+    assert registered[3] is migrations._create_search_index
+    assert registered[6] is migrations._make_search_triggers_deferrable
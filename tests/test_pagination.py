@@ -0,0 +1,71 @@
+"""Keyset pagination: الـ cursor، وصفحات المنتجات عند تساوي مفاتيح الترتيب
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import StockDatabase
+from pagination import (MAX_PAGE_SIZE, decode_cursor, encode_cursor, keyset_condition,
+                        parse_page_size)
+
+
+def test_cursor_round_trip():
+    token = encode_cursor('after', [2, '2024-01-01 10:00:00', 17])
+    assert '=' not in token
+    assert decode_cursor(token) == ('after', [2, '2024-01-01 10:00:00', 17])
+
+
+def test_invalid_cursor_starts_from_first_page():
+    assert decode_cursor(None) == (None, None)
+    assert decode_cursor('not-a-cursor!') == (None, None)
+    assert decode_cursor(encode_cursor('sideways', [1])) == (None, None)
+
+
+def test_parse_page_size_is_clamped():
+    assert parse_page_size('abc', default=10) == 10
+    assert parse_page_size('0') == 1
+    assert parse_page_size(str(MAX_PAGE_SIZE + 1)) == MAX_PAGE_SIZE
+
+
+def test_keyset_condition_breaks_ties_on_later_columns():
+    sql, params = keyset_condition(['a', 'b'], [5, 9], descending=True)
+    assert sql == '((a < ?) OR (a = ? AND b < ?))'
+    assert params == [5, 5, 9]
+
+    sql, _ = keyset_condition(['a', 'b'], [5, 9], descending=True, before=True)
+    assert sql == '((a > ?) OR (a = ? AND b > ?))'
+    # مفتاح بعدد أعمدة مختلف (cursor قديم) يتم تجاهله
+    assert keyset_condition(['a', 'b'], [5], descending=True) == ('', [])
+
+
+def test_pages_with_equal_created_date_cover_every_product_once(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    for number in range(7):
+        ok, _ = db.add_base_product_with_variants(f'P{number}', 1, 1, 'L', '', 10, 20, [1])
+        assert ok
+
+    def same_created_date(conn):
+        conn.execute("UPDATE base_products SET created_date = '2024-01-01 00:00:00'")
+    db.run_write(same_created_date)
+
+    pages = []
+    page = db.get_products_page(page_size=3)
+    while True:
+        pages.append([product[1] for product in page['items']])
+        if not page['next_cursor']:
+            break
+        page = db.get_products_page(cursor=page['next_cursor'], page_size=3)
+
+    # مع تساوي التاريخ الترتيب بالـ id تنازلياً بدون تكرار أو فقد
+    assert pages == [['P6', 'P5', 'P4'], ['P3', 'P2', 'P1'], ['P0']]
+    assert page['prev_cursor']
+
+    previous = db.get_products_page(cursor=page['prev_cursor'], page_size=3)
+    assert [product[1] for product in previous['items']] == ['P3', 'P2', 'P1']
+    assert previous['next_cursor'] and previous['prev_cursor']
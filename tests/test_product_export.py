@@ -0,0 +1,67 @@
+"""فلاتر تصدير المنتجات (براند، لون، حالة المخزون)
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import StockDatabase
+from product_export import EXPORT_COLUMNS, build_export_query, iter_export_rows
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    brands = db.get_all_brands()
+    colors = db.get_all_colors()
+    # A: براند أول بلونين، B: براند ثاني بلون واحد ومخزون منخفض
+    db.add_base_product_with_variants('A1', brands[0][0], 1, 'L', 'M', 10, 20,
+                                      [colors[0][0], colors[1][0]], initial_stock=10)
+    db.add_base_product_with_variants('B1', brands[1][0], 1, 'L', '', 10, 20,
+                                      [colors[0][0]], initial_stock=3)
+    return db, [brand[1] for brand in brands[:2]], [color[1] for color in colors[:2]]
+
+
+def export(db, **filters):
+    return [(row[0], row[7], row[8]) for row in iter_export_rows(db, filters, batch_size=1)]
+
+
+def test_all_rows_in_import_shape(catalog):
+    db, _, _ = catalog
+    rows = list(iter_export_rows(db, {}))
+    assert len(rows) == 3
+    assert all(len(row) == len(EXPORT_COLUMNS) for row in rows)
+    # الأحدث أولاً، والحجم الفارغ '' كما في التصدير القديم
+    assert rows[0][0] == 'B1' and rows[0][4] == ''
+
+
+def test_list_filters_combine_with_and(catalog):
+    db, brands, colors = catalog
+    assert {code for code, _, _ in export(db, brands=[brands[0]])} == {'A1'}
+    assert export(db, brands=[brands[0]], colors=[colors[1]]) == [('A1', colors[1], 10)]
+    assert len(export(db, colors=colors)) == 3
+    # القيم الفارغة من الـ form لا تصبح شرطاً
+    assert len(export(db, brands=[''], product_codes=[])) == 3
+
+
+def test_stock_filters(catalog):
+    db, _, colors = catalog
+    assert export(db, stock_filter='low_stock') == [('B1', colors[0], 3)]
+    assert len(export(db, stock_filter='in_stock')) == 3
+    assert export(db, stock_filter='out_of_stock') == []
+    assert len(export(db, stock_filter='all')) == 3
+
+
+def test_filter_values_are_parameters(catalog):
+    db, _, _ = catalog
+    sql, params = build_export_query('sqlite', {'product_codes': ["A1' OR '1'='1"]})
+    assert "A1'" not in sql
+    assert params == ["A1' OR '1'='1"]
+    assert export(db, product_codes=params) == []
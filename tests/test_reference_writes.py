@@ -0,0 +1,47 @@
+"""الكتابة على الجداول المرجعية تمر عبر الكاتب الواحد وتحدّث الـ cache
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import StockDatabase
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    return db
+
+
+def completed_writes(db):
+    return db.get_writer_stats()['completed']
+
+
+def test_reference_writes_use_the_writer(db):
+    before = completed_writes(db)
+    assert db.add_brand('Prada')
+    assert not db.add_brand('Prada')  # اسم مكرر
+    brand_id = next(brand[0] for brand in db.get_all_brands() if brand[1] == 'Prada')
+    assert db.update_brand(brand_id, 'Prada Milano')
+    assert db.get_brand_by_id(brand_id)[1] == 'Prada Milano'
+    assert db.delete_brand(brand_id) == (True, 'Brand deleted successfully')
+    assert db.get_brand_by_id(brand_id) is None
+    assert completed_writes(db) - before == 3
+
+
+def test_delete_in_use_reference_is_refused(db):
+    ok, product_id = db.add_base_product_with_variants('P1', 1, 1, 'L', '', 10, 20, [1], [1])
+    assert ok
+    assert db.delete_color(1) == (False, "Cannot delete color - it's used by existing products")
+    assert db.delete_tag(1)[0] is False
+    assert db.add_product_tags(product_id, [2, 3])
+    assert db.delete_tag(1) == (True, 'Tag deleted successfully')
+    assert db.add_color_image(1, '/static/uploads/blobs/aa/' + 'a' * 64 + '.jpg')
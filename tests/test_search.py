@@ -0,0 +1,26 @@
+"""البحث بالفهرس النصي لا يفقد نتائج بحث LIKE القديم لأكواد المنتجات
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import StockDatabase
+
+
+def test_code_substring_found_alongside_prefix_matches(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = StockDatabase(str(tmp_path / 'stock.db'))
+    db.add_default_data()
+    assert db.search_index_available
+    for code in ('010B', 'A010', 'B777'):
+        ok, _ = db.add_base_product_with_variants(code, 1, 1, 'L', '', 10, 20, [1])
+        assert ok
+
+    assert db._search_match_query('010')
+    codes = [product[1] for product in db.get_products_with_color_images('010')]
+    # كود يبدأ بالنص أولاً ثم الكود الذي يحتويه
+    assert codes == ['010B', 'A010']
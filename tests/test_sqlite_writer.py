@@ -0,0 +1,35 @@
+"""طابور الكاتب يبقى يعمل حتى لو فشل الـ ROLLBACK
+
+التشغيل من جذر المشروع:
+    python -m pytest -q tests
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_writer import SQLiteWriteQueue
+
+
+def test_writer_survives_failed_rollback(tmp_path):
+    path = str(tmp_path / 'writer.db')
+    writer = SQLiteWriteQueue(lambda: sqlite3.connect(path))
+    writer.run(lambda conn: conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)'))
+
+    def break_connection(conn):
+        conn.execute("INSERT INTO items (name) VALUES ('lost')")
+        # الاتصال غير صالح: الـ ROLLBACK نفسه يفشل
+        conn.close()
+        raise RuntimeError('job failed')
+
+    with pytest.raises(RuntimeError):
+        writer.run(break_connection, timeout=5)
+
+    writer.run(lambda conn: conn.execute("INSERT INTO items (name) VALUES ('kept')"), timeout=5)
+    names = writer.run(lambda conn: [row[0] for row in conn.execute('SELECT name FROM items')], timeout=5)
+    assert names == ['kept']
+    assert writer.stats()['writer_alive']
+    writer.close(timeout=5)